@@ -1,12 +1,18 @@
 import os
-from typing import List, Dict, Any
+import threading
+import time
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from datetime import datetime
 import json
 from collections import defaultdict
 from dotenv import load_dotenv
-from transformers import pipeline, AutoModelForCausalLM, AutoTokenizer
-import torch
 import logging
+from batching import BatchScheduler
+from model_backends import load_causal_lm
+from model_workers import ModelWorkerPool, WorkerPoolSaturated, WorkerTimeout
+from prompt_builder import build_analysis_prompt
+import insights
+import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -15,98 +21,425 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+DEFAULT_MODEL_NAME = "microsoft/DialoGPT-medium"
+
+MODEL_LOAD_SECONDS = metrics.gauge(
+    'ai_model_load_seconds', 'Seconds taken to load the model (or the first model worker)')
+GENERATED_TOKENS = metrics.counter(
+    'ai_generated_tokens_total', 'Tokens generated by the model', ['mode'])
+GENERATION_SECONDS = metrics.histogram(
+    'ai_generation_seconds', 'Wall time of generate (batch) and stream calls', ['mode'],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+TOKENS_PER_SECOND = metrics.gauge(
+    'ai_tokens_per_second', 'Generation throughput of the most recent call', ['mode'])
+
 class AIRecommendationService:
-    def __init__(self):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        logger.info(f"Using device: {self.device}")
-        self.model_name = "microsoft/DialoGPT-medium"
+    """
+    Wraps the local causal language model.
+
+    The model is not loaded on construction: call start_loading() to load it on a
+    background thread, or wait_until_ready() to block (with a timeout) until it is
+    available. `status` is one of 'idle', 'loading', 'ready' or 'error'.
+
+    With `workers` > 0 the model is not loaded in this process at all: it runs
+    in a ModelWorkerPool of that many processes and generation is delegated to
+    them (see model_workers).
+    """
+
+    def __init__(self, model_name: Optional[str] = None, batch_max_size: int = 8,
+                 batch_wait: float = 0.02, backend: str = 'fp32', workers: int = 0,
+                 worker_queue_depth: int = 16, worker_timeout: float = 120,
+                 worker_start_method: str = 'spawn'):
+        self.model_name = model_name or DEFAULT_MODEL_NAME
+        # Inference backend from model_backends: 'fp32', 'int8' or 'onnx'
+        self.backend = backend
+        self.load_time = None
+        self.device = None
         self.model = None
         self.tokenizer = None
-        self.load_model()
-    
+        # Model config, for the context window when the model lives in worker processes
+        self.model_config = None
+        self.status = 'idle'
+        self.load_error = None
+        self._ready = threading.Event()
+        self._load_lock = threading.Lock()
+        self._loader = None
+        # All generate calls go through one scheduler thread, which merges
+        # prompts that arrive within `batch_wait` seconds into a single batch
+        self.scheduler = BatchScheduler(self._generate_batch, batch_max_size, batch_wait)
+        self.pool = None
+        if workers > 0:
+            self.pool = ModelWorkerPool(
+                workers,
+                {'model_name': self.model_name, 'batch_max_size': batch_max_size,
+                 'batch_wait': batch_wait, 'backend': backend},
+                max_pending=worker_queue_depth,
+                timeout=worker_timeout,
+                start_method=worker_start_method
+            )
+
+    def start_loading(self):
+        """Start loading the model on a background thread if it is not loaded yet"""
+        with self._load_lock:
+            if self.status in ('loading', 'ready'):
+                return
+            self.status = 'loading'
+            self.load_error = None
+            self._ready.clear()
+            self._loader = threading.Thread(target=self.load_model, name='ai-model-loader', daemon=True)
+            self._loader.start()
+
+    def is_saturated(self) -> bool:
+        """True when the worker pool cannot take more jobs right now"""
+        return self.pool is not None and self.pool.is_saturated()
+
+    def close(self):
+        """Stop the worker processes, if any"""
+        if self.pool is not None:
+            self.pool.close()
+
+    def is_ready(self) -> bool:
+        """Return True once the model and tokenizer are loaded"""
+        return self.status == 'ready'
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Trigger loading if needed and wait up to `timeout` seconds for the model"""
+        if self.status == 'idle':
+            self.start_loading()
+        if self.status == 'loading':
+            self._ready.wait(timeout)
+        return self.is_ready()
+
     def load_model(self):
         """Load the model and tokenizer"""
+        self.status = 'loading'
+        started = time.perf_counter()
         try:
+            if self.pool is not None:
+                from transformers import AutoConfig, AutoTokenizer
+
+                # Prompts are still built (and budgeted) here, which only needs the tokenizer
+                self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                self.model_config = AutoConfig.from_pretrained(self.model_name)
+                # Each worker process loads (and warms up) its own copy of the model
+                self.pool.start()
+                if not self.pool.wait_until_ready():
+                    raise RuntimeError(self.pool.load_error or "No AI worker could load the model")
+                self.load_time = self.pool.load_time
+                MODEL_LOAD_SECONDS.set(self.load_time)
+                logger.info(f"AI worker pool ready in {self.load_time:.1f}s")
+                self.status = 'ready'
+                return
+
+            # Imported here so that importing this module (and the Flask app) stays cheap
+            from transformers import AutoTokenizer
+
             logger.info(f"Loading model: {self.model_name}")
             self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-            self.model = AutoModelForCausalLM.from_pretrained(self.model_name).to(self.device)
-            self.model.eval()
-            logger.info("Model loaded successfully")
+            self.model, self.device = load_causal_lm(self.model_name, self.backend)
+            logger.info(f"Using device: {self.device}")
+            self.load_time = time.perf_counter() - started
+            MODEL_LOAD_SECONDS.set(self.load_time)
+            logger.info(f"Model loaded successfully in {self.load_time:.1f}s")
             
             # Test the model
             test_prompt = "Hello, how are you?"
             test_response = self.generate_text(test_prompt, max_length=50)
             logger.info(f"Test response: {test_response}")
+            self.status = 'ready'
             
         except Exception as e:
             logger.error(f"Error loading model: {e}")
             self.model = None
             self.tokenizer = None
+            self.load_error = str(e)
+            self.status = 'error'
+        finally:
+            self._ready.set()
     
     def generate_text(self, prompt: str, max_length: int = 200) -> str:
         """Generate text using the local model"""
-        if not self.model or not self.tokenizer:
+        return self.generate_many([(prompt, max_length)])[0]
+
+    def generate_many(self, requests: List[Tuple[str, int]]) -> List[str]:
+        """Generate text for several (prompt, max_length) pairs; see generate_counted"""
+        return [text for text, _ in self.generate_counted(requests)]
+
+    def generate_counted(self, requests: List[Tuple[str, int]]) -> List[Tuple[str, int]]:
+        """
+        Generate text for several (prompt, max_length) pairs, returning each
+        text with the number of tokens generated for it.
+
+        The prompts go through the batch scheduler, so they are run together with
+        each other and with any prompts submitted concurrently by other requests.
+        With a worker pool they are sent to the worker processes instead, and
+        WorkerPoolSaturated / WorkerTimeout are raised to the caller.
+        """
+        for prompt, _ in requests:
+            logger.info(f"Generating text for prompt: {prompt[:100]}...")
+        started = time.perf_counter()
+
+        if self.pool is not None:
+            futures = self.pool.submit_many(requests)
+        elif not self.model or not self.tokenizer:
             logger.error("Model or tokenizer not loaded")
-            return "Error: Model not loaded"
-            
+            return [("Error: Model not loaded", 0) for _ in requests]
+        else:
+            futures = [self.scheduler.submit(prompt, max_length) for prompt, max_length in requests]
+
+        responses = []
+        for future in futures:
+            try:
+                response, tokens = future.result()
+                logger.info(f"Generated response: {response[:100]}...")
+                responses.append((response, tokens))
+            except WorkerTimeout:
+                raise
+            except Exception as e:
+                logger.error(f"Error generating text: {e}")
+                responses.append(("Error generating response", 0))
+        self._record_generation('batch', sum(tokens for _, tokens in responses), time.perf_counter() - started)
+        return responses
+
+    @staticmethod
+    def _record_generation(mode: str, tokens: int, elapsed: float):
+        """Update the token throughput metrics for one generate or stream call"""
+        if elapsed <= 0:
+            return
+        GENERATED_TOKENS.inc(tokens, mode=mode)
+        GENERATION_SECONDS.observe(elapsed, mode=mode)
+        TOKENS_PER_SECOND.set(tokens / elapsed, mode=mode)
+
+    def _context_window(self) -> Optional[int]:
+        """Maximum number of positions the loaded model can attend to, if known"""
+        config = self.model.config if self.model is not None else self.model_config
+        if config is None:
+            return None
+        return getattr(config, 'n_positions', None) or getattr(config, 'max_position_embeddings', None)
+
+    def _prompt_budget(self, max_new_tokens: int) -> Optional[int]:
+        """Tokens a prompt may use so that `max_new_tokens` still fit the context window"""
+        context_window = self._context_window()
+        if not context_window:
+            return None
+        return context_window - min(max_new_tokens, context_window // 2)
+
+    def _generation_kwargs(self) -> Dict[str, Any]:
+        """Sampling parameters shared by batched and streamed generation"""
+        # Generate with better parameters for business analysis
+        return {
+            'num_return_sequences': 1,
+            'temperature': 0.7,
+            'top_p': 0.9,
+            'top_k': 50,
+            'do_sample': True,
+            'pad_token_id': self.tokenizer.pad_token_id,
+            'eos_token_id': self.tokenizer.eos_token_id,
+            'repetition_penalty': 1.2,
+            'no_repeat_ngram_size': 2
+        }
+
+    def _prepare_inputs(self, prompts: List[str], max_length: int):
+        """Tokenize prompts (left-padded) and clamp the number of new tokens"""
+        # Decoder-only models continue from the right, so pad on the left
+        self.tokenizer.padding_side = 'left'
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+
+        # Keep prompt + new tokens inside the model's context window, so one
+        # oversized prompt can't fail the whole batch
+        max_new_tokens = max_length
+        tokenizer_args = {}
+        context_window = self._context_window()
+        if context_window:
+            max_new_tokens = min(max_new_tokens, context_window // 2)
+            self.tokenizer.truncation_side = 'left'
+            tokenizer_args = {'truncation': True, 'max_length': context_window - max_new_tokens}
+
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True, **tokenizer_args).to(self.device)
+        return inputs, max_new_tokens
+
+    @staticmethod
+    def _clean_response(response: str) -> str:
+        # Clean up the response
+        response = response.replace("\n\n", "\n").strip()
+        if response.startswith("\n"):
+            response = response[1:]
+        return response
+
+    def _generate_batch(self, prompts: List[str], max_lengths: List[int]) -> List[Tuple[str, int]]:
+        """
+        Run one left-padded, batched generate call; used by the batch scheduler.
+        Returns each prompt's text and its number of generated tokens.
+        """
+        inputs, max_new_tokens = self._prepare_inputs(prompts, max(max_lengths))
+
+        outputs = self.model.generate(
+            input_ids=inputs.input_ids,
+            attention_mask=inputs.attention_mask,
+            max_new_tokens=max_new_tokens,
+            **self._generation_kwargs()
+        )
+
+        prompt_length = inputs.input_ids.shape[1]
+        pad_token_id = self.tokenizer.pad_token_id
+        responses = []
+        for output, max_length in zip(outputs, max_lengths):
+            # Keep only the new tokens, up to this prompt's own length limit
+            new_tokens = output[prompt_length:prompt_length + max_length]
+            response = self.tokenizer.decode(new_tokens, skip_special_tokens=True)
+            # Rows that finished before the longest one are padded to its length
+            tokens = len(new_tokens) if pad_token_id is None else int((new_tokens != pad_token_id).sum())
+            responses.append((self._clean_response(response), tokens))
+        return responses
+
+    def stream_text(self, prompt: str, max_length: int = 200,
+                    usage: Optional[Dict[str, int]] = None) -> Iterator[str]:
+        """
+        Generate text for one prompt, yielding decoded chunks as tokens are produced.
+
+        Generation runs on its own thread (or in a worker process), outside the
+        batch scheduler, so the caller sees the first token as soon as it is sampled.
+        usage['tokens'] is set to the number of tokens generated.
+        """
+        started = time.perf_counter()
+        usage = {} if usage is None else usage
+        if self.pool is not None:
+            source = self.pool.stream(prompt, max_length, usage)
+        else:
+            source = self._stream_local(prompt, max_length, usage)
         try:
-            logger.info(f"Generating text for prompt: {prompt[:100]}...")
-            inputs = self.tokenizer(prompt, return_tensors="pt").to(self.device)
-            
-            # Add padding token if it exists
-            pad_token_id = self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else self.tokenizer.eos_token_id
-            
-            # Generate with better parameters for business analysis
-            outputs = self.model.generate(
-                inputs.input_ids,
-                max_length=len(inputs.input_ids[0]) + max_length,
-                num_return_sequences=1,
-                temperature=0.7,
-                top_p=0.9,
-                top_k=50,
-                do_sample=True,
-                pad_token_id=pad_token_id,
-                eos_token_id=self.tokenizer.eos_token_id,
-                repetition_penalty=1.2,
-                no_repeat_ngram_size=2
-            )
-            
-            response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-            # Remove the prompt from the response
-            response = response[len(prompt):].strip()
-            
-            # Clean up the response
-            response = response.replace("\n\n", "\n").strip()
-            if response.startswith("\n"):
-                response = response[1:]
-            
-            logger.info(f"Generated response: {response[:100]}...")
-            return response
-            
-        except Exception as e:
-            logger.error(f"Error generating text: {e}")
-            return "Error generating response"
+            yield from source
+        finally:
+            # Closing the source stops generation when the consumer goes away
+            source.close()
+            if usage.get('tokens'):
+                self._record_generation('stream', usage['tokens'], time.perf_counter() - started)
+
+    def _stream_local(self, prompt: str, max_length: int, usage: Dict[str, int]) -> Iterator[str]:
+        """stream_text with the model loaded in this process"""
+        if not self.model or not self.tokenizer:
+            raise RuntimeError("Model not loaded")
+
+        import torch
+        from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+        cancelled = threading.Event()
+
+        logger.info(f"Streaming text for prompt: {prompt[:100]}...")
+        inputs, max_new_tokens = self._prepare_inputs([prompt], max_length)
+        prompt_length = inputs.input_ids.shape[1]
+
+        class StopWhenCancelled(StoppingCriteria):
+            # Stops generation once the consumer has gone away (e.g. client disconnect);
+            # called after every step, so it also keeps the count of generated tokens
+            def __call__(self, input_ids, scores, **kwargs):
+                usage['tokens'] = input_ids.shape[1] - prompt_length
+                return torch.full((input_ids.shape[0],), cancelled.is_set(),
+                                  dtype=torch.bool, device=input_ids.device)
+
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        errors = []
+
+        def run():
+            try:
+                self.model.generate(
+                    input_ids=inputs.input_ids,
+                    attention_mask=inputs.attention_mask,
+                    max_new_tokens=max_new_tokens,
+                    streamer=streamer,
+                    stopping_criteria=StoppingCriteriaList([StopWhenCancelled()]),
+                    **self._generation_kwargs()
+                )
+            except Exception as e:
+                logger.error(f"Error streaming text: {e}")
+                errors.append(e)
+                streamer.end()
+
+        thread = threading.Thread(target=run, name='ai-stream', daemon=True)
+        thread.start()
+        try:
+            for chunk in streamer:
+                if chunk:
+                    yield chunk
+        finally:
+            cancelled.set()
+        thread.join()
+        if errors:
+            raise errors[0]
+
+    def _stream_section(self, section: str, prompt: str, max_length: int,
+                        sections: Dict[str, str]) -> Iterator[Dict[str, Any]]:
+        """Stream one section as token events and store its cleaned text in `sections`"""
+        chunks = []
+        for chunk in self.stream_text(prompt, max_length=max_length):
+            chunks.append(chunk)
+            yield {'event': 'token', 'section': section, 'text': chunk}
+        sections[section] = self._clean_response(''.join(chunks))
+
+    def _monthly_data(self, revenue_data) -> dict:
+        """
+        Bucket revenue rows into per-month totals, counts and category sums.
+
+        Data that is already aggregated (a dict of month -> {'total', 'count',
+        'categories'}, e.g. from a SQL GROUP BY) is returned unchanged.
+        """
+        if isinstance(revenue_data, dict):
+            return revenue_data
+
+        monthly_data = defaultdict(lambda: {'total': 0, 'count': 0, 'categories': defaultdict(float)})
+
+        for item in revenue_data:
+            date = datetime.strptime(item['date'], '%Y-%m-%d')
+            month_key = date.strftime('%Y-%m')
+            monthly_data[month_key]['total'] += item['amount']
+            monthly_data[month_key]['count'] += 1
+            if item['category']:
+                monthly_data[month_key]['categories'][item['category']] += item['amount']
+        return monthly_data
+
+    @staticmethod
+    def _follow_up_prompts(analysis: str) -> List[Tuple[str, str, int]]:
+        """(section, prompt, max_length) for the prompts that build on the analysis"""
+        return [
+            ('growth_strategies', """Based on the following revenue analysis, suggest specific growth strategies:
+                """ + analysis, 300),
+            ('potential_issues', """Based on the following revenue analysis, identify potential issues and risks:
+                """ + analysis, 200),
+        ]
+
+    @staticmethod
+    def _analysis_result(parsed_analysis: Dict[str, str], growth_strategies: str,
+                         potential_issues: str, computed: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'status': 'success',
+            'source': 'llm',
+            'observations': parsed_analysis.get('observations', ''),
+            'price_recommendations': parsed_analysis.get('price_recommendations', ''),
+            'product_focus': parsed_analysis.get('product_focus', ''),
+            'growth_strategies': growth_strategies,
+            'potential_issues': potential_issues,
+            'insights': computed
+        }
     
-    def analyze_revenue_trends(self, revenue_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def analyze_revenue_trends(self, revenue_data) -> Dict[str, Any]:
         """
-        Analyze revenue trends and generate insights using local model
+        Analyze revenue trends and generate insights using local model.
+
+        `revenue_data` is either a list of revenue rows ({'date', 'amount',
+        'category'}) or pre-aggregated monthly data as built by _monthly_data.
         """
         try:
             logger.info("Starting revenue trend analysis")
             
             # Prepare data for analysis
-            monthly_data = defaultdict(lambda: {'total': 0, 'count': 0, 'categories': defaultdict(float)})
-            
-            for item in revenue_data:
-                date = datetime.strptime(item['date'], '%Y-%m-%d')
-                month_key = date.strftime('%Y-%m')
-                monthly_data[month_key]['total'] += item['amount']
-                monthly_data[month_key]['count'] += 1
-                if item['category']:
-                    monthly_data[month_key]['categories'][item['category']] += item['amount']
+            monthly_data = self._monthly_data(revenue_data)
             
+            # Compute the statistics first; the model only has to put them into words
+            computed = insights.compute_insights(monthly_data)
+
             # Create analysis prompt
-            prompt = self._create_analysis_prompt(monthly_data)
+            prompt = self._create_analysis_prompt(monthly_data, max_new_tokens=500, computed=computed)
             logger.info(f"Analysis prompt created: {prompt[:100]}...")
             
             # Generate analysis using local model
@@ -116,90 +449,67 @@ class AIRecommendationService:
             # Parse the response
             parsed_analysis = self._parse_analysis(analysis)
             
-            # Add growth strategies and potential issues
-            growth_strategies = self.generate_text(
-                """Based on the following revenue analysis, suggest specific growth strategies:
-                """ + analysis,
-                max_length=300
-            )
+            # Add growth strategies and potential issues; both only depend on the
+            # analysis, so they are generated together as one batch
+            growth_strategies, potential_issues = self.generate_many([
+                (prompt, max_length) for _, prompt, max_length in self._follow_up_prompts(analysis)
+            ])
             logger.info(f"Growth strategies generated: {growth_strategies[:100]}...")
-            
-            potential_issues = self.generate_text(
-                """Based on the following revenue analysis, identify potential issues and risks:
-                """ + analysis,
-                max_length=200
-            )
             logger.info(f"Potential issues generated: {potential_issues[:100]}...")
             
-            return {
-                'status': 'success',
-                'observations': parsed_analysis.get('observations', ''),
-                'price_recommendations': parsed_analysis.get('price_recommendations', ''),
-                'product_focus': parsed_analysis.get('product_focus', ''),
-                'growth_strategies': growth_strategies,
-                'potential_issues': potential_issues
-            }
+            return self._analysis_result(parsed_analysis, growth_strategies, potential_issues, computed)
             
+        except (WorkerPoolSaturated, WorkerTimeout):
+            raise
         except Exception as e:
             logger.error(f"Error in analyze_revenue_trends: {e}")
             return {
                 'status': 'error',
                 'message': str(e)
             }
+
+    def stream_revenue_trends(self, revenue_data) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming variant of analyze_revenue_trends.
+
+        Yields {'event': 'token', 'section', 'text'} for every decoded chunk,
+        {'event': 'section', 'section', 'text'} when a section is complete and
+        finally {'event': 'result', 'data'} with the same payload as
+        analyze_revenue_trends. Sections are 'analysis' (observations, price
+        recommendations and product focus), 'growth_strategies' and
+        'potential_issues'.
+        """
+        logger.info("Starting streamed revenue trend analysis")
+        monthly_data = self._monthly_data(revenue_data)
+        computed = insights.compute_insights(monthly_data)
+        prompt = self._create_analysis_prompt(monthly_data, max_new_tokens=500, computed=computed)
+
+        sections = {}
+        yield from self._stream_section('analysis', prompt, 500, sections)
+        parsed_analysis = self._parse_analysis(sections['analysis'])
+        yield {'event': 'section', 'section': 'analysis', 'text': sections['analysis'],
+               'parsed': parsed_analysis}
+
+        for section, section_prompt, max_length in self._follow_up_prompts(sections['analysis']):
+            yield from self._stream_section(section, section_prompt, max_length, sections)
+            yield {'event': 'section', 'section': section, 'text': sections[section]}
+
+        yield {'event': 'result', 'data': self._analysis_result(
+            parsed_analysis, sections['growth_strategies'], sections['potential_issues'], computed
+        )}
     
-    def _create_analysis_prompt(self, monthly_data: dict) -> str:
-        """Create a prompt for the AI based on the monthly revenue data"""
+    def _create_analysis_prompt(self, monthly_data: dict, max_new_tokens: int = 500,
+                                computed: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Create a prompt for the AI based on the monthly revenue data (and the
+        computed insights, if given), sized so that it and `max_new_tokens`
+        generated tokens fit the context window
+        """
         logger.info("Creating analysis prompt")
-        
-        # Create a more structured and clear prompt
-        prompt = """You are a business analyst providing detailed revenue analysis and recommendations.
-
-Revenue Data Analysis:
-"""
-        
-        # Add monthly data
-        for month, data in sorted(monthly_data.items()):
-            prompt += f"\n{month}:\n"
-            prompt += f"  Total Revenue: ${data['total']:,.2f}\n"
-            prompt += f"  Transactions: {data['count']}\n"
-            if data['categories']:
-                prompt += "  Categories:\n"
-                for category, amount in data['categories'].items():
-                    prompt += f"    {category}: ${amount:,.2f}\n"
-        
-        # Add clear section headers with specific questions
-        prompt += """
-
-Based on this data, please provide:
-
-1. Key Observations:
-- What are the main revenue trends?
-- Are there any seasonal patterns?
-- Which categories are performing well/poorly?
-
-2. Price Recommendations:
-- Should prices be adjusted?
-- Which products need price changes?
-- What is the optimal pricing strategy?
-
-3. Product Focus:
-- Which products should we prioritize?
-- Are there opportunities for new products?
-- How should we position our products?
-
-4. Growth Strategies:
-- What are the best growth opportunities?
-- How can we increase revenue?
-- What new markets should we target?
-
-5. Potential Issues:
-- Are there any revenue risks?
-- What challenges might we face?
-- How can we mitigate risks?
-
-Please provide detailed, actionable recommendations for each section.
-"""
-        
+        prompt = build_analysis_prompt(
+            monthly_data, self.tokenizer, self._prompt_budget(max_new_tokens),
+            highlights=insights.highlights(computed) if computed else ""
+        )
         logger.info(f"Prompt created with {len(monthly_data)} months of data")
         return prompt
     
@@ -243,8 +553,26 @@ Please provide detailed, actionable recommendations for each section.
                 'marketing_ideas': ideas
             }
             
+        except (WorkerPoolSaturated, WorkerTimeout):
+            raise
         except Exception as e:
             return {
                 'status': 'error',
                 'message': str(e)
             }
+
+    def stream_marketing_ideas(self, business_type: str, target_audience: str) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming variant of generate_marketing_ideas.
+
+        Yields {'event': 'token', 'section': 'marketing_ideas', 'text'} for every
+        decoded chunk, then {'event': 'result', 'data'} with the cleaned ideas in
+        the generate_marketing_ideas payload.
+        """
+        prompt = f"Generate marketing ideas for a {business_type} business targeting {target_audience}. Focus on innovative strategies that can help grow the business and engage the target audience."
+        sections = {}
+        yield from self._stream_section('marketing_ideas', prompt, 500, sections)
+        yield {'event': 'result', 'data': {
+            'status': 'success',
+            'marketing_ideas': sections['marketing_ideas']
+        }}
@@ -1,16 +1,37 @@
-from flask import Flask, jsonify, request
+import click
+from flask import Blueprint, Flask, Response, current_app, g, has_request_context, jsonify, request, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import text
-from datetime import datetime
+from sqlalchemy import event, func, extract, insert, select, and_, or_
+from datetime import datetime, timedelta
+import base64
+import binascii
+import csv
+import io
+import atexit
+import itertools
+import json
+import math
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from config import Config
 from ai_service import AIRecommendationService
+from model_workers import WorkerPoolSaturated, WorkerTimeout
+from cache import make_cache
+from compression import ResponseCompressor
+from http_cache import ResponseCache
+from query_plans import check_plan
+import changes
+import dashboard
+import insights
+import json_provider
+import metrics
+import rollups
 
-app = Flask(__name__)
-app.config.from_object(Config)
-CORS(app)
-
-db = SQLAlchemy(app)
+db = SQLAlchemy()
+# Routes and CLI commands, registered on the app by create_app
+api = Blueprint('api', __name__, cli_group=None)
 
 # Existing Message model
 class Message(db.Model):
@@ -34,6 +55,13 @@ class Revenue(db.Model):
     description = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Date range filters and the (date, id) keyset order used for paging
+        db.Index('ix_revenue_date_id', 'date', 'id'),
+        # Category filters sorted by date, and SELECT DISTINCT category
+        db.Index('ix_revenue_category_date', 'category', 'date', 'id'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -44,24 +72,218 @@ class Revenue(db.Model):
             'created_at': self.created_at.isoformat()
         }
 
-# Initialize AI Service
-ai_service = AIRecommendationService()
+# Monthly rollup read by the dashboard, maintained by triggers (see rollups.py)
+class RevenueSummary(db.Model):
+    __tablename__ = 'revenue_summary'
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.String(7), nullable=False)  # 'YYYY-MM'
+    subscription_revenue = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    product_revenue = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    total_revenue = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ux_revenue_summary_month', 'month', unique=True),
+    )
+
+# Per-country revenue and customer counts, maintained by triggers (see rollups.py)
+class CountryRevenue(db.Model):
+    __tablename__ = 'country_revenue'
+    country = db.Column(db.String(50), primary_key=True)  # '' for customers without a country
+    total_revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    customer_count = db.Column(db.Integer, nullable=False, default=0)
+
+# When a precomputed aggregate was last rebuilt, and the highest ids it covered
+class RollupState(db.Model):
+    __tablename__ = 'rollup_state'
+    name = db.Column(db.String(50), primary_key=True)
+    last_payment_id = db.Column(db.Integer, nullable=False, default=0)
+    last_customer_id = db.Column(db.Integer, nullable=False, default=0)
+    refreshed_at = db.Column(db.DateTime, nullable=False)
+
+# Append-only log of revenue writes, appended by triggers in the writing
+# transaction (see changes.py) and served by /api/revenue/changes
+class RevenueChange(db.Model):
+    __tablename__ = 'revenue_changes'
+    seq = db.Column(db.Integer, primary_key=True)
+    revenue_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(6), nullable=False)  # insert, update or delete
+    data = db.Column(db.JSON)  # the row as written, null for deletes
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # Never reuse the seq of deleted (pruned) entries on SQLite
+    __table_args__ = {'sqlite_autoincrement': True}
+
+# Services shared by all requests, built from the app config by create_app:
+# the AI service (the model is loaded lazily, on a background thread), cached
+# AI analyses keyed on a fingerprint of the revenue data, and the thread pool
+# that runs the independent dashboard queries of /api/dashboard/all concurrently
+ai_service = None
+ai_cache = None
+dashboard_pool = None
+
+# Negotiated gzip/br/zstd compression of the responses, set up by create_app
+response_compressor = None
+
+# Whether the revenue_changes triggers are installed (SQLite and PostgreSQL)
+revenue_changes_enabled = False
+
+# Whether triggers keep country_revenue up to date; otherwise reads refresh it
+# once it is older than COUNTRY_REVENUE_MAX_AGE
+country_revenue_maintained = False
+
+# Rendered GET responses of the dashboard and revenue endpoints; create_app
+# swaps in the backend configured by the HTTP_CACHE_* settings
+response_cache = ResponseCache(make_cache())
+
+# Bumped by the revenue write handlers of this process
+_revenue_versions = itertools.count(1)
+revenue_version = 0
+# Tells this process's versions apart from other workers' and earlier runs'
+_process_token = uuid.uuid4().hex
+
+def bump_revenue_version():
+    global revenue_version
+    revenue_version = next(_revenue_versions)
+    response_cache.invalidate()
+
+def revenue_fingerprint():
+    """
+    Fingerprint of the revenue data, used as a cache key: the change log's
+    latest seq, which every write moves on, from any worker. Read from the
+    primary key index, so it costs the same at any table size.
+    """
+    if revenue_changes_enabled:
+        return f"seq:{changes.head(db.session)}"
+    # Without the change log only this process's writes are known, so its
+    # entries must not match those of other workers sharing AI_CACHE_DIR
+    return f"local:{_process_token}:{revenue_version}"
+
+# Latest change seq this process has seen, and when to check the log again
+revenue_head_watcher = changes.HeadWatcher()
+
+@api.before_app_request
+def watch_revenue_changes():
+    """
+    Clear the response cache when the change log has moved on since the last
+    check, e.g. after writes by another worker or outside the app. Checks at
+    most every REVENUE_CHANGES_POLL_INTERVAL seconds.
+    """
+    if not revenue_changes_enabled or \
+            not revenue_head_watcher.due(current_app.config['REVENUE_CHANGES_POLL_INTERVAL']):
+        return
+    try:
+        # Own connection: the session's would stay checked out for a whole stream
+        with db.engine.connect() as connection:
+            latest = changes.head(connection)
+    except Exception as e:
+        current_app.logger.error(f"Error reading the revenue change log: {e}")
+        return
+    if revenue_head_watcher.advance(latest):
+        response_cache.invalidate()
+
+def create_indexes():
+    """Create declared indexes that are missing from tables created before they existed"""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+# Instrumentation, exposed at /api/metrics
+REQUEST_SECONDS = metrics.histogram(
+    'http_request_duration_seconds', 'Time to build the response, per route', ['method', 'route', 'status'])
+QUERY_SECONDS = metrics.histogram(
+    'db_query_duration_seconds', 'SQL statement execution time, per route and statement type',
+    ['route', 'operation'])
+
+def current_route():
+    if has_request_context() and request.url_rule is not None:
+        return request.url_rule.rule
+    # Queries run outside a request, e.g. on the dashboard query threads
+    return 'none'
+
+@api.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@api.after_app_request
+def record_request_time(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - started,
+                                method=request.method, route=route, status=response.status_code)
+    return response
 
-# Create tables
-with app.app_context():
-    db.create_all()
+# Registered after record_request_time so it runs first, inside the timed span
+@api.after_app_request
+def compress_response(response):
+    return response_compressor.process(response, request)
 
-@app.route('/api/hello')
+def instrument_queries(engine):
+    """Time every statement run on `engine` through the cursor execute events"""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_started'].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+        QUERY_SECONDS.observe(time.perf_counter() - started, route=current_route(), operation=operation)
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        # A failed statement never reaches after_cursor_execute
+        if context.connection is not None and context.connection.info.get('query_started'):
+            context.connection.info['query_started'].pop()
+
+def collect_runtime_metrics():
+    """Cache, connection pool and AI worker figures read at scrape time"""
+    caches = {'ai': ai_cache, 'http': response_cache.backend, 'compression': response_compressor.variants}
+    hits = [({'cache': name}, cache.hits) for name, cache in caches.items()]
+    misses = [({'cache': name}, cache.misses) for name, cache in caches.items()]
+    ratios = [({'cache': name}, cache.hits / (cache.hits + cache.misses) if cache.hits + cache.misses else 0)
+              for name, cache in caches.items()]
+    families = [
+        ('cache_hits_total', 'counter', 'Cache lookups that found an entry', hits),
+        ('cache_misses_total', 'counter', 'Cache lookups that found nothing', misses),
+        ('cache_hit_ratio', 'gauge', 'Hits divided by lookups since start', ratios),
+    ]
+
+    pool = db.engine.pool
+    # Only queue-based pools track these (not e.g. SQLite's in-memory pool)
+    if hasattr(pool, 'checkedout'):
+        families += [
+            ('db_pool_size', 'gauge', 'Configured connection pool size', [({}, pool.size())]),
+            ('db_pool_checked_out', 'gauge', 'Connections currently in use', [({}, pool.checkedout())]),
+            ('db_pool_overflow', 'gauge', 'Connections open beyond the pool size', [({}, max(pool.overflow(), 0))]),
+        ]
+
+    if ai_service.pool is not None:
+        stats = ai_service.pool.stats()
+        families += [
+            ('ai_workers_ready', 'gauge', 'Model worker processes ready to serve', [({}, stats['ready'])]),
+            ('ai_worker_jobs_pending', 'gauge', 'Prompts queued or running in the workers', [({}, stats['pending'])]),
+        ]
+    return families
+
+metrics.add_collector(collect_runtime_metrics)
+
+@api.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Metrics in the Prometheus text format"""
+    return Response(metrics.REGISTRY.render(), mimetype=metrics.CONTENT_TYPE)
+
+@api.route('/api/hello')
 def hello():
     return jsonify({"message": "Hello from Flask with PostgreSQL!"})
 
 # Existing message endpoints
-@app.route('/api/messages', methods=['GET'])
+@api.route('/api/messages', methods=['GET'])
 def get_messages():
     messages = Message.query.order_by(Message.created_at.desc()).all()
     return jsonify([message.to_dict() for message in messages])
 
-@app.route('/api/messages', methods=['POST'])
+@api.route('/api/messages', methods=['POST'])
 def create_message():
     data = request.get_json()
     if not data or 'content' not in data:
@@ -73,33 +295,198 @@ def create_message():
     return jsonify(message.to_dict()), 201
 
 # Revenue endpoints
-@app.route('/api/revenue', methods=['GET'])
+REVENUE_COLUMNS = {
+    'id': Revenue.id,
+    'date': Revenue.date,
+    'amount': Revenue.amount,
+    'category': Revenue.category,
+    'description': Revenue.description,
+    'created_at': Revenue.created_at
+}
+
+def revenue_filters(args):
+    """SQL filter expressions for the start_date/end_date/category query parameters"""
+    filters = []
+    start_date = args.get('start_date')
+    end_date = args.get('end_date')
+    category = args.get('category')
+
+    if start_date:
+        start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+        filters.append(Revenue.date >= start_date)
+
+    if end_date:
+        end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+        filters.append(Revenue.date <= end_date)
+
+    if category:
+        filters.append(Revenue.category == category)
+
+    return filters
+
+def revenue_fields(args):
+    """Column names requested with ?fields=a,b (all columns by default)"""
+    fields = args.get('fields')
+    if not fields:
+        return list(REVENUE_COLUMNS)
+
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in REVENUE_COLUMNS]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Valid fields: {', '.join(REVENUE_COLUMNS)}")
+    return fields
+
+def revenue_list_query(fields, filters):
+    """SELECT of the given columns, filtered and ordered newest first by (date, id)"""
+    query = select(*[REVENUE_COLUMNS[name] for name in fields]).where(*filters)
+    return query.order_by(Revenue.date.desc(), Revenue.id.desc())
+
+def revenue_keyset_filter(cursor_date, cursor_id):
+    """Rows that come after (cursor_date, cursor_id) in the newest-first order"""
+    # The leading date bound gives the index a range to search; the OR alone
+    # makes the planner walk ix_revenue_date_id from the newest row
+    return and_(
+        Revenue.date <= cursor_date,
+        or_(Revenue.date < cursor_date, and_(Revenue.date == cursor_date, Revenue.id < cursor_id))
+    )
+
+def json_value(value):
+    """Convert a column value from a row tuple into a JSON-friendly value"""
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+def revenue_layout(args):
+    """?layout=rows (default: a list of objects) or columnar (one array per field)"""
+    layout = args.get('layout', 'rows')
+    if layout not in ('rows', 'columnar'):
+        raise ValueError("layout must be rows or columnar")
+    return layout
+
+def revenue_payload(fields, rows, layout):
+    """
+    Query rows as [{field: value}, ...] or, for the columnar layout, as
+    {field: [value, ...]} built by transposing the row tuples. Dates are left to
+    the JSON provider.
+    """
+    if layout == 'columnar':
+        columns = list(zip(*rows)) or [() for _ in fields]
+        return dict(zip(fields, columns))
+    return [dict(zip(fields, row)) for row in rows]
+
+def encode_cursor(date, id):
+    """Opaque keyset cursor for the (date, id) position of the last row on a page"""
+    raw = json.dumps([date.isoformat(), id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        date, id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.strptime(date, '%Y-%m-%d').date(), int(id)
+    except (TypeError, ValueError, binascii.Error):
+        raise ValueError("Invalid cursor")
+
+@api.route('/api/revenue', methods=['GET'])
+@response_cache.cached
 def get_revenue():
+    """
+    List revenue rows, newest first.
+
+    Supports start_date/end_date/category filters and ?fields= projection.
+    Passing `limit` and/or `cursor` switches to keyset pagination on
+    (date, id): the response is {"items": [...], "next_cursor": ...} and the
+    next page is requested with ?cursor=<next_cursor>. With ?layout=columnar
+    the rows (or items) are {field: [values...]} instead of a list of objects.
+    """
     try:
-        # Get query parameters for filtering
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        category = request.args.get('category')
-        
-        query = Revenue.query
-        
-        if start_date:
-            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-            query = query.filter(Revenue.date >= start_date)
-            
-        if end_date:
-            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
-            query = query.filter(Revenue.date <= end_date)
-            
-        if category:
-            query = query.filter(Revenue.category == category)
-            
-        revenue_data = query.order_by(Revenue.date.desc()).all()
-        return jsonify([item.to_dict() for item in revenue_data])
+        fields = revenue_fields(request.args)
+        layout = revenue_layout(request.args)
+        paginate = 'limit' in request.args or 'cursor' in request.args
+
+        # Always select date and id so the keyset cursor can be built
+        selected = fields + [name for name in ('date', 'id') if name not in fields]
+        query = revenue_list_query(selected, revenue_filters(request.args))
+
+        if not paginate:
+            return jsonify(revenue_payload(fields, db.session.execute(query), layout))
+
+        limit = int(request.args.get('limit', current_app.config['REVENUE_PAGE_DEFAULT_LIMIT']))
+        limit = max(1, min(limit, current_app.config['REVENUE_PAGE_MAX_LIMIT']))
+
+        cursor = request.args.get('cursor')
+        if cursor:
+            cursor_date, cursor_id = decode_cursor(cursor)
+            query = query.where(revenue_keyset_filter(cursor_date, cursor_id))
+
+        # Fetch one extra row to know whether another page exists
+        rows = db.session.execute(query.limit(limit + 1)).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        date_index, id_index = selected.index('date'), selected.index('id')
+        next_cursor = None
+        if has_more:
+            last = rows[-1]
+            next_cursor = encode_cursor(last[date_index], last[id_index])
+
+        return jsonify({
+            'items': revenue_payload(fields, rows, layout),
+            'next_cursor': next_cursor
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/revenue', methods=['POST'])
+@api.route('/api/revenue/export', methods=['GET'])
+def export_revenue():
+    """
+    Stream revenue rows as NDJSON (?format=ndjson, default) or CSV (?format=csv).
+
+    Takes the same filters and ?fields= projection as GET /api/revenue. Rows are
+    read from a server-side cursor in batches and written as they arrive, so
+    memory stays flat regardless of the table size.
+    """
+    try:
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in ('ndjson', 'csv'):
+            return jsonify({"error": "format must be ndjson or csv"}), 400
+
+        fields = revenue_fields(request.args)
+        query = revenue_list_query(fields, revenue_filters(request.args))
+        query = query.execution_options(yield_per=current_app.config['REVENUE_EXPORT_BATCH_SIZE'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    dumps = current_app.json.dumps
+
+    def generate_ndjson():
+        result = db.session.execute(query)
+        for rows in result.partitions():
+            yield ''.join(dumps(dict(zip(fields, row))) + '\n' for row in rows)
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # Header goes out before the query runs
+        writer.writerow(fields)
+        yield buffer.getvalue()
+
+        result = db.session.execute(query)
+        for rows in result.partitions():
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows([json_value(value) for value in row] for row in rows)
+            yield buffer.getvalue()
+
+    if export_format == 'csv':
+        response = Response(stream_with_context(generate_csv()), mimetype='text/csv')
+    else:
+        response = Response(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = f'attachment; filename=revenue.{export_format}'
+    return response
+
+@api.route('/api/revenue', methods=['POST'])
 def add_revenue():
     try:
         data = request.get_json()
@@ -120,6 +507,7 @@ def add_revenue():
         
         db.session.add(revenue)
         db.session.commit()
+        bump_revenue_version()
         
         return jsonify(revenue.to_dict()), 201
     except ValueError as e:
@@ -127,7 +515,133 @@ def add_revenue():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/revenue/<int:id>', methods=['GET'])
+def read_bulk_rows():
+    """
+    Parse the body of a bulk upload into a list of dicts.
+
+    Accepts a JSON array (or {"rows": [...]}), NDJSON (application/x-ndjson) or
+    CSV (text/csv), either as the request body or as a multipart `file` upload.
+    """
+    upload = request.files.get('file')
+    if upload:
+        content_type = upload.mimetype or ''
+        body = upload.read().decode('utf-8-sig')
+        filename = (upload.filename or '').lower()
+        if filename.endswith('.csv'):
+            content_type = 'text/csv'
+        elif filename.endswith(('.ndjson', '.jsonl')):
+            content_type = 'application/x-ndjson'
+    else:
+        content_type = request.mimetype or ''
+        body = request.get_data(as_text=True)
+
+    if content_type == 'text/csv':
+        return list(csv.DictReader(io.StringIO(body)))
+    if content_type in ('application/x-ndjson', 'application/jsonl'):
+        return [json.loads(line) for line in body.splitlines() if line.strip()]
+
+    data = json.loads(body)
+    if isinstance(data, dict):
+        data = data.get('rows')
+    if not isinstance(data, list):
+        raise ValueError("Expected a JSON array of revenue records")
+    return data
+
+def validate_bulk_rows(rows):
+    """
+    Validate raw rows and convert them to insert parameters.
+
+    Returns (valid, errors) where errors is a list of {"row", "error"} using the
+    row's 0-based position in the upload.
+    """
+    valid = []
+    errors = []
+    # Uploads repeat the same few dates many times, so parse each string once
+    parsed_dates = {}
+    created_at = datetime.utcnow()
+
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors.append({'row': index, 'error': 'Expected an object'})
+            continue
+
+        missing = [field for field in ('date', 'amount') if row.get(field) in (None, '')]
+        if missing:
+            errors.append({'row': index, 'error': f"{', '.join(missing)} is required"})
+            continue
+
+        raw_date = row['date']
+        # Lists and objects aren't dates (and can't key parsed_dates)
+        if not isinstance(raw_date, str):
+            errors.append({'row': index, 'error': f"Invalid date: {raw_date!r}"})
+            continue
+        date = parsed_dates.get(raw_date)
+        if date is None:
+            try:
+                date = datetime.strptime(raw_date, '%Y-%m-%d').date()
+            except (TypeError, ValueError):
+                errors.append({'row': index, 'error': f"Invalid date: {raw_date!r}"})
+                continue
+            parsed_dates[raw_date] = date
+
+        try:
+            # float() accepts true/false, "nan" and "inf", none of which is an amount
+            if isinstance(row['amount'], bool):
+                raise TypeError(row['amount'])
+            amount = float(row['amount'])
+            if not math.isfinite(amount):
+                raise ValueError(amount)
+        except (TypeError, ValueError):
+            errors.append({'row': index, 'error': f"Invalid amount: {row['amount']!r}"})
+            continue
+
+        valid.append({
+            'date': date,
+            'amount': amount,
+            'category': row.get('category') or None,
+            'description': row.get('description') or None,
+            'created_at': created_at
+        })
+
+    return valid, errors
+
+@api.route('/api/revenue/bulk', methods=['POST'])
+def add_revenue_bulk():
+    """
+    Insert many revenue records in one transaction.
+
+    Valid rows are inserted in chunks of REVENUE_BULK_CHUNK_SIZE with
+    executemany; invalid rows are reported in `errors`. With ?atomic=true
+    nothing is inserted if any row is invalid.
+    """
+    try:
+        rows = read_bulk_rows()
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"error": f"Invalid upload: {e}"}), 400
+
+    valid, errors = validate_bulk_rows(rows)
+    atomic = request.args.get('atomic', 'false').lower() in ('1', 'true', 'yes')
+    if atomic and errors:
+        return jsonify({'inserted': 0, 'total': len(rows), 'errors': errors}), 400
+
+    try:
+        chunk_size = current_app.config['REVENUE_BULK_CHUNK_SIZE']
+        for start in range(0, len(valid), chunk_size):
+            db.session.execute(insert(Revenue), valid[start:start + chunk_size])
+        db.session.commit()
+        if valid:
+            bump_revenue_version()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({
+        'inserted': len(valid),
+        'total': len(rows),
+        'errors': errors
+    }), 201 if valid else 400
+
+@api.route('/api/revenue/<int:id>', methods=['GET'])
 def get_single_revenue(id):
     try:
         revenue = Revenue.query.get_or_404(id)
@@ -135,7 +649,7 @@ def get_single_revenue(id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/revenue/<int:id>', methods=['PUT'])
+@api.route('/api/revenue/<int:id>', methods=['PUT'])
 def update_revenue(id):
     try:
         revenue = Revenue.query.get_or_404(id)
@@ -151,6 +665,7 @@ def update_revenue(id):
             revenue.description = data['description']
             
         db.session.commit()
+        bump_revenue_version()
         return jsonify(revenue.to_dict())
     except ValueError as e:
         return jsonify({"error": "Invalid data format"}), 400
@@ -158,18 +673,117 @@ def update_revenue(id):
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/revenue/<int:id>', methods=['DELETE'])
+@api.route('/api/revenue/<int:id>', methods=['DELETE'])
 def delete_revenue(id):
     try:
         revenue = Revenue.query.get_or_404(id)
         db.session.delete(revenue)
         db.session.commit()
+        bump_revenue_version()
         return jsonify({"message": "Revenue record deleted successfully"})
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/revenue/categories', methods=['GET'])
+def changes_unavailable_response(message):
+    return jsonify({"error": "changes_unavailable", "message": message}), 410
+
+def read_since(value):
+    """Parse ?since= / Last-Event-ID, None if missing"""
+    if value is None or value == '':
+        return None
+    since = int(value)
+    if since < 0:
+        raise ValueError(since)
+    return since
+
+@api.route('/api/revenue/changes', methods=['GET'])
+def get_revenue_changes():
+    """
+    Revenue writes after ?since=<seq>, oldest first, as
+    {"changes": [...], "next": seq, "has_more": bool}.
+
+    Each change is {seq, op, id, row, changed_at}, `row` being the record as
+    written (null for deletes). Poll again with ?since=<next>. Without `since`
+    only the current `next` is returned, to start following the log after
+    loading the full dataset. Answers 410 when the entries after `since` were
+    pruned; the client then reloads the dataset and starts over.
+    """
+    if not revenue_changes_enabled:
+        return jsonify({"error": "The change log is not available on this database"}), 501
+    try:
+        since = read_since(request.args.get('since'))
+        limit = int(request.args.get('limit', current_app.config['REVENUE_CHANGES_MAX_LIMIT']))
+        limit = max(1, min(limit, current_app.config['REVENUE_CHANGES_MAX_LIMIT']))
+    except ValueError:
+        return jsonify({"error": "since and limit must be non-negative integers"}), 400
+
+    try:
+        if since is None:
+            return jsonify({"changes": [], "next": changes.head(db.session), "has_more": False})
+        entries, latest = changes.changes_since(db.session, since, limit)
+    except changes.ChangesUnavailable as e:
+        return changes_unavailable_response(str(e))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    next_seq = entries[-1]['seq'] if entries else since
+    return jsonify({"changes": entries, "next": next_seq, "has_more": next_seq < latest})
+
+@api.route('/api/revenue/changes/stream', methods=['GET'])
+def stream_revenue_changes():
+    """
+    Server-Sent Events variant of /api/revenue/changes.
+
+    Emits a `change` event per entry, with the seq as event id, so a
+    reconnecting EventSource resumes from Last-Event-ID. The log is checked
+    every REVENUE_CHANGES_POLL_INTERVAL seconds, and the stream ends after
+    REVENUE_CHANGES_STREAM_TIMEOUT seconds to free the worker; clients just
+    reconnect. A `reset` event means the entries after the client's seq were
+    pruned and it has to reload the dataset.
+    """
+    if not revenue_changes_enabled:
+        return jsonify({"error": "The change log is not available on this database"}), 501
+    try:
+        since = read_since(request.headers.get('Last-Event-ID') or request.args.get('since'))
+    except ValueError:
+        return jsonify({"error": "since must be a non-negative integer"}), 400
+
+    engine = db.engine
+    limit = current_app.config['REVENUE_CHANGES_MAX_LIMIT']
+    interval = current_app.config['REVENUE_CHANGES_POLL_INTERVAL']
+    deadline = time.monotonic() + current_app.config['REVENUE_CHANGES_STREAM_TIMEOUT']
+
+    def generate():
+        position = since
+        # A connection per check, so an idle stream doesn't hold one from the pool
+        try:
+            if position is None:
+                with engine.connect() as connection:
+                    position = changes.head(connection)
+            yield sse_event('status', {'status': 'following', 'next': position}, id=position)
+            while True:
+                with engine.connect() as connection:
+                    entries, latest = changes.changes_since(connection, position, limit)
+                for entry in entries:
+                    position = entry['seq']
+                    yield sse_event('change', entry, id=position)
+                if position < latest:
+                    continue
+                if time.monotonic() >= deadline:
+                    return
+                # Comment line: keeps proxies from closing an idle stream
+                yield ": keepalive\n\n"
+                time.sleep(interval)
+        except changes.ChangesUnavailable as e:
+            yield sse_event('reset', {'error': 'changes_unavailable', 'message': str(e)})
+        except Exception as e:
+            yield sse_event('error', {'status': 'error', 'message': str(e)})
+
+    return sse_response(generate())
+
+@api.route('/api/revenue/categories', methods=['GET'])
+@response_cache.cached
 def get_categories():
     try:
         categories = db.session.query(Revenue.category).distinct().all()
@@ -180,22 +794,122 @@ def get_categories():
         return jsonify({"error": str(e)}), 500
 
 # AI Recommendation Endpoints
-@app.route('/api/ai/recommendations', methods=['GET'])
+def ai_busy_response():
+    """429 response for when the AI worker pool has no room for more jobs"""
+    response = jsonify({
+        'status': 'busy',
+        'message': 'AI workers are busy, please retry shortly'
+    })
+    response.headers['Retry-After'] = '5'
+    return response, 429
+
+def ai_timeout_response(e):
+    return jsonify({
+        'status': 'error',
+        'message': str(e)
+    }), 504
+
+def ai_not_ready_response():
+    """
+    Return a 503 "warming up" response if the model isn't ready, a 429 if the
+    worker pool is saturated, otherwise None
+    """
+    if ai_service.wait_until_ready(current_app.config['AI_WARMUP_TIMEOUT']):
+        if ai_service.is_saturated():
+            return ai_busy_response()
+        return None
+
+    if ai_service.status == 'error':
+        return jsonify({
+            'status': 'error',
+            'message': f"AI model failed to load: {ai_service.load_error}"
+        }), 503
+
+    response = jsonify({
+        'status': 'loading',
+        'message': 'AI model is warming up, please retry shortly'
+    })
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+@api.route('/api/ai/status', methods=['GET'])
+def get_ai_status():
+    return jsonify({
+        'status': ai_service.status,
+        'model': ai_service.model_name,
+        'backend': ai_service.backend,
+        'error': ai_service.load_error,
+        'workers': ai_service.pool.stats() if ai_service.pool else None
+    })
+
+def monthly_revenue_aggregates():
+    """
+    Per-month totals, transaction counts and per-category sums for the AI analysis.
+
+    Computed with a single GROUP BY (month, category) so memory is
+    O(months x categories) rather than O(rows).
+    """
+    year = extract('year', Revenue.date)
+    month = extract('month', Revenue.date)
+    rows = db.session.query(
+        year, month, Revenue.category, func.sum(Revenue.amount), func.count(Revenue.id)
+    ).group_by(year, month, Revenue.category).all()
+
+    monthly_data = {}
+    for row_year, row_month, category, amount, count in rows:
+        month_key = f"{int(row_year):04d}-{int(row_month):02d}"
+        data = monthly_data.setdefault(month_key, {'total': 0.0, 'count': 0, 'categories': {}})
+        data['total'] += float(amount or 0)
+        data['count'] += int(count)
+        if category:
+            data['categories'][category] = float(amount or 0)
+    return monthly_data
+
+def sse_event(event, data, id=None):
+    """Format one Server-Sent Events message"""
+    prefix = f"id: {id}\n" if id is not None else ""
+    return f"{prefix}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events):
+    """Stream an iterable of SSE messages without buffering"""
+    response = Response(events, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def use_llm_for_recommendations():
+    """?llm=0/1, defaulting to AI_RECOMMENDATIONS_LLM"""
+    value = request.args.get('llm')
+    if value is None:
+        return current_app.config['AI_RECOMMENDATIONS_LLM']
+    return value.lower() in ('1', 'true', 'yes')
+
+@api.route('/api/ai/recommendations', methods=['GET'])
 def get_ai_recommendations():
+    """
+    Revenue analysis and recommendations. Every response includes the computed
+    `insights`; with ?llm=0 the text fields are phrased from them directly
+    instead of by the model, which takes milliseconds and needs no model.
+    """
     try:
-        # Get all revenue data
-        revenue_data = Revenue.query.order_by(Revenue.date.asc()).all()
-        
-        # Convert to list of dicts
-        revenue_list = [{
-            'date': item.date.isoformat(),
-            'amount': float(item.amount),
-            'category': item.category,
-            'description': item.description
-        } for item in revenue_data]
-        
+        if not use_llm_for_recommendations():
+            return jsonify(insights.recommendations(monthly_revenue_aggregates()))
+
+        # Serve a cached analysis while the revenue data is unchanged
+        cache_key = f"ai-recommendations:{revenue_fingerprint()}"
+        if request.args.get('refresh') != '1':
+            cached = ai_cache.get(cache_key)
+            if cached is not None:
+                response = jsonify(cached)
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+        not_ready = ai_not_ready_response()
+        if not_ready:
+            return not_ready
+
         # Get AI analysis
-        analysis = ai_service.analyze_revenue_trends(revenue_list)
+        analysis = ai_service.analyze_revenue_trends(monthly_revenue_aggregates())
         
         if analysis['status'] == 'error':
             return jsonify({
@@ -203,15 +917,26 @@ def get_ai_recommendations():
                 'message': analysis.get('message', 'AI analysis failed')
             }), 500
         
-        return jsonify(analysis)
+        ai_cache.set(cache_key, analysis)
+        response = jsonify(analysis)
+        response.headers['X-Cache'] = 'MISS'
+        return response
+    except WorkerPoolSaturated:
+        return ai_busy_response()
+    except WorkerTimeout as e:
+        return ai_timeout_response(e)
     except Exception as e:
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 500
 
-@app.route('/api/ai/marketing-ideas', methods=['GET'])
+@api.route('/api/ai/marketing-ideas', methods=['GET'])
 def get_marketing_ideas():
+    not_ready = ai_not_ready_response()
+    if not_ready:
+        return not_ready
+
     try:
         business_type = request.args.get('business_type', 'e-commerce')
         target_audience = request.args.get('target_audience', 'general consumers')
@@ -225,145 +950,311 @@ def get_marketing_ideas():
             'status': 'success',
             'marketing_ideas': ideas
         })
+    except WorkerPoolSaturated:
+        return ai_busy_response()
+    except WorkerTimeout as e:
+        return ai_timeout_response(e)
     except Exception as e:
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 500
 
+@api.route('/api/ai/recommendations/stream', methods=['GET'])
+def stream_ai_recommendations():
+    """
+    Streaming variant of /api/ai/recommendations.
+
+    Emits `token` events ({section, text}) as text is generated, a `section`
+    event when each of analysis, growth_strategies and potential_issues is
+    complete, and a final `result` event with the usual JSON payload.
+    """
+    try:
+        if not use_llm_for_recommendations():
+            return sse_response([sse_event('result', insights.recommendations(monthly_revenue_aggregates()))])
+
+        cache_key = f"ai-recommendations:{revenue_fingerprint()}"
+        if request.args.get('refresh') != '1':
+            cached = ai_cache.get(cache_key)
+            if cached is not None:
+                return sse_response([sse_event('result', cached)])
+
+        not_ready = ai_not_ready_response()
+        if not_ready:
+            return not_ready
+
+        monthly_data = monthly_revenue_aggregates()
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+    def generate():
+        # Send something right away so the client knows the stream is open
+        yield sse_event('status', {'status': 'generating'})
+        try:
+            for event in ai_service.stream_revenue_trends(monthly_data):
+                if event['event'] == 'result':
+                    ai_cache.set(cache_key, event['data'])
+                    yield sse_event('result', event['data'])
+                else:
+                    yield sse_event(event.pop('event'), event)
+        except Exception as e:
+            yield sse_event('error', {'status': 'error', 'message': str(e)})
+
+    return sse_response(generate())
+
+@api.route('/api/ai/marketing-ideas/stream', methods=['GET'])
+def stream_marketing_ideas():
+    """Streaming variant of /api/ai/marketing-ideas (`token` events, then `result`)"""
+    not_ready = ai_not_ready_response()
+    if not_ready:
+        return not_ready
+
+    business_type = request.args.get('business_type', 'e-commerce')
+    target_audience = request.args.get('target_audience', 'general consumers')
+
+    def generate():
+        yield sse_event('status', {'status': 'generating'})
+        try:
+            for event in ai_service.stream_marketing_ideas(business_type, target_audience):
+                if event['event'] == 'result':
+                    yield sse_event('result', event['data'])
+                else:
+                    yield sse_event(event.pop('event'), event)
+        except Exception as e:
+            yield sse_event('error', {'status': 'error', 'message': str(e)})
+
+    return sse_response(generate())
+
 # Revenue Dashboard Endpoints
-@app.route('/api/dashboard/revenue-summary', methods=['GET'])
+def dashboard_session():
+    """The request's session, with DASHBOARD_STATEMENT_TIMEOUT_MS applied to its transaction"""
+    dashboard.set_statement_timeout(db.session, current_app.config['DASHBOARD_STATEMENT_TIMEOUT_MS'])
+    return db.session
+
+
+@api.route('/api/dashboard/revenue-summary', methods=['GET'])
+@response_cache.cached
 def get_revenue_summary():
     try:
-        # Get monthly revenue summary
-        result = db.session.execute(text("""
-            SELECT 
-                TO_CHAR(TO_DATE(month, 'YYYY-MM'), 'Mon YYYY') as month,
-                subscription_revenue,
-                product_revenue,
-                total_revenue
-            FROM revenue_summary
-            ORDER BY TO_DATE(month, 'YYYY-MM')
-        """))
-        
-        months = []
-        subscription_data = []
-        product_data = []
-        total_data = []
-        
-        for row in result:
-            months.append(row[0])
-            subscription_data.append(float(row[1]))
-            product_data.append(float(row[2]))
-            total_data.append(float(row[3]))
-            
-        return jsonify({
-            'months': months,
-            'subscription_revenue': subscription_data,
-            'product_revenue': product_data,
-            'total_revenue': total_data
-        })
+        return jsonify(dashboard.revenue_summary(dashboard_session()))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/dashboard/revenue-by-country', methods=['GET'])
+def refresh_country_revenue():
+    """
+    Fill the per-country aggregate on the first read, and refresh it when it is
+    older than COUNTRY_REVENUE_MAX_AGE seconds unless triggers maintain it.
+    """
+    try:
+        with db.engine.begin() as connection:
+            rollups.refresh_country_revenue_if_stale(
+                connection, current_app.config['COUNTRY_REVENUE_MAX_AGE'], country_revenue_maintained
+            )
+    except Exception as e:
+        # Reads fall back to the live query, so a failed refresh only costs speed
+        current_app.logger.error(f"Error refreshing country_revenue: {e}")
+
+@api.route('/api/dashboard/revenue-by-country', methods=['GET'])
+@response_cache.cached
 def get_revenue_by_country():
+    """Top 10 countries by revenue"""
     try:
-        result = db.session.execute(text("""
-            SELECT 
-                c.country,
-                COALESCE(SUM(p.amount), 0) as total_revenue,
-                COUNT(DISTINCT c.id) as customer_count
-            FROM customers c
-            LEFT JOIN payments p ON c.id = p.customer_id
-            GROUP BY c.country
-            ORDER BY total_revenue DESC
-            LIMIT 10
-        """))
-        
-        countries = []
-        revenue = []
-        customer_counts = []
-        
-        for row in result:
-            countries.append(row[0])
-            revenue.append(float(row[1]) if row[1] else 0)
-            customer_counts.append(int(row[2]))
-            
-        return jsonify({
-            'countries': countries,
-            'revenue': revenue,
-            'customer_counts': customer_counts
-        })
+        refresh_country_revenue()
+        return jsonify(dashboard.revenue_by_country(dashboard_session()))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/dashboard/recent-transactions', methods=['GET'])
+@api.route('/api/dashboard/recent-transactions', methods=['GET'])
+@response_cache.cached
 def get_recent_transactions():
+    """
+    Latest payments, newest first. ?limit= sets the page size; when more rows
+    may follow, the X-Next-Cursor header holds the value to pass as ?cursor=.
+    """
     try:
-        result = db.session.execute(text("""
-            SELECT 
-                c.name as customer_name,
-                p.amount,
-                p.payment_date,
-                p.payment_method,
-                string_agg(ps.sale_date::text, ', ') as product_dates
-            FROM payments p
-            JOIN customers c ON p.customer_id = c.id
-            LEFT JOIN product_sales ps ON p.customer_id = ps.customer_id 
-                AND DATE(p.payment_date) = DATE(ps.sale_date)
-            GROUP BY c.name, p.amount, p.payment_date, p.payment_method
-            ORDER BY p.payment_date DESC
-            LIMIT 10
-        """))
-        
-        transactions = []
-        for row in result:
-            transactions.append({
-                'customer': row[0],
-                'amount': float(row[1]) if row[1] else 0,
-                'date': row[2].strftime('%Y-%m-%d') if row[2] else None,
-                'payment_method': row[3],
-                'has_product_sale': bool(row[4])
-            })
-            
-        return jsonify(transactions)
+        limit = int(request.args.get('limit', 10))
+        limit = max(1, min(limit, current_app.config['RECENT_TRANSACTIONS_MAX_LIMIT']))
+        transactions, next_cursor = dashboard.recent_transactions_page(
+            dashboard_session(), limit=limit, cursor=request.args.get('cursor')
+        )
+        response = jsonify(transactions)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/dashboard/plan-distribution', methods=['GET'])
+@api.route('/api/dashboard/plan-distribution', methods=['GET'])
+@response_cache.cached
 def get_plan_distribution():
     try:
-        result = db.session.execute(text("""
-            SELECT 
-                p.name as plan_name,
-                COUNT(s.id) as subscriber_count,
-                SUM(CASE 
-                    WHEN s.is_active THEN 1 
-                    ELSE 0 
-                END) as active_subscribers
-            FROM plans p
-            LEFT JOIN subscriptions s ON p.id = s.plan_id
-            GROUP BY p.name
-            ORDER BY subscriber_count DESC
-        """))
-        
-        plans = []
-        subscribers = []
-        active_subscribers = []
-        
-        for row in result:
-            plans.append(row[0])
-            subscribers.append(int(row[1]))
-            active_subscribers.append(int(row[2]))
-            
-        return jsonify({
-            'plans': plans,
-            'subscribers': subscribers,
-            'active_subscribers': active_subscribers
-        })
+        return jsonify(dashboard.plan_distribution(dashboard_session()))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@api.route('/api/dashboard/all', methods=['GET'])
+@response_cache.cached
+def get_dashboard_all():
+    """
+    All four dashboard payloads in one response, queried in parallel.
+
+    Keys are revenue_summary, revenue_by_country, recent_transactions and
+    plan_distribution; a failing query yields null plus a message in `errors`.
+    """
+    try:
+        refresh_country_revenue()
+        return jsonify(dashboard.fetch_all(
+            db.engine, dashboard_pool, current_app.config['DASHBOARD_STATEMENT_TIMEOUT_MS']
+        ))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@api.cli.command('rebuild-revenue-summary')
+def rebuild_revenue_summary():
+    """Recompute revenue_summary from payments and product_sales."""
+    with db.engine.begin() as connection:
+        if not rollups.install_revenue_summary_triggers(connection):
+            raise click.ClickException("payments, product_sales and products tables are required")
+        rollups.rebuild_revenue_summary(connection)
+        months = connection.exec_driver_sql("SELECT COUNT(*) FROM revenue_summary").scalar()
+    click.echo(f"Rebuilt revenue_summary: {months} month(s)")
+
+@api.cli.command('refresh-country-revenue')
+def refresh_country_revenue_command():
+    """Recompute the per-country revenue aggregate."""
+    with db.engine.begin() as connection:
+        rollups.refresh_country_revenue(connection)
+        countries = connection.exec_driver_sql("SELECT COUNT(*) FROM country_revenue").scalar()
+    click.echo(f"Refreshed country_revenue: {countries} countr{'y' if countries == 1 else 'ies'}")
+
+@api.cli.command('prune-revenue-changes')
+@click.option('--days', type=float, default=None,
+              help='Keep this many days of entries (default REVENUE_CHANGES_RETENTION_DAYS).')
+def prune_revenue_changes(days):
+    """Delete old entries from the revenue change log."""
+    if days is None:
+        days = current_app.config['REVENUE_CHANGES_RETENTION_DAYS']
+    with db.engine.begin() as connection:
+        deleted = changes.prune(connection, datetime.utcnow() - timedelta(days=days))
+    click.echo(f"Pruned {deleted} revenue change(s) older than {days:g} day(s)")
+
+def revenue_plan_checks():
+    """
+    (name, statement, index, search) for each revenue query whose plan is
+    checked: the query must use `index`, and with `search` seek into it
+    rather than scan all of it.
+    """
+    sample_date = datetime(2024, 1, 1).date()
+    return [
+        ('date range filter',
+         revenue_list_query(list(REVENUE_COLUMNS), [Revenue.date >= sample_date, Revenue.date <= sample_date]).limit(500),
+         'ix_revenue_date_id', True),
+        ('category filter, newest first',
+         revenue_list_query(list(REVENUE_COLUMNS), [Revenue.category == 'Subscriptions']).limit(500),
+         'ix_revenue_category_date', True),
+        ('keyset page',
+         revenue_list_query(list(REVENUE_COLUMNS), [revenue_keyset_filter(sample_date, 1000)]).limit(500),
+         'ix_revenue_date_id', True),
+        # Every category is needed, so walking the index is the right plan
+        ('distinct categories',
+         select(Revenue.category).distinct(),
+         'ix_revenue_category_date', False),
+    ]
+
+@api.cli.command('check-query-plans')
+def check_query_plans():
+    """EXPLAIN the revenue queries and fail if one doesn't search its index."""
+    failed = []
+    with db.engine.connect() as connection:
+        for name, statement, index, search in revenue_plan_checks():
+            with connection.begin():
+                result = check_plan(connection, statement, index, search)
+            if result.status == 'FAIL':
+                failed.append(name)
+            click.echo(f"[{result.status}] {name}: {result.message}")
+            for line in result.plan:
+                click.echo(f"    {line}")
+
+    if failed:
+        raise click.ClickException(f"{len(failed)} query plan(s) don't use their index: {', '.join(failed)}")
+
+def create_app(config_object=Config, preload_model=None):
+    """
+    Create the Flask app: load the config, set up the database (tables,
+    triggers, change log, indexes, query timing), build the shared services and register
+    the routes.
+
+    `preload_model` overrides AI_PRELOAD. Pre-fork servers pass False and start
+    loading in each worker after the fork instead (see gunicorn.conf.py), since
+    the loader thread and model worker processes don't survive a fork.
+    """
+    global ai_service, ai_cache, dashboard_pool, response_compressor, revenue_changes_enabled
+    global country_revenue_maintained
+
+    app = Flask(__name__)
+    app.config.from_object(config_object)
+    app.json = json_provider.provider_class(app.config['JSON_PROVIDER'])(app)
+    # Let browser clients read the cursor of the next recent-transactions page
+    CORS(app, expose_headers=['X-Next-Cursor'])
+    db.init_app(app)
+    app.register_blueprint(api)
+
+    ai_service = AIRecommendationService(
+        app.config['AI_MODEL_NAME'],
+        batch_max_size=app.config['AI_BATCH_MAX_SIZE'],
+        batch_wait=app.config['AI_BATCH_WAIT_MS'] / 1000.0,
+        backend=app.config['AI_BACKEND'],
+        workers=app.config['AI_WORKERS'],
+        worker_queue_depth=app.config['AI_WORKER_QUEUE_DEPTH'],
+        worker_timeout=app.config['AI_WORKER_TIMEOUT'],
+        worker_start_method=app.config['AI_WORKER_START_METHOD']
+    )
+    atexit.register(ai_service.close)
+    ai_cache = make_cache(
+        maxsize=app.config['AI_CACHE_MAX_ENTRIES'],
+        ttl=app.config['AI_CACHE_TTL'],
+        directory=app.config['AI_CACHE_DIR']
+    )
+    response_cache.backend = make_cache(
+        maxsize=app.config['HTTP_CACHE_MAX_ENTRIES'],
+        ttl=app.config['HTTP_CACHE_TTL'],
+        directory=app.config['HTTP_CACHE_DIR']
+    )
+    response_compressor = ResponseCompressor(
+        app.config['COMPRESSION_ENCODINGS'],
+        levels=app.config['COMPRESSION_LEVELS'],
+        min_size=app.config['COMPRESSION_MIN_SIZE'],
+        mimetypes=app.config['COMPRESSION_MIMETYPES'],
+        cache_entries=app.config['COMPRESSION_CACHE_ENTRIES'],
+        cache_ttl=app.config['HTTP_CACHE_TTL']
+    )
+    dashboard_pool = ThreadPoolExecutor(
+        max_workers=app.config['DASHBOARD_QUERY_WORKERS'],
+        thread_name_prefix='dashboard-query'
+    )
+
+    with app.app_context():
+        db.create_all()
+        create_indexes()
+        with db.engine.begin() as connection:
+            rollups.install_revenue_summary_triggers(connection)
+            country_revenue_maintained = rollups.install_country_revenue_triggers(connection)
+            revenue_changes_enabled = changes.install_revenue_change_triggers(connection)
+            dashboard.create_indexes(connection)
+        instrument_queries(db.engine)
+
+    if preload_model is None:
+        preload_model = app.config['AI_PRELOAD']
+    if preload_model:
+        ai_service.start_loading()
+    return app
+
+# Spawned model workers re-import this module as __mp_main__ when started with
+# `python app.py`; the guard keeps them from creating an app of their own
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
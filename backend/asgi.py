@@ -0,0 +1,13 @@
+"""
+ASGI entry point, e.g.
+
+    uvicorn asgi:app --workers 4
+
+GET /api/dashboard/* is served by async_dashboard on SQLAlchemy's async engine;
+every other route runs on the Flask app. Each worker process creates its own
+app and, with AI_PRELOAD, loads its own copy of the model.
+"""
+from app import create_app
+from async_dashboard import create_asgi_app
+
+app = create_asgi_app(create_app())
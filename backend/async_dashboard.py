@@ -0,0 +1,250 @@
+"""
+Async serving of the read-only dashboard endpoints.
+
+create_asgi_app(flask_app) returns an ASGI app that answers GET
+/api/dashboard/* itself, on SQLAlchemy's async engine (asyncpg for PostgreSQL,
+aiosqlite for SQLite), and hands every other request to the Flask app through
+asgiref's WsgiToAsgi. A dashboard read waits on the database without holding a
+thread, so a single worker serves many of them concurrently.
+
+The queries and payloads are those of dashboard.py, run with
+AsyncConnection.run_sync. Responses go through the Flask app's response cache
+(same keys, ETags and X-Cache header), so revenue writes invalidate them too,
+and are compressed like the Flask responses. Before a cached response is
+served the change log is checked like in app.watch_revenue_changes, and disk
+cache reads and writes run on the default executor.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Tuple
+from urllib.parse import parse_qsl
+
+from werkzeug.http import http_date
+
+from cache import DiskCache
+import changes
+import dashboard
+import http_cache
+import metrics
+import rollups
+
+logger = logging.getLogger(__name__)
+
+# Async driver used for each database backend
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+# Same metric as the Flask routes record (the registry returns the existing one)
+REQUEST_SECONDS = metrics.histogram(
+    'http_request_duration_seconds', 'Time to build the response, per route', ['method', 'route', 'status'])
+
+
+def async_database_url(url: str) -> str:
+    """The async-driver equivalent of a SQLAlchemy URL, e.g. postgresql:// -> postgresql+asyncpg://"""
+    from sqlalchemy.engine import make_url
+
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+class DashboardApp:
+    """
+    ASGI app serving the dashboard reads on `engine` (an AsyncEngine) and
+    passing everything else to `fallback`.
+    """
+
+    def __init__(self, flask_app, engine, response_cache, compressor, fallback,
+                 country_revenue_maintained=False, head_watcher=None):
+        self.flask_app = flask_app
+        self.config = flask_app.config
+        self.engine = engine
+        self.response_cache = response_cache
+        self.compressor = compressor
+        self.fallback = fallback
+        self.country_revenue_maintained = country_revenue_maintained
+        # Without a watcher the change log is disabled and only local writes invalidate
+        self.head_watcher = head_watcher
+        # File reads and writes would stall every request on the event loop
+        self.cache_blocks = isinstance(response_cache.backend, DiskCache)
+        self.routes = {
+            '/api/dashboard/revenue-summary': self.revenue_summary,
+            '/api/dashboard/revenue-by-country': self.revenue_by_country,
+            '/api/dashboard/recent-transactions': self.recent_transactions,
+            '/api/dashboard/plan-distribution': self.plan_distribution,
+            '/api/dashboard/all': self.all,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        handler = None
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            handler = self.routes.get(scope['path'])
+        if handler is None:
+            return await self.fallback(scope, receive, send)
+
+        started = time.perf_counter()
+        args = parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True)
+        status, headers, body = await self.respond(scope, args, handler)
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                for name, value in headers]})
+        await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else body})
+        REQUEST_SECONDS.observe(time.perf_counter() - started,
+                                method=scope['method'], route=scope['path'], status=status)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def respond(self, scope, args: List[Tuple[str, str]], handler) -> Tuple[int, list, bytes]:
+        """Serve from the response cache, or run `handler` and cache a 200 result"""
+        await self.watch_revenue_changes()
+        key = http_cache.cache_key(scope['path'], args)
+        entry = None
+        if not any(name == 'refresh' for name, _ in args):
+            entry = await self.cache_call(self.response_cache.backend.get, key)
+        cache_status = 'HIT'
+
+        if entry is None:
+            generation = self.response_cache.generation
+            try:
+                status, payload, extra_headers = await handler(dict(args))
+            except Exception as e:
+                status, payload, extra_headers = 500, {"error": str(e)}, []
+            body = self.flask_app.json.dumps(payload).encode('utf-8')
+            # Only successful responses are cached, errors are retried next time
+            if status != 200:
+                return status, self.headers([('Content-Type', 'application/json')]), body
+            entry = http_cache.make_entry(body, status, 'application/json', extra_headers)
+            await self.cache_call(self.response_cache.store, key, entry, generation)
+            cache_status = 'MISS'
+
+        request_headers = {name: value.decode('latin-1') for name, value in scope['headers']}
+        encoding, etag, body = self.compressor.variant(
+            entry['body'].encode('utf-8'), entry['etag'], entry['mimetype'],
+            request_headers.get(b'accept-encoding'), request_headers.get(b'if-none-match'), scope['path']
+        )
+        headers = [
+            ('Content-Type', entry['mimetype']),
+            ('ETag', f'"{etag}"'),
+            ('Last-Modified', http_date(entry['last_modified'])),
+            # Clients may reuse the body but must revalidate it first
+            ('Cache-Control', 'no-cache'),
+            ('X-Cache', cache_status),
+        ] + [tuple(header) for header in entry['headers']]
+        if self.compressor.compressible(entry['mimetype']):
+            headers.append(('Vary', 'Accept-Encoding'))
+        if body is None:
+            return 304, self.headers(headers), b''
+        if encoding:
+            headers.append(('Content-Encoding', encoding))
+        return entry['status'], self.headers(headers), body
+
+    async def cache_call(self, method, *args):
+        """Call a response cache method, off the event loop if the backend does file I/O"""
+        if not self.cache_blocks:
+            return method(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, method, *args)
+
+    async def watch_revenue_changes(self):
+        """app.watch_revenue_changes on the async engine, sharing its HeadWatcher"""
+        if self.head_watcher is None or not self.head_watcher.due(self.config['REVENUE_CHANGES_POLL_INTERVAL']):
+            return
+        try:
+            async with self.engine.connect() as connection:
+                latest = await connection.run_sync(changes.head)
+        except Exception as e:
+            logger.error(f"Error reading the revenue change log: {e}")
+            return
+        if self.head_watcher.advance(latest):
+            await self.cache_call(self.response_cache.invalidate)
+
+    @staticmethod
+    def headers(headers: list) -> list:
+        # Flask-CORS adds these to the Flask routes' responses
+        return headers + [('Access-Control-Allow-Origin', '*'), ('Access-Control-Expose-Headers', 'X-Next-Cursor')]
+
+    def _query(self, connection, query, *args):
+        dashboard.set_statement_timeout(connection, self.config['DASHBOARD_STATEMENT_TIMEOUT_MS'])
+        return query(connection, *args)
+
+    async def run(self, query, *args) -> Any:
+        """Run a dashboard.py query function on its own pooled async connection"""
+        async with self.engine.connect() as connection:
+            return await connection.run_sync(self._query, query, *args)
+
+    async def refresh_country_revenue(self):
+        try:
+            async with self.engine.begin() as connection:
+                await connection.run_sync(rollups.refresh_country_revenue_if_stale,
+                                          self.config['COUNTRY_REVENUE_MAX_AGE'], self.country_revenue_maintained)
+        except Exception as e:
+            # Reads fall back to the live query, so a failed refresh only costs speed
+            logger.error(f"Error refreshing country_revenue: {e}")
+
+    async def revenue_summary(self, args: Dict[str, str]):
+        return 200, await self.run(dashboard.revenue_summary), []
+
+    async def revenue_by_country(self, args: Dict[str, str]):
+        await self.refresh_country_revenue()
+        return 200, await self.run(dashboard.revenue_by_country), []
+
+    async def recent_transactions(self, args: Dict[str, str]):
+        try:
+            limit = int(args.get('limit', 10))
+            limit = max(1, min(limit, self.config['RECENT_TRANSACTIONS_MAX_LIMIT']))
+            transactions, next_cursor = await self.run(
+                dashboard.recent_transactions_page, limit, args.get('cursor')
+            )
+        except ValueError as e:
+            return 400, {"error": str(e)}, []
+        return 200, transactions, [('X-Next-Cursor', next_cursor)] if next_cursor else []
+
+    async def plan_distribution(self, args: Dict[str, str]):
+        return 200, await self.run(dashboard.plan_distribution), []
+
+    async def all(self, args: Dict[str, str]):
+        """Same payload as dashboard.fetch_all, with the queries run as concurrent coroutines"""
+        await self.refresh_country_revenue()
+        names = list(dashboard.QUERIES)
+        results = await asyncio.gather(*(self.run(dashboard.QUERIES[name]) for name in names),
+                                       return_exceptions=True)
+        payload = {}
+        errors = {}
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                payload[name] = None
+                errors[name] = str(result)
+            else:
+                payload[name] = result
+        payload['errors'] = errors
+        return 200, payload, []
+
+
+def create_asgi_app(flask_app):
+    """Wrap `flask_app` (from app.create_app) with the async dashboard endpoints"""
+    from asgiref.wsgi import WsgiToAsgi
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from app import (country_revenue_maintained, instrument_queries, response_cache, response_compressor,
+                     revenue_changes_enabled, revenue_head_watcher)
+
+    url = flask_app.config['ASYNC_DATABASE_URL'] or async_database_url(flask_app.config['SQLALCHEMY_DATABASE_URI'])
+    engine = create_async_engine(url, **flask_app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+    instrument_queries(engine.sync_engine)
+    return DashboardApp(flask_app, engine, response_cache, response_compressor, WsgiToAsgi(flask_app),
+                        country_revenue_maintained=country_revenue_maintained,
+                        head_watcher=revenue_head_watcher if revenue_changes_enabled else None)
@@ -0,0 +1,77 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class BatchScheduler:
+    """
+    Micro-batching scheduler for text generation.
+
+    Callers submit (prompt, max_length) requests from any thread. A single worker
+    thread collects the requests that arrive within `max_wait` seconds of the first
+    one (up to `max_batch_size`), runs them through `run_batch` in one call and
+    resolves each caller's Future with its own result.
+    """
+
+    def __init__(self, run_batch: Callable[[List[str], List[int]], List[str]],
+                 max_batch_size: int = 8, max_wait: float = 0.02):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait)
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def submit(self, prompt: str, max_length: int) -> Future:
+        """Queue a prompt for generation and return a Future for its text"""
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((prompt, max_length, future))
+        return future
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='ai-batch-scheduler', daemon=True)
+                self._worker.start()
+
+    def _collect(self) -> List[Tuple[str, int, Future]]:
+        """Block for the first request, then gather more until the window closes"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            prompts = [item[0] for item in batch]
+            max_lengths = [item[1] for item in batch]
+            logger.info(f"Running generation batch of {len(batch)} prompt(s)")
+            try:
+                results = self.run_batch(prompts, max_lengths)
+            except Exception as e:
+                logger.error(f"Error running generation batch: {e}")
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
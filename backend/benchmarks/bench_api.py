@@ -0,0 +1,438 @@
+"""
+Load-test every route of the API with concurrent clients.
+
+Seeds a database (a throwaway SQLite file by default, or --database-url, e.g.
+PostgreSQL) with configurable volumes, serves the app on a local port and
+drives each route with --clients concurrent HTTP clients. Reports p50/p95/p99
+latency, throughput and server memory per route, and writes the results as
+JSON so runs on two commits can be compared with --compare.
+
+The model is replaced by a deterministic stub (--ai stub, the default) so runs
+need no download or network; --ai model runs a real (e.g. tiny) model instead.
+
+    python benchmarks/bench_api.py --requests 200 --clients 8 --output before.json
+    python benchmarks/bench_api.py --requests 200 --clients 8 --compare before.json
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from types import SimpleNamespace
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARKS_DIR)
+
+import seed  # noqa: E402  (benchmarks/seed.py, next to this script)
+
+STUB_ANALYSIS = (
+    "Observations: revenue is stable with a mild upward trend.\n\n"
+    "Price: keep prices unchanged and test a higher tier.\n\n"
+    "Product: focus on the best selling categories."
+)
+
+
+class WordTokenizer:
+    """Whitespace tokenizer with the call signature the service uses for budgeting"""
+    pad_token = eos_token = ''
+
+    def __call__(self, texts, add_special_tokens=False, **kwargs):
+        return {'input_ids': [text.split() for text in texts]}
+
+
+def make_stub_service(base_class, token_delay: float, context_window: int = 1024):
+    """
+    AIRecommendationService whose model is replaced by canned text.
+
+    Requests still go through the batch scheduler and the prompt builder; only
+    the generate call is stubbed. Each generated word takes `token_delay`
+    seconds, to stand in for model latency.
+    """
+    class StubAIService(base_class):
+        def load_model(self):
+            self.tokenizer = WordTokenizer()
+            self.model = SimpleNamespace(config=SimpleNamespace(n_positions=context_window))
+            self.device = 'cpu'
+            self.load_time = 0.0
+            self.status = 'ready'
+            self._ready.set()
+
+        def _stub_words(self, max_length: int):
+            return STUB_ANALYSIS.split(' ')[:max(1, max_length)]
+
+        def _generate_batch(self, prompts, max_lengths):
+            words = [self._stub_words(max_length) for max_length in max_lengths]
+            time.sleep(token_delay * max(len(w) for w in words))
+            return [(' '.join(w), len(w)) for w in words]
+
+        def _stream_local(self, prompt, max_length, usage):
+            for index, word in enumerate(self._stub_words(max_length)):
+                time.sleep(token_delay)
+                usage['tokens'] = index + 1
+                yield word if index == 0 else ' ' + word
+
+    return StubAIService(batch_max_size=8, batch_wait=0.005)
+
+
+def revenue_row(index: int) -> dict:
+    return {
+        'date': f"2024-{index % 12 + 1:02d}-{index % 28 + 1:02d}",
+        'amount': round(10 + index % 490, 2),
+        'category': seed.CATEGORIES[index % len(seed.CATEGORIES)],
+        'description': f'Benchmark row {index}'
+    }
+
+
+def scenarios(revenue_ids, bulk_size: int):
+    """
+    (name, route rule, method, request factory) per benchmarked request shape.
+
+    A request factory takes a sequence number and returns (path, json body).
+    Read-only scenarios come first; the write scenarios run last because they
+    invalidate the caches the reads would otherwise hit. `revenue_ids` are
+    seeded ids, handed out one per PUT and DELETE request.
+    """
+    put_ids = iter(revenue_ids[:len(revenue_ids) // 2])
+    delete_ids = iter(revenue_ids[len(revenue_ids) // 2:])
+    get_ids = itertools.cycle(revenue_ids)
+    next_id = lambda ids: next(ids, revenue_ids[0])  # noqa: E731
+
+    def get(path):
+        return lambda i: (path, None)
+
+    # A later page of recent transactions: the payments before the middle of the seeded range
+    import dashboard  # backend/, on sys.path once main() has set up the app
+    recent_cursor = dashboard.encode_cursor(seed.START + timedelta(days=seed.DAYS // 2), 2 ** 31 - 1)
+
+    return [
+        ('hello', '/api/hello', 'GET', get('/api/hello')),
+        ('messages', '/api/messages', 'GET', get('/api/messages')),
+        ('revenue', '/api/revenue', 'GET', get('/api/revenue')),
+        ('revenue_page', '/api/revenue', 'GET', get('/api/revenue?limit=100&category=Services')),
+        ('revenue_columnar', '/api/revenue', 'GET', get('/api/revenue?layout=columnar')),
+        ('revenue_refresh', '/api/revenue', 'GET',
+         get('/api/revenue?limit=100&start_date=2023-01-01&refresh=1')),
+        ('revenue_single', '/api/revenue/<int:id>', 'GET',
+         lambda i: (f'/api/revenue/{next(get_ids)}', None)),
+        ('revenue_categories', '/api/revenue/categories', 'GET', get('/api/revenue/categories')),
+        ('revenue_changes', '/api/revenue/changes', 'GET', get('/api/revenue/changes?since=0&limit=100')),
+        ('revenue_changes_stream', '/api/revenue/changes/stream', 'GET', get('/api/revenue/changes/stream?since=0')),
+        ('revenue_export_ndjson', '/api/revenue/export', 'GET', get('/api/revenue/export?format=ndjson')),
+        ('revenue_export_csv', '/api/revenue/export', 'GET', get('/api/revenue/export?format=csv')),
+        ('dashboard_summary', '/api/dashboard/revenue-summary', 'GET',
+         get('/api/dashboard/revenue-summary?refresh=1')),
+        ('dashboard_country', '/api/dashboard/revenue-by-country', 'GET',
+         get('/api/dashboard/revenue-by-country?refresh=1')),
+        ('dashboard_recent', '/api/dashboard/recent-transactions', 'GET',
+         get('/api/dashboard/recent-transactions?refresh=1')),
+        ('dashboard_recent_page', '/api/dashboard/recent-transactions', 'GET',
+         get(f'/api/dashboard/recent-transactions?limit=10&cursor={recent_cursor}&refresh=1')),
+        ('dashboard_plans', '/api/dashboard/plan-distribution', 'GET',
+         get('/api/dashboard/plan-distribution?refresh=1')),
+        ('dashboard_all', '/api/dashboard/all', 'GET', get('/api/dashboard/all?refresh=1')),
+        ('dashboard_all_cached', '/api/dashboard/all', 'GET', get('/api/dashboard/all')),
+        ('ai_status', '/api/ai/status', 'GET', get('/api/ai/status')),
+        ('ai_recommendations_insights', '/api/ai/recommendations', 'GET',
+         get('/api/ai/recommendations?llm=0')),
+        ('ai_recommendations_llm', '/api/ai/recommendations', 'GET',
+         get('/api/ai/recommendations?llm=1&refresh=1')),
+        ('ai_recommendations_stream', '/api/ai/recommendations/stream', 'GET',
+         get('/api/ai/recommendations/stream?llm=1&refresh=1')),
+        ('ai_marketing_ideas', '/api/ai/marketing-ideas', 'GET', get('/api/ai/marketing-ideas')),
+        ('ai_marketing_ideas_stream', '/api/ai/marketing-ideas/stream', 'GET',
+         get('/api/ai/marketing-ideas/stream')),
+        ('metrics', '/api/metrics', 'GET', get('/api/metrics')),
+        ('messages_create', '/api/messages', 'POST',
+         lambda i: ('/api/messages', {'content': f'Benchmark message {i}'})),
+        ('revenue_create', '/api/revenue', 'POST', lambda i: ('/api/revenue', revenue_row(i))),
+        ('revenue_bulk', '/api/revenue/bulk', 'POST',
+         lambda i: ('/api/revenue/bulk', [revenue_row(i * bulk_size + j) for j in range(bulk_size)])),
+        ('revenue_update', '/api/revenue/<int:id>', 'PUT',
+         lambda i: (f'/api/revenue/{next_id(put_ids)}', revenue_row(i))),
+        ('revenue_delete', '/api/revenue/<int:id>', 'DELETE',
+         lambda i: (f'/api/revenue/{next_id(delete_ids)}', None)),
+    ]
+
+
+def send(base_url: str, method: str, path: str, body=None, accept_encoding=None):
+    """Send one request and read the whole response; returns (status, bytes read)"""
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(base_url + path, data=data, method=method)
+    if accept_encoding:
+        # Bytes read are then the compressed size; the body isn't decoded
+        request.add_header('Accept-Encoding', accept_encoding)
+    if data is not None:
+        request.add_header('Content-Type', 'application/json')
+    try:
+        with urllib.request.urlopen(request, timeout=300) as response:
+            return response.status, len(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, len(e.read())
+
+
+def serve_wsgi(flask_app):
+    """Serve the Flask app on a free local port; returns (base_url, stop)"""
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-server', daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server.shutdown
+
+
+def serve_asgi(flask_app):
+    """Serve asgi.py's app (async dashboard reads) with uvicorn on a free local port"""
+    import uvicorn
+    from async_dashboard import create_asgi_app
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(create_asgi_app(flask_app), host='127.0.0.1', port=port,
+                                           log_level='warning'))
+    thread = threading.Thread(target=server.run, name='bench-server', daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            sys.exit("uvicorn failed to start")
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+
+    return f"http://127.0.0.1:{port}", stop
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def current_rss_mb() -> float:
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except OSError:
+        return peak_rss_mb()
+
+
+def run_scenario(base_url: str, method: str, factory, requests: int, clients: int, warmup: int,
+                 accept_encoding=None) -> dict:
+    for i in range(warmup):
+        send(base_url, method, *factory(-1 - i), accept_encoding=accept_encoding)
+
+    counter = itertools.count()
+    lock = threading.Lock()
+    latencies, statuses = [], {}
+    bytes_read = [0]
+
+    def client():
+        while True:
+            with lock:
+                i = next(counter)
+                if i >= requests:
+                    return
+                path, body = factory(i)
+            started = time.perf_counter()
+            try:
+                status, size = send(base_url, method, path, body, accept_encoding)
+            except Exception:
+                status, size = 'error', 0
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                bytes_read[0] += size
+
+    rss_before = current_rss_mb()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        for _ in range(clients):
+            executor.submit(client)
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    ok = sum(count for status, count in statuses.items() if status.startswith(('2', '3')))
+    return {
+        'requests': len(latencies),
+        'ok': ok,
+        'statuses': statuses,
+        'wall_seconds': round(wall, 4),
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else 0.0,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+            'p50': round(percentile(latencies, 50) * 1000, 3),
+            'p95': round(percentile(latencies, 95) * 1000, 3),
+            'p99': round(percentile(latencies, 99) * 1000, 3),
+            'max': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+        'bytes_per_response': round(bytes_read[0] / len(latencies)) if latencies else 0,
+        'rss_mb': {'before': round(rss_before, 1), 'after': round(current_rss_mb(), 1),
+                   'peak': round(peak_rss_mb(), 1)},
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results: dict, baseline: dict, threshold: float):
+    """Print p95 and throughput changes against `baseline`; returns the regressed scenarios"""
+    regressions = []
+    print(f"\n{'scenario':32} {'p95 ms':>10} {'base':>10} {'change':>8} {'rps':>9} {'base':>9}")
+    for name, result in results['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None:
+            continue
+        p95, base_p95 = result['latency_ms']['p95'], base['latency_ms']['p95']
+        change = (p95 - base_p95) / base_p95 * 100 if base_p95 else 0.0
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:32} {p95:10.2f} {base_p95:10.2f} {change:+7.1f}% "
+              f"{result['throughput_rps']:9.1f} {base['throughput_rps']:9.1f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', help='database to seed and serve (default: a temporary SQLite file)')
+    parser.add_argument('--seed', type=int, default=42)
+    seed.add_count_arguments(parser)
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients per scenario')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--warmup', type=int, default=2, help='untimed requests per scenario')
+    parser.add_argument('--bulk-size', type=int, default=100, help='rows per POST /api/revenue/bulk')
+    parser.add_argument('--only', nargs='*', help='run only these scenarios')
+    parser.add_argument('--ai', choices=['stub', 'model'], default='stub',
+                        help='stub: canned text, no model; model: load --model')
+    parser.add_argument('--model', help='model name or local path for --ai model')
+    parser.add_argument('--stub-token-delay', type=float, default=0.0,
+                        help='seconds per generated word of the stub model')
+    parser.add_argument('--server', choices=['wsgi', 'asgi'], default='wsgi',
+                        help='wsgi: werkzeug; asgi: uvicorn with the async dashboard endpoints (asgi.py)')
+    parser.add_argument('--accept-encoding', help='Accept-Encoding sent with every request, e.g. gzip')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='results JSON of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='p95 increase (%%) reported as a regression by --compare')
+    args = parser.parse_args()
+
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    started = time.perf_counter()
+    written = seed.seed_database(database_url, seed.counts_from_args(args), args.seed)
+    print(f"seeded {sum(written.values())} rows in {time.perf_counter() - started:.1f}s")
+
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['AI_PRELOAD'] = 'false'
+    # Change streams end after their first check of the log, so each request is one catch-up read
+    os.environ.setdefault('REVENUE_CHANGES_STREAM_TIMEOUT', '0')
+    if args.model:
+        os.environ['AI_MODEL_NAME'] = args.model
+    sys.path.insert(0, BACKEND_DIR)
+    import app as app_module
+    import rollups
+
+    flask_app = app_module.create_app()
+    with flask_app.app_context():
+        dialect = app_module.db.engine.dialect.name
+        # Triggers only track rows written after the app installed them
+        with app_module.db.engine.begin() as connection:
+            rollups.rebuild_revenue_summary(connection)
+
+    if args.ai == 'stub':
+        app_module.ai_service = make_stub_service(app_module.AIRecommendationService, args.stub_token_delay)
+    if not app_module.ai_service.wait_until_ready(600):
+        sys.exit(f"AI model failed to load: {app_module.ai_service.load_error}")
+
+    # Per-request access and generation logs would dominate the timings
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    base_url, stop_server = (serve_asgi if args.server == 'asgi' else serve_wsgi)(flask_app)
+
+    revenue_ids = list(range(1, written['revenue'] + 1))
+    selected = scenarios(revenue_ids, args.bulk_size)
+    if args.only:
+        selected = [scenario for scenario in selected if scenario[0] in args.only]
+
+    covered = {(rule, method) for _, rule, method, _ in scenarios(revenue_ids, args.bulk_size)}
+    for rule in flask_app.url_map.iter_rules():
+        for method in rule.methods - {'HEAD', 'OPTIONS'}:
+            if rule.endpoint != 'static' and (rule.rule, method) not in covered:
+                print(f"warning: {method} {rule.rule} has no scenario")
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'database': dialect,
+        'parameters': {
+            'clients': args.clients, 'requests': args.requests, 'warmup': args.warmup,
+            'bulk_size': args.bulk_size, 'ai': args.ai, 'model': args.model,
+            'stub_token_delay': args.stub_token_delay, 'seed': args.seed, 'rows': written,
+            'accept_encoding': args.accept_encoding, 'server': args.server,
+        },
+        'scenarios': {},
+    }
+
+    print(f"\n{'scenario':32} {'ok':>6} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rss MB':>8}")
+    try:
+        for name, _, method, factory in selected:
+            result = run_scenario(base_url, method, factory, args.requests, args.clients, args.warmup,
+                                  args.accept_encoding)
+            results['scenarios'][name] = result
+            latency = result['latency_ms']
+            print(f"{name:32} {result['ok']:6d} {result['throughput_rps']:9.1f} {latency['p50']:9.2f} "
+                  f"{latency['p95']:9.2f} {latency['p99']:9.2f} {result['rss_mb']['after']:8.1f}")
+    finally:
+        stop_server()
+        app_module.ai_service.close()
+
+    with flask_app.app_context():
+        # Connections the pool holds after the run, to check it scaled without exhaustion
+        results['db_pool'] = app_module.db.engine.pool.status()
+    print(f"\ndb pool: {results['db_pool']}")
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+        print(f"\nresults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} scenario(s) regressed by more than {args.threshold:g}% at p95")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Compare rows/sec of POST /api/revenue (one record per request) against
+POST /api/revenue/bulk on a throwaway SQLite database.
+
+    python benchmarks/bench_bulk_insert.py --rows 2000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_rows(count):
+    categories = ['Subscriptions', 'Products', 'Services', 'Consulting']
+    start = date(2024, 1, 1)
+    return [{
+        'date': (start + timedelta(days=random.randrange(365))).isoformat(),
+        'amount': round(random.uniform(5, 500), 2),
+        'category': random.choice(categories),
+        'description': f'Benchmark row {i}'
+    } for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['AI_PRELOAD'] = 'false'
+    sys.path.insert(0, BACKEND_DIR)
+    from app import create_app
+
+    client = create_app().test_client()
+    rows = make_rows(args.rows)
+
+    started = time.perf_counter()
+    for row in rows:
+        client.post('/api/revenue', json=row)
+    single = time.perf_counter() - started
+
+    started = time.perf_counter()
+    response = client.post('/api/revenue/bulk', json=rows)
+    bulk = time.perf_counter() - started
+    assert response.json['inserted'] == args.rows, response.json
+
+    print(f"rows:          {args.rows}")
+    print(f"single insert: {single:8.3f}s  {args.rows / single:10.0f} rows/sec")
+    print(f"bulk insert:   {bulk:8.3f}s  {args.rows / bulk:10.0f} rows/sec")
+    print(f"speedup:       {single / bulk:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Compare the AI inference backends (fp32, int8, onnx) on the same prompts:
+model load time, latency of the first (warm-up) token, generated tokens/sec
+and peak RSS.
+
+Each backend runs in its own subprocess so peak RSS and load time are not
+skewed by models loaded earlier.
+
+    python benchmarks/bench_inference.py --backends fp32 int8 --runs 3
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROMPTS = [
+    "As a business analyst, analyze the following revenue data and provide insights:\n"
+    "Total Revenue: $125,400.00\nAverage Monthly Revenue: $10,450.00\n"
+    "Monthly Breakdown:\n- 2024-01: $9,800.00 (42 transactions)\n"
+    "- 2024-02: $11,250.00 (47 transactions)\n\nKey Trends and Insights:",
+    "Based on the following revenue analysis, suggest 3-5 specific growth strategies:\n"
+    "Revenue grew 12% month over month, driven by subscriptions.\n\nGrowth Strategies:",
+    "Generate 5 creative marketing ideas for a business with these characteristics:\n"
+    "- Total Revenue: $125,400.00\n- Top Revenue Category: Subscriptions\n\nMarketing Ideas:",
+]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_backend(model_name, backend, max_new_tokens, runs):
+    """Measure one backend in this process and return its results"""
+    import torch
+    from transformers import AutoTokenizer
+    sys.path.insert(0, BACKEND_DIR)
+    from ai_service import AIRecommendationService
+    from model_backends import load_causal_lm
+
+    torch.manual_seed(0)
+    service = AIRecommendationService(model_name, backend=backend)
+    try:
+        service.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        # The model load alone; service.load_model() would also run a warm-up generation
+        started = time.perf_counter()
+        service.model, service.device = load_causal_lm(model_name, backend)
+        load_time = time.perf_counter() - started
+    except Exception as e:
+        return {'backend': backend, 'error': str(e)}
+
+    kwargs = service._generation_kwargs()
+    # Fixed length output so every backend generates the same number of tokens
+    kwargs.update(do_sample=False, min_new_tokens=max_new_tokens)
+    tokens = 0
+    elapsed = 0.0
+    with torch.inference_mode():
+        # The first call of a fresh model pays for lazy initialisation, so it is
+        # reported on its own and kept out of tokens/sec
+        inputs, _ = service._prepare_inputs([PROMPTS[0]], 1)
+        started = time.perf_counter()
+        service.model.generate(
+            input_ids=inputs.input_ids,
+            attention_mask=inputs.attention_mask,
+            max_new_tokens=1,
+            **dict(kwargs, min_new_tokens=1)
+        )
+        first_token_time = time.perf_counter() - started
+
+        for _ in range(runs):
+            for prompt in PROMPTS:
+                inputs, new_tokens = service._prepare_inputs([prompt], max_new_tokens)
+                started = time.perf_counter()
+                output = service.model.generate(
+                    input_ids=inputs.input_ids,
+                    attention_mask=inputs.attention_mask,
+                    max_new_tokens=new_tokens,
+                    **kwargs
+                )
+                elapsed += time.perf_counter() - started
+                tokens += output.shape[1] - inputs.input_ids.shape[1]
+
+    return {
+        'backend': backend,
+        'load_seconds': round(load_time, 3),
+        'first_token_seconds': round(first_token_time, 3),
+        'tokens': tokens,
+        'tokens_per_second': round(tokens / elapsed, 2),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--model', default=os.environ.get('AI_MODEL_NAME', 'microsoft/DialoGPT-medium'))
+    parser.add_argument('--backends', nargs='+', default=['fp32', 'int8', 'onnx'])
+    parser.add_argument('--max-new-tokens', type=int, default=64)
+    parser.add_argument('--runs', type=int, default=2)
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_backend(args.model, args.worker, args.max_new_tokens, args.runs)
+        print(json.dumps(result))
+        return
+
+    results = []
+    for backend in args.backends:
+        command = [sys.executable, os.path.abspath(__file__), '--worker', backend,
+                   '--model', args.model, '--max-new-tokens', str(args.max_new_tokens),
+                   '--runs', str(args.runs)]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        lines = completed.stdout.strip().splitlines()
+        if completed.returncode != 0 or not lines:
+            results.append({'backend': backend, 'error': completed.stderr.strip().splitlines()[-1:]})
+        else:
+            results.append(json.loads(lines[-1]))
+
+    if args.json:
+        print(json.dumps({'model': args.model, 'results': results}, indent=2))
+        return
+
+    print(f"model: {args.model}")
+    print(f"{'backend':8} {'load (s)':>9} {'first token (s)':>16} {'tokens/sec':>11} {'peak RSS (MB)':>14}")
+    for result in results:
+        if 'error' in result:
+            print(f"{result['backend']:8} error: {result['error']}")
+        else:
+            print(f"{result['backend']:8} {result['load_seconds']:9.2f} {result['first_token_seconds']:16.2f} "
+                  f"{result['tokens_per_second']:11.1f} {result['peak_rss_mb']:14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Compare serialization time and payload size of GET /api/revenue responses:
+the original shape (per-row dicts with isoformat()'d values through the stdlib
+json module) against the row and columnar layouts built from query tuples, with
+the stdlib and orjson JSON providers.
+
+    python benchmarks/bench_serialization.py --rows 100000
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIELDS = ['id', 'date', 'amount', 'category', 'description', 'created_at']
+
+
+def make_rows(count):
+    """Tuples shaped like the revenue query's rows"""
+    categories = ['Subscriptions', 'Products', 'Services', 'Consulting']
+    start = date(2024, 1, 1)
+    created_at = datetime(2024, 6, 1, 12, 30, 15, 123456)
+    return [(
+        i,
+        start + timedelta(days=random.randrange(365)),
+        round(random.uniform(5, 500), 2),
+        random.choice(categories),
+        f'Benchmark row {i}',
+        created_at
+    ) for i in range(count)]
+
+
+def original(rows):
+    # What the handler did before: convert every value, then stdlib jsonify
+    def json_value(value):
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return value
+    payload = [{name: json_value(value) for name, value in zip(FIELDS, row)} for row in rows]
+    return json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def best_of(repeat, fn, *args):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = fn(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5, help='runs per case; the fastest is reported')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    from flask import Flask
+
+    import json_provider
+    from app import revenue_payload
+
+    random.seed(42)
+    rows = make_rows(args.rows)
+    app = Flask(__name__)
+
+    cases = [('original rows, stdlib', original, rows)]
+    providers = [('stdlib', json_provider.StdlibJSONProvider(app))]
+    if json_provider.orjson is not None:
+        providers.append(('orjson', json_provider.OrjsonProvider(app)))
+    for name, provider in providers:
+        for layout in ('rows', 'columnar'):
+            def serialize(rows, provider=provider, layout=layout):
+                with app.app_context():
+                    return provider.response(revenue_payload(FIELDS, rows, layout)).get_data()
+            cases.append((f'{layout}, {name}', serialize, rows))
+
+    results = []
+    for name, fn, data in cases:
+        elapsed, body = best_of(args.repeat, fn, data)
+        results.append({
+            'case': name,
+            'seconds': round(elapsed, 4),
+            'rows_per_second': round(args.rows / elapsed),
+            'bytes': len(body),
+            'gzip_bytes': len(gzip.compress(body, 6)),
+        })
+
+    if args.json:
+        print(json.dumps({'rows': args.rows, 'results': results}, indent=2))
+        return
+
+    baseline = results[0]
+    print(f"rows: {args.rows}")
+    print(f"{'case':24} {'ms':>9} {'speedup':>8} {'bytes':>11} {'gzip bytes':>11}")
+    for result in results:
+        print(f"{result['case']:24} {result['seconds'] * 1000:9.1f} "
+              f"{baseline['seconds'] / result['seconds']:7.1f}x {result['bytes']:11d} {result['gzip_bytes']:11d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""
+Seed a database with synthetic dashboard and revenue data for benchmarks.
+
+Creates the externally managed tables (customers, plans, subscriptions,
+payments, products, product_sales) with the same columns as the SQL sample in
+the README and fills them, plus the app's own revenue table, with
+deterministic random data. Works on SQLite and PostgreSQL.
+
+    python benchmarks/seed.py --database-url sqlite:////tmp/bench.db --payments 50000
+"""
+import argparse
+import random
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import (Boolean, Column, Date, DateTime, Float, Integer, MetaData, Numeric, String,
+                        Table, Text, create_engine, insert)
+
+DEFAULT_COUNTS = {
+    'customers': 1000,
+    'plans': 4,
+    'subscriptions': 1500,
+    'payments': 20000,
+    'products': 20,
+    'product_sales': 10000,
+    'revenue': 20000,
+}
+
+COUNTRIES = ['USA', 'UK', 'India', 'Germany', 'France', 'Canada', 'Australia', 'Brazil',
+             'Japan', 'Spain', 'Italy', 'Mexico', None]
+PAYMENT_METHODS = ['Credit Card', 'PayPal', 'UPI', 'Bank Transfer']
+CATEGORIES = ['Subscriptions', 'Products', 'Services', 'Consulting', 'Training', 'Support']
+PLANS = [('Basic', 9.99), ('Pro', 29.99), ('Business', 79.99), ('Enterprise', 199.99)]
+
+metadata = MetaData()
+
+customers = Table(
+    'customers', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(100)),
+    Column('email', String(100)),
+    Column('country', String(50)),
+    Column('created_at', DateTime, default=datetime.utcnow),
+)
+plans = Table(
+    'plans', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(50)),
+    Column('monthly_cost', Numeric),
+    Column('annual_cost', Numeric),
+)
+subscriptions = Table(
+    'subscriptions', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('customer_id', Integer),
+    Column('plan_id', Integer),
+    Column('start_date', Date),
+    Column('end_date', Date),
+    Column('is_active', Boolean),
+)
+payments = Table(
+    'payments', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('customer_id', Integer),
+    Column('amount', Numeric),
+    Column('payment_date', Date),
+    Column('payment_method', String(20)),
+)
+products = Table(
+    'products', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(100)),
+    Column('description', Text),
+    Column('price', Numeric),
+)
+product_sales = Table(
+    'product_sales', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('customer_id', Integer),
+    Column('product_id', Integer),
+    Column('sale_date', Date),
+)
+revenue = Table(
+    'revenue', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('date', Date, nullable=False),
+    # Same column types as the app's Revenue model
+    Column('amount', Float, nullable=False),
+    Column('category', String(100)),
+    Column('description', Text),
+    Column('created_at', DateTime),
+)
+
+# Spread generated dates over this many days ending on START + DAYS
+START = date(2022, 1, 1)
+DAYS = 3 * 365
+
+
+def _day(rng: random.Random) -> date:
+    return START + timedelta(days=rng.randrange(DAYS))
+
+
+def _rows(counts, rng: random.Random):
+    """Generated rows per table, in foreign-key order"""
+    customer_count = max(1, counts['customers'])
+    plan_count = max(1, min(counts['plans'], len(PLANS)))
+    product_count = max(1, counts['products'])
+    created_at = datetime.utcnow()
+
+    yield customers, ({
+        'id': i, 'name': f'Customer {i}', 'email': f'customer{i}@example.com',
+        'country': rng.choice(COUNTRIES), 'created_at': created_at,
+    } for i in range(1, customer_count + 1))
+    yield plans, ({
+        'id': i, 'name': PLANS[i - 1][0], 'monthly_cost': PLANS[i - 1][1],
+        'annual_cost': round(PLANS[i - 1][1] * 10, 2),
+    } for i in range(1, plan_count + 1))
+    yield products, ({
+        'id': i, 'name': f'Product {i}', 'description': f'Add-on number {i}',
+        'price': round(rng.uniform(5, 200), 2),
+    } for i in range(1, product_count + 1))
+    yield subscriptions, ({
+        'id': i, 'customer_id': rng.randint(1, customer_count), 'plan_id': rng.randint(1, plan_count),
+        'start_date': _day(rng), 'end_date': None, 'is_active': rng.random() < 0.8,
+    } for i in range(1, counts['subscriptions'] + 1))
+    yield payments, ({
+        'id': i, 'customer_id': rng.randint(1, customer_count),
+        'amount': round(rng.uniform(5, 500), 2), 'payment_date': _day(rng),
+        'payment_method': rng.choice(PAYMENT_METHODS),
+    } for i in range(1, counts['payments'] + 1))
+    yield product_sales, ({
+        'id': i, 'customer_id': rng.randint(1, customer_count),
+        'product_id': rng.randint(1, product_count), 'sale_date': _day(rng),
+    } for i in range(1, counts['product_sales'] + 1))
+    yield revenue, ({
+        'id': i, 'date': _day(rng), 'amount': round(rng.uniform(5, 1000), 2),
+        'category': rng.choice(CATEGORIES), 'description': f'Seeded revenue {i}',
+        'created_at': created_at,
+    } for i in range(1, counts['revenue'] + 1))
+
+
+def _chunks(rows, size: int):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def seed_database(database_url: str, counts=None, seed: int = 42, chunk_size: int = 5000):
+    """
+    Drop and recreate the seeded tables in `database_url` and fill them.
+
+    Returns the number of rows written per table. Run it before the app starts,
+    so the app installs its triggers and indexes on the seeded tables.
+    """
+    counts = {**DEFAULT_COUNTS, **(counts or {})}
+    rng = random.Random(seed)
+    engine = create_engine(database_url)
+    written = {}
+    try:
+        metadata.drop_all(engine)
+        metadata.create_all(engine)
+        with engine.begin() as connection:
+            for table, rows in _rows(counts, rng):
+                written[table.name] = 0
+                for chunk in _chunks(rows, chunk_size):
+                    connection.execute(insert(table), chunk)
+                    written[table.name] += len(chunk)
+            if engine.dialect.name == 'postgresql':
+                # Explicit ids don't advance the SERIAL sequences
+                for table in metadata.sorted_tables:
+                    connection.exec_driver_sql(
+                        f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                        f"COALESCE((SELECT MAX(id) FROM {table.name}), 0) + 1, false)"
+                    )
+    finally:
+        engine.dispose()
+    return written
+
+
+def add_count_arguments(parser: argparse.ArgumentParser):
+    for table, count in DEFAULT_COUNTS.items():
+        parser.add_argument(f"--{table.replace('_', '-')}", type=int, default=count,
+                            help=f"rows in {table} (default {count})")
+
+
+def counts_from_args(args) -> dict:
+    return {table: getattr(args, table) for table in DEFAULT_COUNTS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--seed', type=int, default=42)
+    add_count_arguments(parser)
+    args = parser.parse_args()
+
+    written = seed_database(args.database_url, counts_from_args(args), args.seed)
+    for table, count in written.items():
+        print(f"{table:15} {count:10d}")
+
+
+if __name__ == '__main__':
+    main()
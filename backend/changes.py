@@ -0,0 +1,207 @@
+"""
+Append-only change log of the revenue table.
+
+Row-level triggers append every insert, update and delete on `revenue` to
+`revenue_changes` in the same transaction as the write, so the log covers the
+API handlers, bulk uploads and writes made outside the app alike. Entries are
+numbered by `seq` and carry the row as written (null for deletes); readers ask
+for the entries after the last seq they saw and apply them as deltas instead
+of re-reading the table.
+
+On PostgreSQL the trigger first takes a transaction-level advisory lock, so
+revenue writes commit in seq order and a reader can't see seq N+1 while N is
+still uncommitted. SQLite serializes writers anyway.
+"""
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import DateTime, Integer, bindparam, inspect, text
+
+logger = logging.getLogger(__name__)
+
+# Same keys and formats as Revenue.to_dict()
+_SQLITE_ROW = """json_object('id', {row}.id, 'date', {row}.date, 'amount', {row}.amount,
+    'category', {row}.category, 'description', {row}.description,
+    'created_at', replace({row}.created_at, ' ', 'T'))"""
+
+_SQLITE_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+
+def _sqlite_triggers():
+    def append(op, row, data):
+        return f"""CREATE TRIGGER IF NOT EXISTS revenue_changes_{op}
+            AFTER {op.upper()} ON revenue
+            BEGIN
+                INSERT INTO revenue_changes (revenue_id, op, data, changed_at)
+                VALUES ({row}.id, '{op}', {data}, {_SQLITE_NOW});
+            END"""
+
+    return [
+        append('insert', 'NEW', _SQLITE_ROW.format(row='NEW')),
+        append('update', 'NEW', _SQLITE_ROW.format(row='NEW')),
+        append('delete', 'OLD', 'NULL'),
+    ]
+
+
+POSTGRES_TRIGGERS = [
+    """CREATE OR REPLACE FUNCTION revenue_changes_append() RETURNS trigger AS $$
+    BEGIN
+        -- Held until commit: the next writer gets its seq after this one is visible
+        PERFORM pg_advisory_xact_lock(hashtext('revenue_changes'));
+        IF TG_OP = 'DELETE' THEN
+            INSERT INTO revenue_changes (revenue_id, op, data, changed_at)
+            VALUES (OLD.id, 'delete', NULL, now() AT TIME ZONE 'utc');
+        ELSE
+            INSERT INTO revenue_changes (revenue_id, op, data, changed_at)
+            VALUES (NEW.id, lower(TG_OP), json_build_object(
+                'id', NEW.id, 'date', NEW.date, 'amount', NEW.amount, 'category', NEW.category,
+                'description', NEW.description, 'created_at', NEW.created_at
+            ), now() AT TIME ZONE 'utc');
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql""",
+    """DROP TRIGGER IF EXISTS revenue_changes ON revenue""",
+    """CREATE TRIGGER revenue_changes AFTER INSERT OR UPDATE OR DELETE ON revenue
+    FOR EACH ROW EXECUTE FUNCTION revenue_changes_append()""",
+]
+
+
+class ChangesUnavailable(Exception):
+    """The changes after the requested seq were pruned or never existed; the reader has to start over"""
+
+
+def triggers_installed(connection) -> bool:
+    """True if the change log triggers already exist in the database"""
+    dialect_name = connection.dialect.name
+    if dialect_name == 'sqlite':
+        sql = "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'revenue_changes_%'"
+        return connection.exec_driver_sql(sql).scalar() == len(_sqlite_triggers())
+    if dialect_name == 'postgresql':
+        sql = "SELECT COUNT(*) FROM pg_trigger WHERE tgname = 'revenue_changes'"
+        return connection.exec_driver_sql(sql).scalar() == 1
+    return False
+
+
+def install_revenue_change_triggers(connection) -> bool:
+    """
+    Create the triggers that append revenue writes to revenue_changes.
+
+    Returns False, and the log stays empty, when the tables don't exist or the
+    dialect isn't supported.
+    """
+    inspector = inspect(connection)
+    if not (inspector.has_table('revenue') and inspector.has_table('revenue_changes')):
+        logger.info("Skipping revenue_changes triggers, missing tables")
+        return False
+
+    dialect_name = connection.dialect.name
+    if dialect_name == 'sqlite':
+        statements = _sqlite_triggers()
+    elif dialect_name == 'postgresql':
+        statements = POSTGRES_TRIGGERS
+    else:
+        logger.warning(f"revenue_changes triggers are not supported on {dialect_name}")
+        return False
+
+    if triggers_installed(connection):
+        return True
+
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+    logger.info("Installed revenue_changes triggers")
+    return True
+
+
+# One aggregate per subquery: SQLite only answers a lone MIN() or MAX() from the index
+HEAD_SQL = text("""
+    SELECT
+        COALESCE((SELECT MAX(seq) FROM revenue_changes), 0),
+        COALESCE((SELECT MIN(seq) FROM revenue_changes), 0)
+""")
+
+CHANGES_SQL = text("""
+    SELECT seq, revenue_id, op, data, changed_at
+    FROM revenue_changes
+    WHERE seq > :since
+    ORDER BY seq
+    LIMIT :limit
+""").columns(seq=Integer, revenue_id=Integer, changed_at=DateTime)
+
+# Keeps the newest entry, so the head seq survives pruning
+PRUNE_SQL = text("""
+    DELETE FROM revenue_changes
+    WHERE changed_at < :before AND seq < (SELECT MAX(seq) FROM revenue_changes)
+""").bindparams(bindparam('before', type_=DateTime))
+
+
+def head(connection) -> int:
+    """Seq of the latest change, 0 if there are none"""
+    return connection.execute(HEAD_SQL).one()[0]
+
+
+def as_dict(row) -> dict:
+    data = row.data
+    # SQLite hands back the JSON text, psycopg2 already decodes json columns
+    if isinstance(data, str):
+        data = json.loads(data)
+    return {
+        'seq': row.seq,
+        'op': row.op,
+        'id': row.revenue_id,
+        'row': data,
+        'changed_at': row.changed_at.isoformat()
+    }
+
+
+def changes_since(connection, since: int, limit: int):
+    """
+    Up to `limit` changes with seq > `since`, oldest first, and the head seq.
+
+    Raises ChangesUnavailable if entries right after `since` are no longer kept, or
+    if `since` is ahead of the log (e.g. the database was restored).
+    """
+    latest, oldest = connection.execute(HEAD_SQL).one()
+    if since < oldest - 1:
+        raise ChangesUnavailable(f"Changes after {since} were pruned, the oldest kept is {oldest}")
+    if since > latest:
+        raise ChangesUnavailable(f"No change {since} in the log, the latest is {latest}")
+    rows = connection.execute(CHANGES_SQL, {'since': since, 'limit': limit}).all()
+    return [as_dict(row) for row in rows], latest
+
+
+def prune(connection, before: datetime) -> int:
+    """Delete entries written before `before` (UTC), always keeping the latest; returns the count"""
+    return connection.execute(PRUNE_SQL, {'before': before}).rowcount
+
+
+class HeadWatcher:
+    """
+    The latest seq a process has seen, checked against the log at most every
+    `interval` seconds. Shared by the Flask and ASGI request paths so either
+    one noticing a new head clears the response cache once.
+    """
+
+    def __init__(self):
+        self.seen = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def due(self, interval: float) -> bool:
+        """True if the log should be read now; claims the check until `interval` has passed"""
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_check:
+                return False
+            self._next_check = now + interval
+            return True
+
+    def advance(self, latest: int) -> bool:
+        """Record `latest` as seen; True if it differs from the head seen before"""
+        with self._lock:
+            moved = self.seen is not None and latest != self.seen
+            self.seen = latest
+            return moved
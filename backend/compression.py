@@ -0,0 +1,217 @@
+"""
+Negotiated compression of API responses.
+
+The encoding is picked from the request's Accept-Encoding among the configured
+ones: gzip (always available), br (needs the brotli package) and zstd (needs
+zstandard). Buffered bodies smaller than the size threshold are sent as is.
+Streamed responses (the exports and the SSE endpoints) are compressed chunk by
+chunk, each chunk flushed as soon as the generator yields it, so nothing is
+buffered and events still arrive one by one.
+
+A compressed response carries its own ETag ("<etag>-<encoding>") and every
+compressible response carries Vary: Accept-Encoding, so caches keep the
+variants apart. Compressed bodies of responses with a strong ETag are kept in
+a small LRU, so response cache hits aren't compressed again.
+"""
+import logging
+import time
+import zlib
+from typing import Iterable, Iterator, Optional, Sequence
+
+from werkzeug.http import parse_accept_header, parse_etags
+
+import metrics
+from cache import TTLCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+INPUT_BYTES = metrics.counter(
+    'http_compression_input_bytes_total', 'Response bytes before compression, per route and encoding',
+    ['route', 'encoding'])
+OUTPUT_BYTES = metrics.counter(
+    'http_compression_output_bytes_total', 'Response bytes after compression, per route and encoding',
+    ['route', 'encoding'])
+CPU_SECONDS = metrics.counter(
+    'http_compression_cpu_seconds_total', 'CPU time spent compressing responses, per route and encoding',
+    ['route', 'encoding'])
+
+
+class GzipStream:
+    def __init__(self, level: int):
+        # wbits 31: deflate with a gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress `data` and flush it, so the client can decode it right away"""
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b'') -> bytes:
+        """Compress the last `data` and end the stream"""
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class BrotliStream:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self, data: bytes = b'') -> bytes:
+        return self._compressor.process(data) + self._compressor.finish()
+
+
+class ZstdStream:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self, data: bytes = b'') -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+# Content-Encoding -> stream class, and whether its library is installed
+STREAMS = {
+    'gzip': (GzipStream, True),
+    'br': (BrotliStream, brotli is not None),
+    'zstd': (ZstdStream, zstandard is not None),
+}
+
+
+class ResponseCompressor:
+    """
+    Compresses responses in one of `encodings` (in order of preference when
+    the client accepts several equally), at `levels[encoding]`.
+
+    Encodings whose library isn't installed are skipped; an empty list turns
+    compression off.
+    """
+
+    def __init__(self, encodings: Sequence[str] = ('gzip',), levels: Optional[dict] = None,
+                 min_size: int = 1024, mimetypes: Iterable[str] = ('application/json',),
+                 cache_entries: int = 256, cache_ttl: float = 300):
+        unknown = [encoding for encoding in encodings if encoding not in STREAMS]
+        if unknown:
+            raise ValueError(f"Unknown compression encoding(s): {', '.join(unknown)}; "
+                             f"use {', '.join(STREAMS)}")
+        self.encodings = [encoding for encoding in encodings if STREAMS[encoding][1]]
+        skipped = [encoding for encoding in encodings if not STREAMS[encoding][1]]
+        if skipped:
+            logger.info(f"Compression encoding(s) {', '.join(skipped)} skipped, library not installed")
+        self.levels = levels or {}
+        self.min_size = min_size
+        self.mimetypes = set(mimetypes)
+        # Compressed bodies keyed on "<etag>-<encoding>"
+        self.variants = TTLCache(maxsize=cache_entries, ttl=cache_ttl)
+
+    def compressible(self, mimetype: Optional[str]) -> bool:
+        return bool(self.encodings) and mimetype in self.mimetypes
+
+    def negotiate(self, accept_encoding: Optional[str]) -> Optional[str]:
+        """The encoding to use for a request's Accept-Encoding header, or None for identity"""
+        if not accept_encoding or not self.encodings:
+            return None
+        return parse_accept_header(accept_encoding).best_match(self.encodings)
+
+    def stream(self, encoding: str):
+        return STREAMS[encoding][0](self.levels.get(encoding, -1))
+
+    @staticmethod
+    def _record(route: str, encoding: str, size: int, compressed_size: int, cpu: float):
+        INPUT_BYTES.inc(size, route=route, encoding=encoding)
+        OUTPUT_BYTES.inc(compressed_size, route=route, encoding=encoding)
+        CPU_SECONDS.inc(cpu, route=route, encoding=encoding)
+
+    def compress(self, body: bytes, encoding: str, route: str, etag: Optional[str] = None) -> bytes:
+        """Compress a whole body; pass the body's strong `etag` to reuse earlier results"""
+        key = f"{etag}-{encoding}" if etag else None
+        data = self.variants.get(key) if key else None
+        if data is not None:
+            self._record(route, encoding, len(body), len(data), 0.0)
+            return data
+
+        started = time.thread_time()
+        data = self.stream(encoding).finish(body)
+        self._record(route, encoding, len(body), len(data), time.thread_time() - started)
+        if key:
+            self.variants.set(key, data)
+        return data
+
+    def compress_chunks(self, chunks: Iterable, encoding: str, route: str) -> Iterator[bytes]:
+        """Compress an iterable of str or bytes chunks, yielding each as soon as it's compressed"""
+        stream = self.stream(encoding)
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                started = time.thread_time()
+                data = stream.compress(chunk)
+                self._record(route, encoding, len(chunk), len(data), time.thread_time() - started)
+                yield data
+            yield stream.finish()
+        finally:
+            # Closing the response closes this generator; pass it on, e.g. to
+            # release the request context held by stream_with_context
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+    def process(self, response, request):
+        """after_request hook: compress a Flask response when the client accepts it"""
+        if (not self.compressible(response.mimetype) or response.direct_passthrough
+                or 'Content-Encoding' in response.headers):
+            return response
+        # The body depends on Accept-Encoding, whether or not this one is compressed
+        response.vary.add('Accept-Encoding')
+        if not 200 <= response.status_code < 300 or response.status_code in (204, 206):
+            return response
+        encoding = self.negotiate(request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return response
+
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        if response.is_streamed:
+            response.response = self.compress_chunks(response.response, encoding, route)
+            response.headers.pop('Content-Length', None)
+        else:
+            body = response.get_data()
+            if len(body) < self.min_size:
+                return response
+            etag, weak = response.get_etag()
+            if etag:
+                # Revalidation of the compressed variant, which the view couldn't match
+                response.set_etag(f"{etag}-{encoding}", weak)
+                response = response.make_conditional(request)
+                if response.status_code == 304:
+                    return response
+            response.set_data(self.compress(body, encoding, route, None if weak else etag))
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def variant(self, body: bytes, etag: str, mimetype: str, accept_encoding: Optional[str],
+                if_none_match: Optional[str], route: str):
+        """
+        Encoding, ETag and body to send for a rendered `body` outside of Flask
+        (the async dashboard endpoints). The body is None when `if_none_match`
+        matches the ETag, i.e. when the response is a 304.
+        """
+        encoding = None
+        if self.compressible(mimetype) and len(body) >= self.min_size:
+            encoding = self.negotiate(accept_encoding)
+        variant_etag = f"{etag}-{encoding}" if encoding else etag
+        if if_none_match and parse_etags(if_none_match).contains(variant_etag):
+            return encoding, variant_etag, None
+        if encoding:
+            body = self.compress(body, encoding, route, etag)
+        return encoding, variant_etag, body
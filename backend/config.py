@@ -9,3 +9,108 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # JSON serializer of the API responses: orjson, stdlib, or auto (orjson when installed)
+    JSON_PROVIDER = os.environ.get('JSON_PROVIDER', 'auto').lower()
+
+    # Connection pool, per worker process. Size it for the request threads plus
+    # DASHBOARD_QUERY_WORKERS; (DB_POOL_SIZE + DB_MAX_OVERFLOW) x workers must
+    # stay below the server's max_connections. Requests wait up to
+    # DB_POOL_TIMEOUT seconds for a connection, and connections older than
+    # DB_POOL_RECYCLE seconds are replaced. Pre-ping tests a connection before
+    # handing it out, so ones dropped by the server or a proxy are reopened.
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '10'))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '10'))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '30'))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '1800'))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+    SQLALCHEMY_ENGINE_OPTIONS = {'pool_pre_ping': DB_POOL_PRE_PING, 'pool_recycle': DB_POOL_RECYCLE}
+    # SQLite in-memory databases use a single-connection pool without sizing
+    if not SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        SQLALCHEMY_ENGINE_OPTIONS.update(
+            pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT
+        )
+    # Database URL of the async dashboard endpoints (asgi.py); by default
+    # DATABASE_URL with its async driver (asyncpg or aiosqlite)
+    ASYNC_DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL')
+
+    # AI model settings
+    AI_MODEL_NAME = os.environ.get('AI_MODEL_NAME') or 'microsoft/DialoGPT-medium'
+    # Inference backend: fp32 (default), int8 (dynamic quantization, CPU) or
+    # onnx (ONNX Runtime via optimum, CPU)
+    AI_BACKEND = os.environ.get('AI_BACKEND', 'fp32').lower()
+    # Start loading the model on a background thread when the app boots
+    AI_PRELOAD = os.environ.get('AI_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+    # Seconds an AI request waits for the model before answering "warming up"
+    AI_WARMUP_TIMEOUT = float(os.environ.get('AI_WARMUP_TIMEOUT', '0'))
+    # Prompts from concurrent requests arriving within this window share one batch
+    AI_BATCH_MAX_SIZE = int(os.environ.get('AI_BATCH_MAX_SIZE', '8'))
+    AI_BATCH_WAIT_MS = float(os.environ.get('AI_BATCH_WAIT_MS', '20'))
+    # Whether /api/ai/recommendations asks the model to write the analysis by
+    # default (?llm=0/1 overrides). Without it the response is phrased from the
+    # computed insights and returns immediately.
+    AI_RECOMMENDATIONS_LLM = os.environ.get('AI_RECOMMENDATIONS_LLM', 'true').lower() in ('1', 'true', 'yes')
+    # Model worker processes (0 runs the model inside the web process). Jobs
+    # beyond AI_WORKER_QUEUE_DEPTH are refused with 429, and a job fails after
+    # AI_WORKER_TIMEOUT seconds without an answer.
+    AI_WORKERS = int(os.environ.get('AI_WORKERS', '0'))
+    AI_WORKER_QUEUE_DEPTH = int(os.environ.get('AI_WORKER_QUEUE_DEPTH', '16'))
+    AI_WORKER_TIMEOUT = float(os.environ.get('AI_WORKER_TIMEOUT', '120'))
+    AI_WORKER_START_METHOD = os.environ.get('AI_WORKER_START_METHOD', 'spawn')
+    # Cache for /api/ai/recommendations, keyed on a fingerprint of the revenue data.
+    # Set AI_CACHE_DIR to keep entries on disk (shared by workers, survives restarts)
+    AI_CACHE_TTL = float(os.environ.get('AI_CACHE_TTL', '3600'))
+    AI_CACHE_MAX_ENTRIES = int(os.environ.get('AI_CACHE_MAX_ENTRIES', '32'))
+    AI_CACHE_DIR = os.environ.get('AI_CACHE_DIR')
+
+    # Keyset pagination for GET /api/revenue
+    REVENUE_PAGE_DEFAULT_LIMIT = int(os.environ.get('REVENUE_PAGE_DEFAULT_LIMIT', '500'))
+    REVENUE_PAGE_MAX_LIMIT = int(os.environ.get('REVENUE_PAGE_MAX_LIMIT', '1000'))
+    # Rows fetched per server-side cursor batch by /api/revenue/export
+    REVENUE_EXPORT_BATCH_SIZE = int(os.environ.get('REVENUE_EXPORT_BATCH_SIZE', '1000'))
+    # Rows per executemany batch in POST /api/revenue/bulk
+    REVENUE_BULK_CHUNK_SIZE = int(os.environ.get('REVENUE_BULK_CHUNK_SIZE', '1000'))
+
+    # Change feed of revenue writes (GET /api/revenue/changes): entries per
+    # response, seconds between checks of the log by the SSE stream and by the
+    # response cache (for writes made by other workers or outside the app), how
+    # long a stream stays open before the client reconnects, and the days of
+    # entries kept by `flask prune-revenue-changes`
+    REVENUE_CHANGES_MAX_LIMIT = int(os.environ.get('REVENUE_CHANGES_MAX_LIMIT', '1000'))
+    REVENUE_CHANGES_POLL_INTERVAL = float(os.environ.get('REVENUE_CHANGES_POLL_INTERVAL', '1'))
+    REVENUE_CHANGES_STREAM_TIMEOUT = float(os.environ.get('REVENUE_CHANGES_STREAM_TIMEOUT', '300'))
+    REVENUE_CHANGES_RETENTION_DAYS = float(os.environ.get('REVENUE_CHANGES_RETENTION_DAYS', '7'))
+
+    # Threads used by /api/dashboard/all to run the dashboard queries in parallel
+    DASHBOARD_QUERY_WORKERS = int(os.environ.get('DASHBOARD_QUERY_WORKERS', '4'))
+    RECENT_TRANSACTIONS_MAX_LIMIT = int(os.environ.get('RECENT_TRANSACTIONS_MAX_LIMIT', '100'))
+    # Milliseconds after which PostgreSQL cancels a dashboard query (0 disables)
+    DASHBOARD_STATEMENT_TIMEOUT_MS = int(os.environ.get('DASHBOARD_STATEMENT_TIMEOUT_MS', '10000'))
+
+    # Seconds before a read of /api/dashboard/revenue-by-country recomputes the
+    # country_revenue table, on databases where triggers can't maintain it
+    COUNTRY_REVENUE_MAX_AGE = float(os.environ.get('COUNTRY_REVENUE_MAX_AGE', '60'))
+
+    # Cached GET responses of the dashboard and revenue endpoints. Revenue writes
+    # clear the cache; the TTL bounds staleness of the externally written tables.
+    # Set HTTP_CACHE_DIR to share entries between workers.
+    HTTP_CACHE_TTL = float(os.environ.get('HTTP_CACHE_TTL', '30'))
+    HTTP_CACHE_MAX_ENTRIES = int(os.environ.get('HTTP_CACHE_MAX_ENTRIES', '256'))
+    HTTP_CACHE_DIR = os.environ.get('HTTP_CACHE_DIR')
+
+    # Response compression, negotiated from Accept-Encoding in this order of
+    # preference (br needs the brotli package, zstd needs zstandard; encodings
+    # that aren't installed are skipped, an empty list disables compression).
+    # Buffered bodies under COMPRESSION_MIN_SIZE bytes are sent uncompressed;
+    # streamed exports and SSE are always compressed, flushed per chunk.
+    COMPRESSION_ENCODINGS = [name.strip() for name in
+                             os.environ.get('COMPRESSION_ENCODINGS', 'zstd,br,gzip').split(',') if name.strip()]
+    COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+    COMPRESSION_LEVELS = {
+        'gzip': int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6')),
+        'br': int(os.environ.get('COMPRESSION_BROTLI_LEVEL', '4')),
+        'zstd': int(os.environ.get('COMPRESSION_ZSTD_LEVEL', '3')),
+    }
+    COMPRESSION_MIMETYPES = ['application/json', 'application/x-ndjson', 'text/csv',
+                             'text/event-stream', 'text/plain']
+    # Compressed bodies of cached responses kept per process
+    COMPRESSION_CACHE_ENTRIES = int(os.environ.get('COMPRESSION_CACHE_ENTRIES', '256'))
@@ -0,0 +1,314 @@
+"""
+Queries behind the /api/dashboard/* endpoints.
+
+Each query function takes anything with an `execute()` method (the Flask-SQLAlchemy
+session or a Connection) and returns the JSON-ready payload for its endpoint, so
+the same code serves the individual endpoints and the combined /api/dashboard/all.
+"""
+import base64
+import binascii
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy import Date, Integer, bindparam, inspect, text
+
+import rollups
+
+REVENUE_SUMMARY_SQL = text("""
+    SELECT
+        month,
+        subscription_revenue,
+        product_revenue,
+        total_revenue
+    FROM revenue_summary
+    ORDER BY month
+""")
+
+REVENUE_BY_COUNTRY_SQL = text("""
+    SELECT
+        c.country,
+        COALESCE(SUM(p.amount), 0) as total_revenue,
+        COUNT(DISTINCT c.id) as customer_count
+    FROM customers c
+    LEFT JOIN payments p ON c.id = p.customer_id
+    GROUP BY c.country
+    ORDER BY total_revenue DESC
+    LIMIT 10
+""")
+
+COUNTRY_REVENUE_SQL = text("""
+    SELECT
+        NULLIF(country, '') as country,
+        total_revenue,
+        customer_count
+    FROM country_revenue
+    WHERE customer_count > 0
+    ORDER BY total_revenue DESC
+    LIMIT 10
+""")
+
+# Top-N first: take the latest payments through the (payment_date, id) index,
+# then probe product_sales for just those rows with a sargable date range
+RECENT_TRANSACTIONS_SQL = """
+    SELECT
+        recent.customer_name,
+        recent.amount,
+        recent.payment_date,
+        recent.payment_method,
+        EXISTS (
+            SELECT 1
+            FROM product_sales ps
+            WHERE ps.customer_id = recent.customer_id
+                AND ps.sale_date >= {day_start}
+                AND ps.sale_date < {next_day}
+        ) as has_product_sale,
+        recent.id
+    FROM (
+        SELECT
+            p.id,
+            p.customer_id,
+            c.name as customer_name,
+            p.amount,
+            p.payment_date,
+            p.payment_method
+        FROM payments p
+        JOIN customers c ON p.customer_id = c.id
+        {cursor_filter}
+        ORDER BY p.payment_date DESC, p.id DESC
+        LIMIT :limit
+    ) recent
+    ORDER BY recent.payment_date DESC, recent.id DESC
+"""
+
+# Start of the payment's day and of the following day, per dialect
+DAY_RANGE_SQL = {
+    'postgresql': ('CAST(recent.payment_date AS DATE)', 'CAST(recent.payment_date AS DATE) + 1'),
+    'sqlite': ('date(recent.payment_date)', "date(recent.payment_date, '+1 day')"),
+}
+
+# The leading bound gives ix_payments_payment_date_id a range to search
+CURSOR_FILTER_SQL = """
+        WHERE p.payment_date <= :cursor_date
+            AND (p.payment_date < :cursor_date OR (p.payment_date = :cursor_date AND p.id < :cursor_id))
+"""
+
+# Indexes on the externally created tables that the dashboard queries rely on
+INDEXES = {
+    'payments': [
+        'CREATE INDEX IF NOT EXISTS ix_payments_payment_date_id ON payments (payment_date, id)',
+    ],
+    'product_sales': [
+        'CREATE INDEX IF NOT EXISTS ix_product_sales_customer_sale_date ON product_sales (customer_id, sale_date)',
+    ],
+}
+
+PLAN_DISTRIBUTION_SQL = text("""
+    SELECT
+        p.name as plan_name,
+        COUNT(s.id) as subscriber_count,
+        SUM(CASE
+            WHEN s.is_active THEN 1
+            ELSE 0
+        END) as active_subscribers
+    FROM plans p
+    LEFT JOIN subscriptions s ON p.id = s.plan_id
+    GROUP BY p.name
+    ORDER BY subscriber_count DESC
+""")
+
+
+def revenue_summary(executor) -> Dict[str, Any]:
+    # Get monthly revenue summary (one precomputed row per month)
+    result = executor.execute(REVENUE_SUMMARY_SQL)
+
+    months = []
+    subscription_data = []
+    product_data = []
+    total_data = []
+
+    for row in result:
+        months.append(datetime.strptime(row[0], '%Y-%m').strftime('%b %Y'))
+        subscription_data.append(float(row[1]))
+        product_data.append(float(row[2]))
+        total_data.append(float(row[3]))
+
+    return {
+        'months': months,
+        'subscription_revenue': subscription_data,
+        'product_revenue': product_data,
+        'total_revenue': total_data
+    }
+
+
+def revenue_by_country(executor) -> Dict[str, Any]:
+    # Read the precomputed per-country rows (countries whose last customer left
+    # keep a zero row); fall back to the live aggregation if country_revenue
+    # has never been refreshed
+    if rollups.country_revenue_state(executor) is not None:
+        result = executor.execute(COUNTRY_REVENUE_SQL)
+    else:
+        result = executor.execute(REVENUE_BY_COUNTRY_SQL)
+
+    countries = []
+    revenue = []
+    customer_counts = []
+
+    for row in result:
+        countries.append(row[0])
+        revenue.append(float(row[1]) if row[1] else 0)
+        customer_counts.append(int(row[2]))
+
+    return {
+        'countries': countries,
+        'revenue': revenue,
+        'customer_counts': customer_counts
+    }
+
+
+def _dialect_name(executor) -> str:
+    if hasattr(executor, 'get_bind'):
+        return executor.get_bind().dialect.name
+    return executor.dialect.name
+
+
+def set_statement_timeout(executor, timeout_ms: int):
+    """
+    Cancel any statement of the current transaction that runs longer than
+    `timeout_ms` milliseconds (0 disables). PostgreSQL only; SET LOCAL ends
+    with the transaction, so pooled connections don't keep the setting.
+    """
+    if timeout_ms and _dialect_name(executor) == 'postgresql':
+        executor.execute(text(f"SET LOCAL statement_timeout = {int(timeout_ms)}"))
+
+
+def _date_string(value) -> Optional[str]:
+    # Raw SQL on SQLite returns dates as strings
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value[:10]
+    return value.strftime('%Y-%m-%d')
+
+
+def encode_cursor(payment_date, id) -> str:
+    """Opaque cursor pointing just past the given transaction"""
+    raw = json.dumps([_date_string(payment_date), id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor: str):
+    """The (payment_date, id) of a cursor, the date as a `date` so asyncpg can bind it"""
+    try:
+        payment_date, id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.strptime(str(payment_date)[:10], '%Y-%m-%d').date(), int(id)
+    except (TypeError, ValueError, binascii.Error):
+        raise ValueError("Invalid cursor")
+
+
+def recent_transactions_page(executor, limit: int = 10, cursor: Optional[str] = None):
+    """
+    The latest `limit` payments (older than `cursor`, if given).
+
+    Returns (transactions, next_cursor); next_cursor is None on the last page.
+    """
+    day_start, next_day = DAY_RANGE_SQL.get(_dialect_name(executor), DAY_RANGE_SQL['postgresql'])
+    params = {'limit': limit}
+    cursor_filter = ''
+    if cursor:
+        params['cursor_date'], params['cursor_id'] = decode_cursor(cursor)
+        cursor_filter = CURSOR_FILTER_SQL
+
+    sql = RECENT_TRANSACTIONS_SQL.format(day_start=day_start, next_day=next_day, cursor_filter=cursor_filter)
+    statement = text(sql)
+    if cursor:
+        # Typed binds: asyncpg rejects a str for a date column
+        statement = statement.bindparams(bindparam('cursor_date', type_=Date), bindparam('cursor_id', type_=Integer))
+    result = executor.execute(statement, params)
+
+    transactions = []
+    last = None
+    for row in result:
+        transactions.append({
+            'customer': row[0],
+            'amount': float(row[1]) if row[1] else 0,
+            'date': _date_string(row[2]),
+            'payment_method': row[3],
+            'has_product_sale': bool(row[4])
+        })
+        last = row
+
+    next_cursor = encode_cursor(last[2], last[5]) if last is not None and len(transactions) == limit else None
+    return transactions, next_cursor
+
+
+def recent_transactions(executor) -> list:
+    return recent_transactions_page(executor)[0]
+
+
+def plan_distribution(executor) -> Dict[str, Any]:
+    result = executor.execute(PLAN_DISTRIBUTION_SQL)
+
+    plans = []
+    subscribers = []
+    active_subscribers = []
+
+    for row in result:
+        plans.append(row[0])
+        subscribers.append(int(row[1]))
+        active_subscribers.append(int(row[2]))
+
+    return {
+        'plans': plans,
+        'subscribers': subscribers,
+        'active_subscribers': active_subscribers
+    }
+
+
+def create_indexes(connection):
+    """Create the supporting indexes on whichever dashboard tables exist"""
+    inspector = inspect(connection)
+    for table, statements in INDEXES.items():
+        if inspector.has_table(table):
+            for statement in statements:
+                connection.exec_driver_sql(statement)
+
+
+QUERIES = {
+    'revenue_summary': revenue_summary,
+    'revenue_by_country': revenue_by_country,
+    'recent_transactions': recent_transactions,
+    'plan_distribution': plan_distribution,
+}
+
+
+def _run_on_own_connection(engine, query, timeout_ms: int):
+    # Each query checks out its own pooled connection, so they run in parallel
+    with engine.connect() as connection:
+        set_statement_timeout(connection, timeout_ms)
+        return query(connection)
+
+
+def fetch_all(engine, pool: ThreadPoolExecutor, timeout_ms: int = 0) -> Dict[str, Any]:
+    """
+    Run every dashboard query concurrently on `pool`, each limited to
+    `timeout_ms` (see set_statement_timeout).
+
+    Returns a payload keyed by query name plus an `errors` dict holding the
+    message of any query that failed (its payload is then None), so one broken
+    widget doesn't fail the whole dashboard.
+    """
+    futures = {name: pool.submit(_run_on_own_connection, engine, query, timeout_ms)
+               for name, query in QUERIES.items()}
+
+    payload = {}
+    errors = {}
+    for name, future in futures.items():
+        try:
+            payload[name] = future.result()
+        except Exception as e:
+            payload[name] = None
+            errors[name] = str(e)
+    payload['errors'] = errors
+    return payload
@@ -0,0 +1,35 @@
+"""
+Gunicorn settings for serving the API with several worker processes:
+
+    gunicorn -c gunicorn.conf.py
+
+The app is created once in the master (preload_app), so tables, triggers and
+indexes are set up once and the code is shared copy-on-write between workers.
+Each worker then drops the database connections inherited from the master and,
+with AI_PRELOAD, starts loading its own model. Every worker holds a model and a
+connection pool (DB_POOL_SIZE + DB_MAX_OVERFLOW), so size GUNICORN_WORKERS for
+both memory and the database's max_connections.
+"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '2'))
+# Threads per worker; keep them within the connection pool size
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+# Model loading and generation can be slow; streamed responses keep the worker busy
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+wsgi_app = 'wsgi:app'
+preload_app = True
+
+
+def post_fork(server, worker):
+    import app as backend
+    from wsgi import app
+
+    # Pooled connections opened in the master must not be shared across processes
+    with app.app_context():
+        backend.db.engine.dispose(close=False)
+    if app.config['AI_PRELOAD']:
+        backend.ai_service.start_loading()
@@ -0,0 +1,106 @@
+import functools
+import hashlib
+import threading
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from flask import Response, current_app, request
+
+# Headers that are recomputed for every response rather than replayed from the cache
+_SKIPPED_HEADERS = {'content-length', 'content-type', 'set-cookie', 'etag', 'last-modified'}
+
+
+def cache_key(path: str, args) -> str:
+    """Cache key for `path` and its (name, value) query arguments"""
+    # ?refresh= only forces a recompute, its result serves plain requests too
+    args = sorted((name, value) for name, value in args if name != 'refresh')
+    # Encoded, so a value containing & or = can't pass for other arguments
+    return f"{path}?{urlencode(args)}"
+
+
+def etag(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def make_entry(body: bytes, status: int, mimetype: str, headers) -> dict:
+    """Cache entry for a rendered response; `headers` are (name, value) pairs"""
+    return {
+        'body': body.decode('utf-8'),
+        'status': status,
+        'mimetype': mimetype,
+        'etag': etag(body),
+        'last_modified': datetime.now(timezone.utc).timestamp(),
+        'headers': [(name, value) for name, value in headers if name.lower() not in _SKIPPED_HEADERS]
+    }
+
+
+class ResponseCache:
+    """
+    Cache of rendered GET responses, keyed on the path and query string.
+
+    Entries are stored as plain dicts so any backend from cache.make_cache works
+    (in-process TTLCache or the shared DiskCache). Every response that goes
+    through the cache carries a strong ETag and Last-Modified, so repeat
+    requests with If-None-Match get a 304 without touching the database.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        # Bumped by invalidate(); a response rendered while it changed may hold
+        # data from before the write and is not stored
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key():
+        return cache_key(request.path, request.args.items(multi=True))
+
+    def invalidate(self):
+        """Drop every cached response; called after writes to the revenue table"""
+        with self._lock:
+            self.generation += 1
+            self.backend.clear()
+
+    def store(self, key: str, entry: dict, generation: int) -> bool:
+        """Cache `entry` unless invalidate() ran since `generation` was read, before rendering it"""
+        with self._lock:
+            if generation != self.generation:
+                return False
+            self.backend.set(key, entry)
+            return True
+
+    @staticmethod
+    def _response(entry, cache_status: str) -> Response:
+        response = Response(entry['body'], status=entry['status'], mimetype=entry['mimetype'])
+        for name, value in entry['headers']:
+            response.headers[name] = value
+        response.set_etag(entry['etag'])
+        response.last_modified = datetime.fromtimestamp(entry['last_modified'], timezone.utc)
+        # Clients may reuse the body but must revalidate it first
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Cache'] = cache_status
+        return response.make_conditional(request)
+
+    def cached(self, view):
+        """
+        Decorator for GET views. ?refresh= bypasses the cached entry (the
+        view sees the argument and can act on it) and stores the new result.
+        """
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if 'refresh' not in request.args:
+                entry = self.backend.get(self.key())
+                if entry is not None:
+                    return self._response(entry, 'HIT')
+
+            generation = self.generation
+            response = current_app.make_response(view(*args, **kwargs))
+            # Only complete successful responses are cached, errors are retried next time
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            entry = make_entry(response.get_data(), response.status_code, response.mimetype,
+                               response.headers.items())
+            self.store(self.key(), entry, generation)
+            return self._response(entry, 'MISS')
+
+        return wrapper
@@ -0,0 +1,323 @@
+"""
+Deterministic revenue insights computed with NumPy.
+
+compute_insights() takes the monthly data used for the AI analysis (month ->
+{'total', 'count', 'categories'}) and returns JSON-ready statistics: month-over-
+month growth, rolling averages, trend, seasonal decomposition, category share
+shifts, anomaly flags and a short forecast. describe() turns them into the text
+fields of the /api/ai/recommendations response, so the endpoint can answer in
+milliseconds without the language model.
+"""
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+ROLLING_WINDOW = 3
+SEASON_LENGTH = 12
+# Months whose residual is this many standard deviations away are anomalies
+ANOMALY_Z = 2.0
+# Share changes (in percentage points) below this are not reported as shifts
+SHARE_SHIFT_THRESHOLD = 1.0
+# Seasonal swing (relative to the average month) below this is not reported
+SEASONAL_STRENGTH_THRESHOLD = 0.1
+
+
+def _month_index(month: str) -> int:
+    year, month_number = month.split('-')
+    return int(year) * 12 + int(month_number) - 1
+
+
+def _month_key(index: int) -> str:
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def _round(values, digits: int = 2) -> List[Optional[float]]:
+    return [None if value is None or np.isnan(value) else round(float(value), digits) for value in values]
+
+
+def _calendar(monthly_data: Dict[str, Dict[str, Any]]):
+    """Months from the first to the last one with data, gaps filled with zero revenue"""
+    indexes = sorted(_month_index(month) for month in monthly_data)
+    months = [_month_key(index) for index in range(indexes[0], indexes[-1] + 1)]
+    empty = {'total': 0.0, 'count': 0, 'categories': {}}
+    return months, [monthly_data.get(month, empty) for month in months]
+
+
+def _rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    result = np.full(len(values), np.nan)
+    if len(values) >= window:
+        result[window - 1:] = np.convolve(values, np.ones(window) / window, mode='valid')
+    return result
+
+
+def _seasonal_decomposition(totals: np.ndarray, months: List[str]) -> Optional[Dict[str, Any]]:
+    """
+    Classical additive decomposition: a centred 2x12 moving average as the trend
+    and the average detrended value per calendar month as the seasonal index.
+    Needs two full seasons of data.
+    """
+    if len(totals) < 2 * SEASON_LENGTH:
+        return None
+
+    weights = np.r_[0.5, np.ones(SEASON_LENGTH - 1), 0.5] / SEASON_LENGTH
+    trend = np.full(len(totals), np.nan)
+    half = SEASON_LENGTH // 2
+    trend[half:len(totals) - half] = np.convolve(totals, weights, mode='valid')
+
+    calendar_months = np.array([int(month[5:]) - 1 for month in months])
+    detrended = totals - trend
+    seasonal_index = np.array([np.nanmean(detrended[calendar_months == m]) for m in range(SEASON_LENGTH)])
+    seasonal_index -= seasonal_index.mean()
+
+    seasonal = seasonal_index[calendar_months]
+    residual = totals - trend - seasonal
+    amplitude = seasonal_index.max() - seasonal_index.min()
+    return {
+        'seasonal_index': {f"{m + 1:02d}": round(float(value), 2) for m, value in enumerate(seasonal_index)},
+        'peak_month': f"{int(seasonal_index.argmax()) + 1:02d}",
+        'low_month': f"{int(seasonal_index.argmin()) + 1:02d}",
+        # Swing between the strongest and weakest calendar month relative to the average month
+        'strength': round(float(amplitude / totals.mean()), 3) if totals.mean() else 0.0,
+        'trend': _round(trend),
+        'residual': _round(residual),
+        '_seasonal': seasonal_index,
+        '_residual': residual,
+    }
+
+
+def _category_shifts(months: List[str], data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Category totals and how each category's share moved between the first and last third"""
+    names = sorted({category for entry in data for category in entry['categories']})
+    if not names:
+        return {'totals': {}, 'shares': {}, 'shifts': []}
+
+    matrix = np.array([[entry['categories'].get(name, 0.0) for name in names] for entry in data])
+    category_totals = matrix.sum(axis=0)
+
+    window = max(1, len(months) // 3)
+    early, late = matrix[:window].sum(axis=0), matrix[-window:].sum(axis=0)
+    early_share = early / early.sum() * 100 if early.sum() else np.zeros(len(names))
+    late_share = late / late.sum() * 100 if late.sum() else np.zeros(len(names))
+    change = late_share - early_share
+
+    order = np.argsort(-np.abs(change))
+    shifts = [{
+        'category': names[i],
+        'share_before': round(float(early_share[i]), 2),
+        'share_after': round(float(late_share[i]), 2),
+        'change_points': round(float(change[i]), 2)
+    } for i in order if abs(change[i]) >= SHARE_SHIFT_THRESHOLD]
+
+    grand_total = category_totals.sum()
+    return {
+        'totals': {name: round(float(value), 2) for name, value in
+                   sorted(zip(names, category_totals), key=lambda item: -item[1])},
+        'shares': {name: round(float(value / grand_total * 100), 2) if grand_total else 0.0
+                   for name, value in zip(names, category_totals)},
+        'window_months': window,
+        'shifts': shifts
+    }
+
+
+def _anomalies(months: List[str], totals: np.ndarray, residual: np.ndarray) -> List[Dict[str, Any]]:
+    valid = ~np.isnan(residual)
+    if valid.sum() < 3:
+        return []
+    spread = residual[valid].std()
+    if not spread:
+        return []
+    z = (residual - np.nanmean(residual)) / spread
+    flagged = np.where(valid & (np.abs(z) >= ANOMALY_Z))[0]
+    return [{
+        'month': months[i],
+        'total': round(float(totals[i]), 2),
+        'expected': round(float(totals[i] - residual[i]), 2),
+        'z_score': round(float(z[i]), 2),
+        'direction': 'above' if z[i] > 0 else 'below'
+    } for i in flagged]
+
+
+def compute_insights(monthly_data: Dict[str, Dict[str, Any]], forecast_months: int = 3) -> Dict[str, Any]:
+    """Statistics for `monthly_data`; months without data count as zero revenue"""
+    if not monthly_data:
+        return {'months': [], 'message': 'No revenue data'}
+
+    months, data = _calendar(monthly_data)
+    totals = np.array([float(entry['total']) for entry in data])
+    counts = np.array([int(entry['count']) for entry in data])
+    x = np.arange(len(totals))
+
+    previous = totals[:-1]
+    growth = np.full(len(totals), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth[1:] = np.where(previous != 0, (totals[1:] - previous) / previous * 100, np.nan)
+
+    slope, intercept = np.polyfit(x, totals, 1) if len(totals) > 1 else (0.0, totals[0])
+    fitted = slope * x + intercept
+
+    seasonality = _seasonal_decomposition(totals, months)
+    if seasonality is not None:
+        residual = seasonality.pop('_residual')
+        seasonal_index = seasonality.pop('_seasonal')
+    else:
+        rolling = _rolling_mean(totals, ROLLING_WINDOW)
+        # Compare each month with the average of the months before it
+        residual = np.full(len(totals), np.nan)
+        residual[ROLLING_WINDOW:] = totals[ROLLING_WINDOW:] - rolling[ROLLING_WINDOW - 1:-1]
+        seasonal_index = None
+
+    last_index = _month_index(months[-1])
+    future_x = np.arange(len(totals), len(totals) + forecast_months)
+    forecast = slope * future_x + intercept
+    if seasonal_index is not None:
+        forecast = forecast + seasonal_index[[(last_index + step) % SEASON_LENGTH for step in range(1, forecast_months + 1)]]
+    forecast = np.maximum(forecast, 0)
+
+    mean = totals.mean()
+    best, worst = int(totals.argmax()), int(totals.argmin())
+    return {
+        'months': months,
+        'totals': _round(totals),
+        'transactions': counts.tolist(),
+        'summary': {
+            'total_revenue': round(float(totals.sum()), 2),
+            'average_monthly_revenue': round(float(mean), 2),
+            'transactions': int(counts.sum()),
+            'best_month': {'month': months[best], 'total': round(float(totals[best]), 2)},
+            'worst_month': {'month': months[worst], 'total': round(float(totals[worst]), 2)},
+            'latest_mom_growth': None if np.isnan(growth[-1]) else round(float(growth[-1]), 2),
+            'average_mom_growth': None if np.all(np.isnan(growth)) else round(float(np.nanmean(growth)), 2),
+        },
+        'mom_growth': _round(growth),
+        'rolling_average': _round(_rolling_mean(totals, ROLLING_WINDOW)),
+        'trend': {
+            'slope_per_month': round(float(slope), 2),
+            # Slope relative to the average month, so it reads as a growth rate
+            'relative_slope': round(float(slope / mean), 4) if mean else 0.0,
+            'direction': 'up' if mean and slope / mean > 0.01 else 'down' if mean and slope / mean < -0.01 else 'flat',
+            'fitted': _round(fitted),
+        },
+        'seasonality': seasonality,
+        'categories': _category_shifts(months, data),
+        'anomalies': _anomalies(months, totals, residual),
+        'forecast': [{'month': _month_key(last_index + step + 1), 'total': round(float(value), 2)}
+                     for step, value in enumerate(forecast)],
+    }
+
+
+def _money(amount: float) -> str:
+    return f"${amount:,.2f}"
+
+
+def _calendar_month_name(number: str) -> str:
+    return date(2000, int(number), 1).strftime('%B')
+
+
+def describe(insights: Dict[str, Any]) -> Dict[str, str]:
+    """Plain-language text for the recommendation fields, built from compute_insights output"""
+    if not insights.get('months'):
+        message = "No revenue data recorded yet."
+        return {field: message for field in ('observations', 'price_recommendations', 'product_focus',
+                                             'growth_strategies', 'potential_issues')}
+
+    summary, trend = insights['summary'], insights['trend']
+    seasonality, categories = insights['seasonality'], insights['categories']
+    ranked = list(categories['totals'])
+
+    observations = [
+        f"Revenue totalled {_money(summary['total_revenue'])} over {len(insights['months'])} months "
+        f"({_money(summary['average_monthly_revenue'])} per month on average).",
+        f"The trend is {trend['direction']} ({_money(trend['slope_per_month'])} per month, "
+        f"{trend['relative_slope'] * 100:+.1f}% of an average month).",
+        f"Best month: {summary['best_month']['month']} ({_money(summary['best_month']['total'])}); "
+        f"worst month: {summary['worst_month']['month']} ({_money(summary['worst_month']['total'])}).",
+    ]
+    if summary['latest_mom_growth'] is not None:
+        observations.append(f"The latest month changed {summary['latest_mom_growth']:+.1f}% on the month before.")
+    seasonal = seasonality is not None and seasonality['strength'] >= SEASONAL_STRENGTH_THRESHOLD
+    if seasonal:
+        observations.append(
+            f"Revenue is seasonal: {_calendar_month_name(seasonality['peak_month'])} is typically strongest and "
+            f"{_calendar_month_name(seasonality['low_month'])} weakest."
+        )
+    if ranked:
+        observations.append(f"{ranked[0]} is the largest category ({categories['shares'][ranked[0]]:.1f}% of revenue).")
+
+    gainers = [shift for shift in categories['shifts'] if shift['change_points'] > 0]
+    losers = [shift for shift in categories['shifts'] if shift['change_points'] < 0]
+
+    price = []
+    if gainers:
+        price.append(f"Demand for {gainers[0]['category']} is growing (share {gainers[0]['share_before']:.1f}% -> "
+                     f"{gainers[0]['share_after']:.1f}%); it can likely absorb a price increase.")
+    if losers:
+        price.append(f"{losers[0]['category']} is losing share ({losers[0]['share_before']:.1f}% -> "
+                     f"{losers[0]['share_after']:.1f}%); review its pricing or consider promotions.")
+    if not price:
+        price.append("Category shares are stable; keep current pricing and revisit if the mix changes.")
+
+    focus = []
+    if ranked:
+        focus.append(f"Prioritize {', '.join(ranked[:3])}, which bring in the most revenue.")
+    if gainers:
+        focus.append(f"Invest in {', '.join(shift['category'] for shift in gainers[:3])}, whose share is rising.")
+    if not focus:
+        focus.append("Record revenue categories to get product-level recommendations.")
+
+    forecast = insights['forecast']
+    growth = [f"Forecast for the next {len(forecast)} months: "
+              + ", ".join(f"{item['month']} {_money(item['total'])}" for item in forecast) + "."]
+    if seasonal:
+        growth.append(f"Plan campaigns and inventory ahead of {_calendar_month_name(seasonality['peak_month'])}, "
+                      f"and run promotions around {_calendar_month_name(seasonality['low_month'])}.")
+    if trend['direction'] != 'up':
+        growth.append("Revenue is not growing; focus on retention and upselling existing customers.")
+    else:
+        growth.append("Revenue is growing; scale the channels and categories driving it.")
+
+    issues = []
+    if trend['direction'] == 'down':
+        issues.append(f"Revenue is declining by about {_money(-trend['slope_per_month'])} per month.")
+    for anomaly in insights['anomalies'][:3]:
+        issues.append(f"{anomaly['month']} was unusually {'high' if anomaly['direction'] == 'above' else 'low'}: "
+                      f"{_money(anomaly['total'])} against about {_money(anomaly['expected'])} expected.")
+    if ranked and categories['shares'][ranked[0]] > 50:
+        issues.append(f"Over half of revenue depends on {ranked[0]}; diversify to reduce concentration risk.")
+    for shift in losers[:2]:
+        issues.append(f"{shift['category']} lost {-shift['change_points']:.1f} points of revenue share.")
+    if not issues:
+        issues.append("No anomalies or declining trends detected.")
+
+    return {
+        'observations': ' '.join(observations),
+        'price_recommendations': ' '.join(price),
+        'product_focus': ' '.join(focus),
+        'growth_strategies': ' '.join(growth),
+        'potential_issues': ' '.join(issues),
+    }
+
+
+def highlights(insights: Dict[str, Any]) -> str:
+    """A few lines of computed findings for the language model to build on"""
+    if not insights.get('months'):
+        return ""
+    trend, seasonality = insights['trend'], insights['seasonality']
+    lines = [f"Trend: {trend['direction']} ({trend['relative_slope'] * 100:+.1f}% of an average month per month)"]
+    if seasonality is not None and seasonality['strength'] >= SEASONAL_STRENGTH_THRESHOLD:
+        lines.append(f"Seasonality: peaks in {_calendar_month_name(seasonality['peak_month'])}, "
+                     f"lowest in {_calendar_month_name(seasonality['low_month'])}")
+    for shift in insights['categories']['shifts'][:2]:
+        lines.append(f"Share shift: {shift['category']} {shift['change_points']:+.1f} points")
+    for anomaly in insights['anomalies'][:2]:
+        lines.append(f"Anomaly: {anomaly['month']} {anomaly['direction']} expected "
+                     f"({_money(anomaly['total'])} vs {_money(anomaly['expected'])})")
+    if insights['forecast']:
+        lines.append(f"Forecast: {insights['forecast'][0]['month']} {_money(insights['forecast'][0]['total'])}")
+    return "Computed Insights:\n" + ''.join(f"  {line}\n" for line in lines)
+
+
+def recommendations(monthly_data: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """The /api/ai/recommendations payload computed without the language model"""
+    insights = compute_insights(monthly_data)
+    return {'status': 'success', 'source': 'insights', **describe(insights), 'insights': insights}
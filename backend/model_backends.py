@@ -0,0 +1,95 @@
+"""
+Inference backends for the causal language model.
+
+    fp32  the model as published, on GPU when available (default)
+    int8  dynamic int8 quantization of the Linear layers, CPU only
+    onnx  ONNX Runtime graph with KV-cache exported through optimum, CPU only
+
+torch, transformers and optimum are imported inside the loaders so that
+importing this module stays cheap.
+"""
+import logging
+from typing import Tuple
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('fp32', 'int8', 'onnx')
+
+# Layers left in fp32 by the int8 backend: the output projection is tied to the
+# token embeddings and is the most sensitive to quantization error
+INT8_SKIPPED_MODULES = ('lm_head',)
+
+
+def conv1d_to_linear(model):
+    """
+    Replace GPT-2 style Conv1D layers with equivalent nn.Linear layers, in place.
+
+    DialoGPT (GPT-2) implements its projections as transformers' Conv1D, which
+    quantize_dynamic does not recognise. Conv1D computes x @ W + b with W of
+    shape (in, out), so the Linear weight is W transposed.
+    """
+    import torch
+    from transformers.pytorch_utils import Conv1D
+
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if isinstance(child, Conv1D):
+                in_features, out_features = child.weight.shape
+                linear = torch.nn.Linear(in_features, out_features)
+                with torch.no_grad():
+                    linear.weight.copy_(child.weight.t())
+                    linear.bias.copy_(child.bias)
+                setattr(parent, name, linear)
+    return model
+
+
+def _load_fp32(model_name: str, device: str):
+    from transformers import AutoModelForCausalLM
+
+    return AutoModelForCausalLM.from_pretrained(model_name).to(device)
+
+
+def _load_int8(model_name: str, device: str):
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    model = AutoModelForCausalLM.from_pretrained(model_name)
+    model.eval()
+    conv1d_to_linear(model)
+    qconfig = torch.ao.quantization.default_dynamic_qconfig
+    layers = {name: qconfig for name, module in model.named_modules()
+              if isinstance(module, torch.nn.Linear) and name not in INT8_SKIPPED_MODULES}
+    return torch.ao.quantization.quantize_dynamic(model, layers, dtype=torch.qint8)
+
+
+def _load_onnx(model_name: str, device: str):
+    try:
+        from optimum.onnxruntime import ORTModelForCausalLM
+    except ImportError:
+        raise RuntimeError("The onnx backend needs `pip install optimum[onnxruntime]`")
+
+    # Exports the model on first use; use_cache keeps past key/values in the graph
+    return ORTModelForCausalLM.from_pretrained(model_name, export=True, use_cache=True)
+
+
+_LOADERS = {
+    'fp32': _load_fp32,
+    'int8': _load_int8,
+    'onnx': _load_onnx,
+}
+
+
+def load_causal_lm(model_name: str, backend: str = 'fp32') -> Tuple[object, str]:
+    """Load `model_name` with the given backend and return (model, device)"""
+    import torch
+
+    if backend not in _LOADERS:
+        raise ValueError(f"Unknown AI backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+
+    # The quantized and ONNX Runtime graphs only run on CPU
+    device = 'cuda' if backend == 'fp32' and torch.cuda.is_available() else 'cpu'
+    logger.info(f"Loading {model_name} with the {backend} backend on {device}")
+    model = _LOADERS[backend](model_name, device)
+    if hasattr(model, 'eval'):
+        model.eval()
+    return model, device
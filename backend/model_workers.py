@@ -0,0 +1,326 @@
+"""
+Pool of model worker processes.
+
+Each worker process builds its own AIRecommendationService and loads the model
+once; the Flask process only sends jobs (one prompt each) to the workers over
+multiprocessing queues and waits on Futures, so generation never runs on, or
+holds the GIL of, a request thread. Inside a worker, concurrent jobs still go
+through the service's batch scheduler and are batched together.
+
+The number of outstanding jobs is bounded: when it is reached, submit raises
+WorkerPoolSaturated (the API answers 429). Jobs that take longer than the
+timeout fail with WorkerTimeout.
+"""
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for expired jobs and dead workers
+_TICK = 0.5
+_END_OF_STREAM = object()
+
+
+class WorkerPoolSaturated(RuntimeError):
+    """Raised when the pool already holds its maximum number of outstanding jobs"""
+
+
+class WorkerTimeout(RuntimeError):
+    """Raised when a job gets no answer from its worker within the timeout"""
+
+
+def _run_job(service, job_id, kind, payload, results, cancelled):
+    try:
+        if kind == 'generate':
+            prompt, max_length = payload
+            results.put(('result', job_id, service.generate_counted([(prompt, max_length)])[0]))
+        elif kind == 'stream':
+            prompt, max_length = payload
+            usage = {}
+            stream = service.stream_text(prompt, max_length, usage)
+            try:
+                for chunk in stream:
+                    if job_id in cancelled:
+                        break
+                    results.put(('chunk', job_id, chunk))
+            finally:
+                stream.close()
+            results.put(('done', job_id, usage))
+    except Exception as e:
+        results.put(('error', job_id, str(e)))
+    finally:
+        cancelled.discard(job_id)
+
+
+def _worker_main(worker_id: int, service_kwargs: Dict[str, Any], jobs, results, threads: int):
+    """Entry point of a worker process: load the model, then serve jobs until told to stop"""
+    # Imported here so spawned workers only pay for the model code they need
+    from ai_service import AIRecommendationService
+
+    service = AIRecommendationService(**service_kwargs)
+    service.load_model()
+    if not service.is_ready():
+        results.put(('failed', worker_id, service.load_error))
+        return
+    results.put(('ready', worker_id, service.load_time))
+
+    # Jobs run on threads so that concurrent prompts meet in the batch scheduler
+    executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='ai-job')
+    cancelled = set()
+    while True:
+        message = jobs.get()
+        if message is None:
+            break
+        kind, job_id, payload = message
+        if kind == 'cancel':
+            cancelled.add(job_id)
+            continue
+        executor.submit(_run_job, service, job_id, kind, payload, results, cancelled)
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+class _Job:
+    __slots__ = ('worker_id', 'deadline', 'future', 'chunks', 'usage')
+
+    def __init__(self, worker_id: int, deadline: float, future: Optional[Future] = None,
+                 chunks: Optional[queue.Queue] = None, usage: Optional[Dict[str, int]] = None):
+        self.worker_id = worker_id
+        self.deadline = deadline
+        self.future = future
+        self.chunks = chunks
+        self.usage = usage
+
+
+class ModelWorkerPool:
+    """
+    `processes` model worker processes serving generate and stream jobs.
+
+    `service_kwargs` are passed to AIRecommendationService in each worker;
+    `max_pending` bounds the outstanding jobs across the pool and `timeout` is
+    the number of seconds a job (or a stream between two chunks) may take.
+    """
+
+    def __init__(self, processes: int, service_kwargs: Dict[str, Any], max_pending: int = 16,
+                 timeout: float = 120, start_method: str = 'spawn'):
+        self.processes = max(1, processes)
+        self.service_kwargs = service_kwargs
+        self.max_pending = max(1, max_pending)
+        self.timeout = timeout
+        self.load_error = None
+        self.load_time = None
+        self._context = multiprocessing.get_context(start_method)
+        self._results = None
+        self._workers: Dict[int, Tuple[Any, Any]] = {}
+        self._ready_workers = set()
+        self._failed_workers = set()
+        self._jobs: Dict[int, _Job] = {}
+        self._job_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._collector = None
+        self._started_at = None
+        self._closing = False
+
+    def start(self):
+        """Start the worker processes and the thread that collects their results"""
+        with self._lock:
+            if self._collector is not None:
+                return
+            self._started_at = time.perf_counter()
+            self._results = self._context.Queue()
+            for worker_id in range(self.processes):
+                self._start_worker(worker_id)
+            self._collector = threading.Thread(target=self._collect, name='ai-worker-results', daemon=True)
+            self._collector.start()
+
+    def _start_worker(self, worker_id: int):
+        jobs = self._context.Queue()
+        threads = max(1, self.service_kwargs.get('batch_max_size', 1))
+        process = self._context.Process(
+            target=_worker_main,
+            args=(worker_id, self.service_kwargs, jobs, self._results, threads),
+            name=f'ai-worker-{worker_id}',
+            daemon=True
+        )
+        process.start()
+        self._workers[worker_id] = (process, jobs)
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Wait until at least one worker has loaded the model (or all have failed)"""
+        self._ready.wait(timeout)
+        return bool(self._ready_workers)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'processes': self.processes,
+                'ready': len(self._ready_workers),
+                'pending': len(self._jobs),
+                'max_pending': self.max_pending
+            }
+
+    def is_saturated(self) -> bool:
+        return len(self._jobs) >= self.max_pending
+
+    def _reserve(self, count: int) -> List[Tuple[int, int]]:
+        """Allocate job ids and pick the least busy ready worker for each job"""
+        with self._lock:
+            if not self._ready_workers:
+                raise RuntimeError(self.load_error or "No model worker is ready")
+            if len(self._jobs) + count > self.max_pending:
+                raise WorkerPoolSaturated(
+                    f"AI worker pool is busy ({len(self._jobs)} of {self.max_pending} jobs pending)"
+                )
+            load = {worker_id: 0 for worker_id in self._ready_workers}
+            for job in self._jobs.values():
+                if job.worker_id in load:
+                    load[job.worker_id] += 1
+
+            reserved = []
+            deadline = time.monotonic() + self.timeout
+            for _ in range(count):
+                worker_id = min(load, key=load.get)
+                load[worker_id] += 1
+                job_id = next(self._job_ids)
+                self._jobs[job_id] = _Job(worker_id, deadline)
+                reserved.append((job_id, worker_id))
+            return reserved
+
+    def submit_many(self, requests: List[Tuple[str, int]]) -> List[Future]:
+        """
+        Queue (prompt, max_length) pairs, all or none, and return a Future per
+        prompt for its (text, generated tokens)
+        """
+        futures = []
+        for (job_id, worker_id), (prompt, max_length) in zip(self._reserve(len(requests)), requests):
+            future = Future()
+            self._jobs[job_id].future = future
+            self._workers[worker_id][1].put(('generate', job_id, (prompt, max_length)))
+            futures.append(future)
+        return futures
+
+    def stream(self, prompt: str, max_length: int, usage: Optional[Dict[str, int]] = None) -> Iterator[str]:
+        """
+        Generate text in a worker, yielding decoded chunks as they arrive.
+        `usage` gets the worker's token count once the stream is complete.
+        """
+        (job_id, worker_id), = self._reserve(1)
+        chunks = queue.Queue()
+        self._jobs[job_id].chunks = chunks
+        self._jobs[job_id].usage = usage
+        jobs = self._workers[worker_id][1]
+        jobs.put(('stream', job_id, (prompt, max_length)))
+        finished = False
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is _END_OF_STREAM:
+                    finished = True
+                    return
+                if isinstance(chunk, Exception):
+                    finished = True
+                    raise chunk
+                yield chunk
+        finally:
+            if not finished:
+                # The consumer went away: stop generating in the worker
+                jobs.put(('cancel', job_id, None))
+                with self._lock:
+                    self._jobs.pop(job_id, None)
+
+    def _finish(self, job_id: int, result: Any = None, error: Optional[Exception] = None):
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is None:
+            return
+        if job.chunks is not None:
+            if job.usage is not None and result:
+                job.usage.update(result)
+            job.chunks.put(error if error is not None else _END_OF_STREAM)
+        elif job.future is not None and not job.future.done():
+            if error is not None:
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
+
+    def _handle(self, kind: str, key: int, value: Any):
+        if kind == 'ready':
+            with self._lock:
+                self._ready_workers.add(key)
+                self._failed_workers.discard(key)
+            if self.load_time is None:
+                self.load_time = time.perf_counter() - self._started_at
+            logger.info(f"AI worker {key} ready")
+            self._ready.set()
+        elif kind == 'failed':
+            logger.error(f"AI worker {key} failed to load the model: {value}")
+            with self._lock:
+                self._failed_workers.add(key)
+                self.load_error = value
+                all_failed = len(self._failed_workers) == self.processes
+            if all_failed:
+                self._ready.set()
+        elif kind == 'result':
+            self._finish(key, result=value)
+        elif kind == 'error':
+            self._finish(key, error=RuntimeError(value))
+        elif kind == 'done':
+            self._finish(key, result=value)
+        elif kind == 'chunk':
+            with self._lock:
+                job = self._jobs.get(key)
+                if job is not None:
+                    # Streams time out on silence, not on their total length
+                    job.deadline = time.monotonic() + self.timeout
+            if job is not None:
+                job.chunks.put(value)
+
+    def _expire_jobs(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items() if job.deadline <= now]
+        for job_id in expired:
+            self._finish(job_id, error=WorkerTimeout(f"AI worker did not answer within {self.timeout:g}s"))
+
+    def _replace_dead_workers(self):
+        # Skipped for workers that failed to load: restarting them would just fail again
+        for worker_id, (process, _) in list(self._workers.items()):
+            if process.is_alive() or worker_id in self._failed_workers or self._closing:
+                continue
+            if worker_id not in self._ready_workers:
+                self._handle('failed', worker_id, f"exited with code {process.exitcode} before loading the model")
+                continue
+            logger.error(f"AI worker {worker_id} exited with code {process.exitcode}, restarting it")
+            with self._lock:
+                self._ready_workers.discard(worker_id)
+            # Its jobs are lost with it; they fail through the timeout
+            self._start_worker(worker_id)
+
+    def _collect(self):
+        while not self._closing:
+            try:
+                kind, key, value = self._results.get(timeout=_TICK)
+                self._handle(kind, key, value)
+            except queue.Empty:
+                pass
+            except Exception as e:
+                logger.error(f"Error handling AI worker message: {e}")
+            self._expire_jobs()
+            self._replace_dead_workers()
+
+    def close(self, timeout: float = 5):
+        """Ask the workers to exit, terminating those that don't within `timeout`"""
+        self._closing = True
+        for process, jobs in self._workers.values():
+            if process.is_alive():
+                jobs.put(None)
+        for process, _ in self._workers.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
@@ -0,0 +1,178 @@
+"""
+Token-budgeted prompt for the revenue analysis.
+
+The prompt is assembled from small text blocks: a header, summary statistics
+(totals, month-over-month growth, top categories), one line per month and the
+questions. All candidate blocks are tokenized in a single batched call, then
+months are added newest first while they fit the budget; older months are
+folded into one line per year, so the prompt stays within the model's context
+window however long the history gets.
+"""
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+HEADER = "You are a business analyst providing detailed revenue analysis and recommendations.\n\n"
+
+QUESTIONS = """
+Based on this data, please provide:
+1. Key Observations: main trends, seasonal patterns, strong and weak categories.
+2. Price Recommendations: which prices to adjust and the pricing strategy.
+3. Product Focus: products to prioritize and new product opportunities.
+4. Growth Strategies: the best opportunities to increase revenue.
+5. Potential Issues: revenue risks and how to mitigate them.
+"""
+
+# Tokens kept free for differences between per-block and whole-prompt tokenization
+SAFETY_MARGIN = 8
+
+
+def _money(amount: float) -> str:
+    return f"${amount:,.2f}"
+
+
+def _growth(current: float, previous: Optional[float]) -> str:
+    if not previous:
+        return "n/a"
+    return f"{(current - previous) / previous * 100:+.1f}%"
+
+
+def _top_categories(categories: Dict[str, float], top_k: int) -> List[tuple]:
+    return sorted(categories.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+
+def summary_block(monthly_data: Dict[str, Dict[str, Any]], top_k: int = 5) -> str:
+    """Totals, average, latest month-over-month growth and top categories overall"""
+    months = sorted(monthly_data)
+    totals = [monthly_data[month]['total'] for month in months]
+    total = sum(totals)
+    transactions = sum(monthly_data[month]['count'] for month in months)
+
+    categories = defaultdict(float)
+    for month in months:
+        for category, amount in monthly_data[month]['categories'].items():
+            categories[category] += amount
+
+    lines = [
+        "Summary:",
+        f"  Period: {months[0]} to {months[-1]} ({len(months)} months)",
+        f"  Total Revenue: {_money(total)} from {transactions} transactions",
+        f"  Average Monthly Revenue: {_money(total / len(months))}",
+    ]
+    if len(totals) > 1:
+        lines.append(f"  Latest Month-over-Month Growth: {_growth(totals[-1], totals[-2])}")
+        best = max(months, key=lambda month: monthly_data[month]['total'])
+        worst = min(months, key=lambda month: monthly_data[month]['total'])
+        lines.append(f"  Best Month: {best} ({_money(monthly_data[best]['total'])}), "
+                     f"Worst Month: {worst} ({_money(monthly_data[worst]['total'])})")
+    if categories:
+        lines.append("  Top Categories:")
+        for category, amount in _top_categories(categories, top_k):
+            lines.append(f"    {category}: {_money(amount)} ({amount / total * 100:.1f}% of revenue)"
+                         if total else f"    {category}: {_money(amount)}")
+    return '\n'.join(lines) + '\n'
+
+
+def month_line(month: str, data: Dict[str, Any], previous_total: Optional[float], top_k: int) -> str:
+    line = f"  {month}: {_money(data['total'])}, {data['count']} transactions, MoM {_growth(data['total'], previous_total)}"
+    top = _top_categories(data['categories'], top_k)
+    if top:
+        line += "; " + ", ".join(f"{category} {_money(amount)}" for category, amount in top)
+    return line + '\n'
+
+
+def year_line(year: str, months: List[str], monthly_data: Dict[str, Dict[str, Any]]) -> str:
+    total = sum(monthly_data[month]['total'] for month in months)
+    count = sum(monthly_data[month]['count'] for month in months)
+    return (f"  {year} ({months[0][5:]}-{months[-1][5:]}, {len(months)} months): "
+            f"{_money(total)}, {count} transactions\n")
+
+
+def _token_lengths(tokenizer, blocks: List[str]) -> List[int]:
+    if tokenizer is None:
+        # Rough estimate for when no tokenizer is available
+        return [len(block) // 4 + 1 for block in blocks]
+    encoded = tokenizer(blocks, add_special_tokens=False)['input_ids']
+    return [len(ids) for ids in encoded]
+
+
+def build_analysis_prompt(monthly_data: Dict[str, Dict[str, Any]], tokenizer=None,
+                          budget: Optional[int] = None, top_k: int = 5, highlights: str = "") -> str:
+    """
+    Build the analysis prompt for `monthly_data` in at most `budget` tokens.
+
+    The header, summary, `highlights` (precomputed findings, see
+    insights.highlights) and questions are always included. Recent months get a
+    line each (with MoM growth and their top categories) while they fit; the
+    months before that get one aggregate line per year, as many as fit.
+    """
+    if not monthly_data:
+        return HEADER + "Revenue Data Analysis:\n  No revenue recorded yet.\n" + QUESTIONS
+
+    months = sorted(monthly_data)
+    years = defaultdict(list)
+    for month in months:
+        years[month[:4]].append(month)
+
+    month_lines = {}
+    previous_total = None
+    for month in months:
+        month_lines[month] = month_line(month, monthly_data[month], previous_total, top_k)
+        previous_total = monthly_data[month]['total']
+    year_lines = {year: year_line(year, year_months, monthly_data) for year, year_months in years.items()}
+
+    fixed = [HEADER, summary_block(monthly_data, top_k) + highlights, "\nMonthly Breakdown:\n", QUESTIONS]
+    # Longest possible "omitted" note, reserved up front
+    widest_note = f"  ({len(years)} earlier year(s) omitted)\n"
+    # One tokenizer call for every block the prompt could contain
+    blocks = fixed + [widest_note] + list(month_lines.values()) + list(year_lines.values())
+    lengths = dict(zip(blocks, _token_lengths(tokenizer, blocks))) if budget is not None else {}
+
+    remaining = None
+    if budget is not None:
+        remaining = budget - SAFETY_MARGIN - lengths[widest_note] - sum(lengths[block] for block in fixed)
+
+    def fits(block_lengths: int) -> bool:
+        return remaining is None or block_lengths <= remaining
+
+    # Cost of the aggregate lines of every year before a given one
+    year_costs = {year: lengths.get(year_lines[year], 0) for year in years}
+    older_cost = {}
+    running = 0
+    for year in sorted(years):
+        older_cost[year] = running
+        running += year_costs[year]
+
+    # Newest months first, one line each while they fit next to the aggregate
+    # lines that the older months would still need ...
+    selected = []
+    index = len(months)
+    while index > 0:
+        month = months[index - 1]
+        year = month[:4]
+        cost = lengths.get(month_lines[month], 0)
+        reserved = older_cost[year] + (year_costs[year] if month != years[year][0] else 0)
+        if not fits(cost + reserved):
+            break
+        index -= 1
+        if remaining is not None:
+            remaining -= cost
+        selected.append(month_lines[month])
+
+    # ... then one aggregate line per older year while those fit. A partly
+    # listed year is costed as its full-year line, which has the same shape.
+    older_years = defaultdict(list)
+    for month in months[:index]:
+        older_years[month[:4]].append(month)
+    aggregated = []
+    for year in sorted(older_years, reverse=True):
+        cost = lengths.get(year_lines[year], 0)
+        if not fits(cost):
+            break
+        aggregated.append(year_line(year, older_years[year], monthly_data))
+        if remaining is not None:
+            remaining -= cost
+
+    omitted = len(older_years) - len(aggregated)
+    note = f"  ({omitted} earlier year(s) omitted)\n" if omitted else ""
+    return (fixed[0] + fixed[1] + fixed[2] + note + ''.join(reversed(aggregated))
+            + ''.join(reversed(selected)) + fixed[3])
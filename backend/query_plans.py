@@ -0,0 +1,90 @@
+import re
+from typing import List, NamedTuple, Optional, Set
+
+SUPPORTED_DIALECTS = ('sqlite', 'postgresql')
+
+
+class PlanCheck(NamedTuple):
+    """Outcome of check_plan: status is 'OK', 'FAIL' or 'UNSUPPORTED'"""
+    status: str
+    message: str
+    plan: List[str]
+
+
+def explain(connection, statement) -> Optional[List[str]]:
+    """
+    Return the query plan lines for a SQLAlchemy statement, or None if the
+    dialect has no supported EXPLAIN.
+
+    Uses EXPLAIN QUERY PLAN on SQLite and EXPLAIN on PostgreSQL. On PostgreSQL
+    sequential scans are disabled for the transaction, so the plan shows whether
+    an index *can* serve the query even on a table too small for the planner
+    to prefer it.
+    """
+    dialect = connection.dialect
+    if dialect.name not in SUPPORTED_DIALECTS:
+        return None
+
+    compiled = statement.compile(dialect=dialect)
+    params = compiled.params
+    # Plain strings work for every column type the revenue queries bind
+    params = {key: value.isoformat() if hasattr(value, 'isoformat') else value
+              for key, value in params.items()}
+    if compiled.positional:
+        params = tuple(params[key] for key in compiled.positiontup)
+
+    if dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params)
+        return [row[-1] for row in rows]
+
+    connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+    rows = connection.exec_driver_sql(f"EXPLAIN {compiled}", params)
+    return [row[0] for row in rows]
+
+
+def indexes_used(plan: List[str]) -> Set[str]:
+    """Names of the indexes referenced by a SQLite or PostgreSQL plan"""
+    used = set()
+    for line in plan:
+        # SQLite: "SEARCH revenue USING INDEX ix_x (...)", "SCAN revenue USING COVERING INDEX ix_x"
+        # PostgreSQL: "Index Scan using ix_x on revenue", "Bitmap Index Scan on ix_x"
+        for match in re.finditer(r'(?:USING (?:COVERING )?INDEX|Index (?:Only )?Scan(?: Backward)? using|Bitmap Index Scan on) (\w+)', line):
+            used.add(match.group(1))
+    return used
+
+
+def index_searched(plan: List[str], index: str) -> bool:
+    """
+    True if the plan seeks into `index` with a condition rather than walking
+    all of it: SEARCH ... USING INDEX on SQLite, an index node followed by an
+    Index Cond on PostgreSQL.
+    """
+    for position, line in enumerate(plan):
+        if re.search(rf'\bSEARCH \w+ USING (?:COVERING )?INDEX {index} \(', line):
+            return True
+        if re.search(rf'(?:Index (?:Only )?Scan(?: Backward)? using|Bitmap Index Scan on) {index}\b', line):
+            # The node's own details are the more indented lines right below it
+            indent = len(line) - len(line.lstrip())
+            for detail in plan[position + 1:]:
+                if len(detail) - len(detail.lstrip()) <= indent:
+                    break
+                if 'Index Cond:' in detail:
+                    return True
+    return False
+
+
+def check_plan(connection, statement, index: str, search: bool = True) -> PlanCheck:
+    """
+    EXPLAIN `statement` and check that it uses `index`; with `search`, that it
+    seeks into the index instead of scanning all of it.
+    """
+    plan = explain(connection, statement)
+    if plan is None:
+        return PlanCheck('UNSUPPORTED', f"EXPLAIN is not supported on {connection.dialect.name}", [])
+    if search:
+        ok = index_searched(plan, index)
+        expected = f"a search of {index}"
+    else:
+        ok = index in indexes_used(plan)
+        expected = index
+    return PlanCheck('OK' if ok else 'FAIL', f"expected {expected}", plan)
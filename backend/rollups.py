@@ -0,0 +1,485 @@
+"""
+Precomputed aggregates read by the dashboard.
+
+Monthly revenue rollup (the `revenue_summary` table): subscription revenue is
+the sum of `payments.amount` and product revenue the sum of `products.price`
+over `product_sales`, both bucketed by 'YYYY-MM'. Row-level triggers on
+payments and product_sales apply the delta of every insert, update and delete
+to the matching month in the same transaction, so reads are O(months) and no
+full recompute is needed. Sales are valued at their product's current price,
+so triggers on products re-apply a price change to every month the product
+sold in. rebuild_revenue_summary() backfills the table from scratch (e.g.
+after installing the triggers on an existing database).
+
+Per-country revenue and customer counts (the `country_revenue` table): triggers
+on payments and customers apply every insert, update and delete (including a
+customer moving country) to the affected countries in the same transaction. The
+table is filled by a full refresh on the first read; `rollup_state` records when
+that happened. Where the triggers can't be installed, reads refresh it in full
+once it is older than a maximum age instead.
+"""
+import logging
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import DateTime, Integer, bindparam, inspect, text
+
+logger = logging.getLogger(__name__)
+
+SOURCE_TABLES = ('payments', 'product_sales', 'products')
+
+
+def month_expression(dialect_name: str, column: str) -> str:
+    """SQL expression formatting a date column as 'YYYY-MM'"""
+    if dialect_name == 'postgresql':
+        return f"to_char({column}, 'YYYY-MM')"
+    return f"strftime('%Y-%m', {column})"
+
+
+def _sqlite_upsert(month: str, subscription: str, product: str, condition: str, source: str = '') -> str:
+    # INSERT ... SELECT needs a WHERE clause before ON CONFLICT in SQLite
+    return f"""
+        INSERT INTO revenue_summary (month, subscription_revenue, product_revenue, total_revenue)
+        SELECT {month}, {subscription}, {product}, {subscription} + {product}
+        {source}
+        WHERE {condition}
+        ON CONFLICT (month) DO UPDATE SET
+            subscription_revenue = subscription_revenue + excluded.subscription_revenue,
+            product_revenue = product_revenue + excluded.product_revenue,
+            total_revenue = total_revenue + excluded.total_revenue;"""
+
+
+def _sqlite_triggers():
+    def payment(row, sign):
+        return _sqlite_upsert(month_expression('sqlite', f'{row}.payment_date'),
+                              f'{sign}COALESCE({row}.amount, 0)', '0',
+                              f'{row}.payment_date IS NOT NULL')
+
+    def sale(row, sign):
+        price = f"COALESCE((SELECT price FROM products WHERE id = {row}.product_id), 0)"
+        return _sqlite_upsert(month_expression('sqlite', f'{row}.sale_date'),
+                              '0', f'{sign}{price}',
+                              f'{row}.sale_date IS NOT NULL')
+
+    def product(row, sign):
+        # The product's price times its sales, per month of sale
+        sales = f"""FROM (
+            SELECT {month_expression('sqlite', 'sale_date')} AS month,
+                   COUNT(*) * COALESCE({row}.price, 0) AS revenue
+            FROM product_sales
+            WHERE product_id = {row}.id AND sale_date IS NOT NULL
+            GROUP BY 1
+        ) AS sales"""
+        return _sqlite_upsert('sales.month', '0', f'{sign}sales.revenue', '1', source=sales)
+
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS payments_revenue_summary_insert
+            AFTER INSERT ON payments
+            BEGIN {payment('NEW', '')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS payments_revenue_summary_delete
+            AFTER DELETE ON payments
+            BEGIN {payment('OLD', '-')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS payments_revenue_summary_update
+            AFTER UPDATE OF amount, payment_date ON payments
+            BEGIN {payment('OLD', '-')} {payment('NEW', '')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS product_sales_revenue_summary_insert
+            AFTER INSERT ON product_sales
+            BEGIN {sale('NEW', '')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS product_sales_revenue_summary_delete
+            AFTER DELETE ON product_sales
+            BEGIN {sale('OLD', '-')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS product_sales_revenue_summary_update
+            AFTER UPDATE OF product_id, sale_date ON product_sales
+            BEGIN {sale('OLD', '-')} {sale('NEW', '')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS products_revenue_summary_insert
+            AFTER INSERT ON products
+            BEGIN {product('NEW', '')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS products_revenue_summary_delete
+            AFTER DELETE ON products
+            BEGIN {product('OLD', '-')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS products_revenue_summary_update
+            AFTER UPDATE OF id, price ON products
+            BEGIN {product('OLD', '-')} {product('NEW', '')} END""",
+    ]
+
+
+POSTGRES_TRIGGERS = [
+    """CREATE OR REPLACE FUNCTION revenue_summary_apply(p_month text, p_subscription numeric, p_product numeric)
+    RETURNS void AS $$
+    BEGIN
+        INSERT INTO revenue_summary (month, subscription_revenue, product_revenue, total_revenue)
+        VALUES (p_month, p_subscription, p_product, p_subscription + p_product)
+        ON CONFLICT (month) DO UPDATE SET
+            subscription_revenue = revenue_summary.subscription_revenue + EXCLUDED.subscription_revenue,
+            product_revenue = revenue_summary.product_revenue + EXCLUDED.product_revenue,
+            total_revenue = revenue_summary.total_revenue + EXCLUDED.total_revenue;
+    END;
+    $$ LANGUAGE plpgsql""",
+    """CREATE OR REPLACE FUNCTION payments_revenue_summary() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            IF OLD.payment_date IS NOT NULL THEN
+                PERFORM revenue_summary_apply(to_char(OLD.payment_date, 'YYYY-MM'), -COALESCE(OLD.amount, 0), 0);
+            END IF;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            IF NEW.payment_date IS NOT NULL THEN
+                PERFORM revenue_summary_apply(to_char(NEW.payment_date, 'YYYY-MM'), COALESCE(NEW.amount, 0), 0);
+            END IF;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql""",
+    """CREATE OR REPLACE FUNCTION product_sales_revenue_summary() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            IF OLD.sale_date IS NOT NULL THEN
+                PERFORM revenue_summary_apply(to_char(OLD.sale_date, 'YYYY-MM'), 0,
+                    -COALESCE((SELECT price FROM products WHERE id = OLD.product_id), 0));
+            END IF;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            IF NEW.sale_date IS NOT NULL THEN
+                PERFORM revenue_summary_apply(to_char(NEW.sale_date, 'YYYY-MM'), 0,
+                    COALESCE((SELECT price FROM products WHERE id = NEW.product_id), 0));
+            END IF;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql""",
+    # Sales are valued at their product's current price, as in rebuild_revenue_summary(),
+    # so a price change is re-applied to every month the product sold in
+    """CREATE OR REPLACE FUNCTION products_revenue_summary() RETURNS trigger AS $$
+    DECLARE
+        sales record;
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            FOR sales IN
+                SELECT to_char(sale_date, 'YYYY-MM') AS month, COUNT(*) AS count
+                FROM product_sales WHERE product_id = OLD.id AND sale_date IS NOT NULL GROUP BY 1
+            LOOP
+                PERFORM revenue_summary_apply(sales.month, 0, -COALESCE(OLD.price, 0) * sales.count);
+            END LOOP;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            FOR sales IN
+                SELECT to_char(sale_date, 'YYYY-MM') AS month, COUNT(*) AS count
+                FROM product_sales WHERE product_id = NEW.id AND sale_date IS NOT NULL GROUP BY 1
+            LOOP
+                PERFORM revenue_summary_apply(sales.month, 0, COALESCE(NEW.price, 0) * sales.count);
+            END LOOP;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql""",
+    """DROP TRIGGER IF EXISTS payments_revenue_summary ON payments""",
+    """CREATE TRIGGER payments_revenue_summary AFTER INSERT OR UPDATE OR DELETE ON payments
+    FOR EACH ROW EXECUTE FUNCTION payments_revenue_summary()""",
+    """DROP TRIGGER IF EXISTS product_sales_revenue_summary ON product_sales""",
+    """CREATE TRIGGER product_sales_revenue_summary AFTER INSERT OR UPDATE OR DELETE ON product_sales
+    FOR EACH ROW EXECUTE FUNCTION product_sales_revenue_summary()""",
+    """DROP TRIGGER IF EXISTS products_revenue_summary ON products""",
+    """CREATE TRIGGER products_revenue_summary AFTER INSERT OR DELETE OR UPDATE OF id, price ON products
+    FOR EACH ROW EXECUTE FUNCTION products_revenue_summary()""",
+]
+
+
+def triggers_installed(connection) -> bool:
+    """True if the rollup triggers already exist in the database"""
+    dialect_name = connection.dialect.name
+    if dialect_name == 'sqlite':
+        sql = "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%revenue_summary%'"
+        return connection.exec_driver_sql(sql).scalar() == len(_sqlite_triggers())
+    if dialect_name == 'postgresql':
+        sql = ("SELECT COUNT(*) FROM pg_trigger WHERE tgname IN "
+               "('payments_revenue_summary', 'product_sales_revenue_summary', 'products_revenue_summary')")
+        return connection.exec_driver_sql(sql).scalar() == 3
+    return False
+
+
+def install_revenue_summary_triggers(connection) -> bool:
+    """
+    Create the triggers that keep revenue_summary up to date.
+
+    Does nothing (and returns False) when the payments/product_sales/products
+    tables don't exist in this database or the dialect isn't supported.
+    """
+    inspector = inspect(connection)
+    missing = [table for table in SOURCE_TABLES if not inspector.has_table(table)]
+    if missing:
+        logger.info(f"Skipping revenue_summary triggers, missing tables: {', '.join(missing)}")
+        return False
+
+    dialect_name = connection.dialect.name
+    if dialect_name == 'sqlite':
+        statements = _sqlite_triggers()
+    elif dialect_name == 'postgresql':
+        statements = POSTGRES_TRIGGERS
+    else:
+        logger.warning(f"revenue_summary triggers are not supported on {dialect_name}")
+        return False
+
+    if triggers_installed(connection):
+        return True
+
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+    logger.info("Installed revenue_summary triggers")
+    return True
+
+
+def rebuild_revenue_summary(connection):
+    """Recompute revenue_summary from payments and product_sales (backfill)"""
+    dialect_name = connection.dialect.name
+    payment_month = month_expression(dialect_name, 'p.payment_date')
+    sale_month = month_expression(dialect_name, 'ps.sale_date')
+
+    connection.exec_driver_sql("DELETE FROM revenue_summary")
+    connection.exec_driver_sql(f"""
+        INSERT INTO revenue_summary (month, subscription_revenue, product_revenue, total_revenue)
+        SELECT month,
+               SUM(subscription_revenue),
+               SUM(product_revenue),
+               SUM(subscription_revenue) + SUM(product_revenue)
+        FROM (
+            SELECT {payment_month} AS month,
+                   COALESCE(p.amount, 0) AS subscription_revenue,
+                   0 AS product_revenue
+            FROM payments p
+            WHERE p.payment_date IS NOT NULL
+            UNION ALL
+            SELECT {sale_month} AS month,
+                   0 AS subscription_revenue,
+                   COALESCE(pr.price, 0) AS product_revenue
+            FROM product_sales ps
+            LEFT JOIN products pr ON pr.id = ps.product_id
+            WHERE ps.sale_date IS NOT NULL
+        ) AS monthly
+        GROUP BY month
+    """)
+
+
+COUNTRY_SOURCE_TABLES = ('payments', 'customers')
+
+
+def _sqlite_country_upsert(country: str, revenue: str, customers: str, condition: str) -> str:
+    return f"""
+        INSERT INTO country_revenue (country, total_revenue, customer_count)
+        SELECT {country}, {revenue}, {customers}
+        WHERE {condition}
+        ON CONFLICT (country) DO UPDATE SET
+            total_revenue = total_revenue + excluded.total_revenue,
+            customer_count = customer_count + excluded.customer_count;"""
+
+
+def _sqlite_country_triggers():
+    # Payments count towards their customer's country, and not at all without a customer
+    def payment(row, sign):
+        return _sqlite_country_upsert(
+            f"COALESCE((SELECT country FROM customers WHERE id = {row}.customer_id), '')",
+            f'{sign}COALESCE({row}.amount, 0)', '0',
+            f'EXISTS (SELECT 1 FROM customers WHERE id = {row}.customer_id)')
+
+    # A customer brings their payments along when they are added, removed or move country
+    def customer(row, sign):
+        return _sqlite_country_upsert(
+            f"COALESCE({row}.country, '')",
+            f'{sign}COALESCE((SELECT SUM(amount) FROM payments WHERE customer_id = {row}.id), 0)',
+            f'{sign}1', '1')
+
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS payments_country_revenue_insert
+            AFTER INSERT ON payments
+            BEGIN {payment('NEW', '')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS payments_country_revenue_delete
+            AFTER DELETE ON payments
+            BEGIN {payment('OLD', '-')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS payments_country_revenue_update
+            AFTER UPDATE OF amount, customer_id ON payments
+            BEGIN {payment('OLD', '-')} {payment('NEW', '')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS customers_country_revenue_insert
+            AFTER INSERT ON customers
+            BEGIN {customer('NEW', '')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS customers_country_revenue_delete
+            AFTER DELETE ON customers
+            BEGIN {customer('OLD', '-')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS customers_country_revenue_update
+            AFTER UPDATE OF id, country ON customers
+            BEGIN {customer('OLD', '-')} {customer('NEW', '')} END""",
+    ]
+
+
+POSTGRES_COUNTRY_TRIGGERS = [
+    """CREATE OR REPLACE FUNCTION country_revenue_apply(p_country text, p_revenue numeric, p_customers integer)
+    RETURNS void AS $$
+    BEGIN
+        INSERT INTO country_revenue (country, total_revenue, customer_count)
+        VALUES (p_country, p_revenue, p_customers)
+        ON CONFLICT (country) DO UPDATE SET
+            total_revenue = country_revenue.total_revenue + EXCLUDED.total_revenue,
+            customer_count = country_revenue.customer_count + EXCLUDED.customer_count;
+    END;
+    $$ LANGUAGE plpgsql""",
+    """CREATE OR REPLACE FUNCTION payments_country_revenue() RETURNS trigger AS $$
+    DECLARE
+        customer_country text;
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            SELECT COALESCE(country, '') INTO customer_country FROM customers WHERE id = OLD.customer_id;
+            IF FOUND THEN
+                PERFORM country_revenue_apply(customer_country, -COALESCE(OLD.amount, 0), 0);
+            END IF;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            SELECT COALESCE(country, '') INTO customer_country FROM customers WHERE id = NEW.customer_id;
+            IF FOUND THEN
+                PERFORM country_revenue_apply(customer_country, COALESCE(NEW.amount, 0), 0);
+            END IF;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql""",
+    """CREATE OR REPLACE FUNCTION customers_country_revenue() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM country_revenue_apply(COALESCE(OLD.country, ''),
+                -COALESCE((SELECT SUM(amount) FROM payments WHERE customer_id = OLD.id), 0), -1);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM country_revenue_apply(COALESCE(NEW.country, ''),
+                COALESCE((SELECT SUM(amount) FROM payments WHERE customer_id = NEW.id), 0), 1);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql""",
+    """DROP TRIGGER IF EXISTS payments_country_revenue ON payments""",
+    """CREATE TRIGGER payments_country_revenue AFTER INSERT OR DELETE OR UPDATE OF amount, customer_id ON payments
+    FOR EACH ROW EXECUTE FUNCTION payments_country_revenue()""",
+    """DROP TRIGGER IF EXISTS customers_country_revenue ON customers""",
+    """CREATE TRIGGER customers_country_revenue AFTER INSERT OR DELETE OR UPDATE OF id, country ON customers
+    FOR EACH ROW EXECUTE FUNCTION customers_country_revenue()""",
+]
+
+
+def country_triggers_installed(connection) -> bool:
+    """True if the country_revenue triggers already exist in the database"""
+    dialect_name = connection.dialect.name
+    if dialect_name == 'sqlite':
+        sql = "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%country_revenue%'"
+        return connection.exec_driver_sql(sql).scalar() == len(_sqlite_country_triggers())
+    if dialect_name == 'postgresql':
+        sql = "SELECT COUNT(*) FROM pg_trigger WHERE tgname IN ('payments_country_revenue', 'customers_country_revenue')"
+        return connection.exec_driver_sql(sql).scalar() == 2
+    return False
+
+
+def install_country_revenue_triggers(connection) -> bool:
+    """
+    Create the triggers that keep country_revenue up to date.
+
+    Returns False when the payments/customers tables don't exist or the dialect
+    isn't supported; country_revenue is then refreshed in full on read instead.
+    """
+    inspector = inspect(connection)
+    missing = [table for table in COUNTRY_SOURCE_TABLES if not inspector.has_table(table)]
+    if missing:
+        logger.info(f"Skipping country_revenue triggers, missing tables: {', '.join(missing)}")
+        return False
+
+    dialect_name = connection.dialect.name
+    if dialect_name == 'sqlite':
+        statements = _sqlite_country_triggers()
+    elif dialect_name == 'postgresql':
+        statements = POSTGRES_COUNTRY_TRIGGERS
+    else:
+        logger.warning(f"country_revenue triggers are not supported on {dialect_name}")
+        return False
+
+    if country_triggers_installed(connection):
+        return True
+
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+    logger.info("Installed country_revenue triggers")
+    return True
+
+
+COUNTRY_REVENUE_STATE = 'country_revenue'
+
+COUNTRY_REVENUE_STATE_SQL = text("""
+    SELECT last_payment_id, last_customer_id, refreshed_at
+    FROM rollup_state
+    WHERE name = :name
+""").columns(last_payment_id=Integer, last_customer_id=Integer, refreshed_at=DateTime)
+
+HIGH_WATER_MARKS_SQL = text("""
+    SELECT
+        (SELECT COALESCE(MAX(id), 0) FROM payments),
+        (SELECT COALESCE(MAX(id), 0) FROM customers)
+""")
+
+# Customers with no country are stored under '' because country is the key
+COUNTRY_REVENUE_FULL_SQL = text("""
+    INSERT INTO country_revenue (country, total_revenue, customer_count)
+    SELECT
+        COALESCE(c.country, ''),
+        COALESCE(SUM(p.amount), 0),
+        COUNT(DISTINCT c.id)
+    FROM customers c
+    LEFT JOIN payments p ON c.id = p.customer_id
+    GROUP BY COALESCE(c.country, '')
+""")
+
+RESET_STATE_SQL = text("""
+    INSERT INTO rollup_state (name, last_payment_id, last_customer_id, refreshed_at)
+    VALUES (:name, :max_payment_id, :max_customer_id, :now)
+""").bindparams(bindparam('now', type_=DateTime))
+
+
+def country_revenue_state(connection):
+    """The (last_payment_id, last_customer_id, refreshed_at) row, or None if never refreshed"""
+    return connection.execute(COUNTRY_REVENUE_STATE_SQL, {'name': COUNTRY_REVENUE_STATE}).first()
+
+
+def _is_fresh(state, max_age: float) -> bool:
+    return state is not None and (datetime.utcnow() - state.refreshed_at).total_seconds() <= max_age
+
+
+def refresh_country_revenue(connection, max_age: Optional[float] = None) -> bool:
+    """
+    Recompute country_revenue from customers and payments; returns whether it did.
+
+    With `max_age`, a refresh made less than `max_age` seconds ago (e.g. by
+    another worker while this one waited for the lock) is kept instead.
+    """
+    if connection.dialect.name == 'postgresql':
+        # Hold back the triggers' deltas until the recomputed rows are committed,
+        # and let only one refresh run at a time
+        connection.exec_driver_sql("LOCK TABLE country_revenue IN EXCLUSIVE MODE")
+    if max_age is not None and _is_fresh(country_revenue_state(connection), max_age):
+        return False
+
+    max_payment_id, max_customer_id = connection.execute(HIGH_WATER_MARKS_SQL).one()
+    connection.execute(text("DELETE FROM rollup_state WHERE name = :name"), {'name': COUNTRY_REVENUE_STATE})
+    connection.execute(text("DELETE FROM country_revenue"))
+    connection.execute(COUNTRY_REVENUE_FULL_SQL)
+    connection.execute(RESET_STATE_SQL, {
+        'name': COUNTRY_REVENUE_STATE,
+        'max_payment_id': max_payment_id,
+        'max_customer_id': max_customer_id,
+        'now': datetime.utcnow()
+    })
+    return True
+
+
+def refresh_country_revenue_if_stale(connection, max_age: float, maintained: bool) -> bool:
+    """
+    Refresh country_revenue before a read if it needs it: always the first
+    time, and when it is older than `max_age` seconds unless the triggers
+    maintain it (`maintained`). Returns whether it refreshed.
+    """
+    state = country_revenue_state(connection)
+    if state is not None and (maintained or _is_fresh(state, max_age)):
+        return False
+    # Re-checked under the lock: another worker may have refreshed it meanwhile
+    return refresh_country_revenue(connection, max_age=float('inf') if maintained else max_age)
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+# The backend modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    """The app on a fresh SQLite database, created the way a new install creates it"""
+    import app as app_module
+
+    class TestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'test.db'}"
+
+    flask_app = app_module.create_app(TestConfig, preload_model=False)
+    yield flask_app
+    with flask_app.app_context():
+        app_module.db.engine.dispose()
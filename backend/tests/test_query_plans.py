@@ -0,0 +1,74 @@
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import and_, insert, or_
+
+from app import REVENUE_COLUMNS, Revenue, db, revenue_list_query, revenue_plan_checks
+from query_plans import check_plan, index_searched
+
+CATEGORIES = ['Subscriptions', 'Services', 'Products', 'Consulting']
+
+
+@pytest.fixture
+def seeded(app):
+    """The app with a few thousand revenue rows and no ANALYZE statistics"""
+    rows = [{
+        'date': date(2022, 1, 1) + timedelta(days=i % 900),
+        'amount': float(i % 500),
+        'category': CATEGORIES[i % len(CATEGORIES)],
+        'description': None,
+    } for i in range(5000)]
+    with app.app_context():
+        db.session.execute(insert(Revenue), rows)
+        db.session.commit()
+        yield app
+
+
+def test_revenue_queries_search_their_index(seeded):
+    with db.engine.connect() as connection:
+        for name, statement, index, search in revenue_plan_checks():
+            with connection.begin():
+                result = check_plan(connection, statement, index, search)
+            assert result.status == 'OK', f"{name}: {result.message}\n" + '\n'.join(result.plan)
+
+
+def test_or_only_keyset_filter_is_reported(seeded):
+    # The form the keyset filter had before its leading date bound: a full index walk
+    cursor_date, cursor_id = date(2023, 1, 1), 1000
+    statement = revenue_list_query(list(REVENUE_COLUMNS), [or_(
+        Revenue.date < cursor_date,
+        and_(Revenue.date == cursor_date, Revenue.id < cursor_id)
+    )]).limit(500)
+    with db.engine.connect() as connection:
+        result = check_plan(connection, statement, 'ix_revenue_date_id')
+    assert result.status == 'FAIL', '\n'.join(result.plan)
+
+
+def test_check_query_plans_command(seeded):
+    result = seeded.test_cli_runner().invoke(args=['check-query-plans'])
+    assert result.exit_code == 0, result.output
+    assert '[FAIL]' not in result.output
+
+
+def test_postgres_index_condition_counts_as_search():
+    searched = [
+        'Limit  (cost=0.29..40.12 rows=500 width=48)',
+        '  ->  Index Scan Backward using ix_revenue_date_id on revenue  (cost=0.29..80.00 rows=1000 width=48)',
+        "        Index Cond: (date <= '2024-01-01'::date)",
+        "        Filter: ((date < '2024-01-01'::date) OR (id < 1000))",
+    ]
+    walked = [
+        'Limit  (cost=0.29..40.12 rows=500 width=48)',
+        '  ->  Index Scan Backward using ix_revenue_date_id on revenue  (cost=0.29..800.00 rows=10000 width=48)',
+        "        Filter: ((date < '2024-01-01'::date) OR ((date = '2024-01-01'::date) AND (id < 1000)))",
+    ]
+    assert index_searched(searched, 'ix_revenue_date_id')
+    assert not index_searched(walked, 'ix_revenue_date_id')
+
+
+def test_unsupported_dialect_is_a_result():
+    connection = SimpleNamespace(dialect=SimpleNamespace(name='mysql'))
+    result = check_plan(connection, None, 'ix_revenue_date_id')
+    assert result.status == 'UNSUPPORTED'
+    assert 'mysql' in result.message
@@ -0,0 +1,12 @@
+"""
+WSGI entry point for production servers, e.g.
+
+    gunicorn -c gunicorn.conf.py
+
+The model is not loaded here: with a pre-fork server this module is imported
+by the master, and each worker starts loading its own copy after the fork
+(gunicorn.conf.py). Other servers load it on the first AI request.
+"""
+from app import create_app
+
+app = create_app(preload_model=False)
@@ -35,29 +35,16 @@ const Dashboard = () => {
         setLoading(true);
         setError(null);
         
-        // Fetch all data in parallel
-        const [
-          revenueRes, 
-          countryRes, 
-          transactionsRes, 
-          plansRes
-        ] = await Promise.all([
-          fetch('http://localhost:5000/api/dashboard/revenue-summary')
-            .then(res => res.ok ? res.json() : { months: [] })
-            .catch(() => ({ months: [] })),
-            
-          fetch('http://localhost:5000/api/dashboard/revenue-by-country')
-            .then(res => res.ok ? res.json() : { countries: [] })
-            .catch(() => ({ countries: [] })),
-            
-          fetch('http://localhost:5000/api/dashboard/recent-transactions')
-            .then(res => res.ok ? res.json() : [])
-            .catch(() => []),
-            
-          fetch('http://localhost:5000/api/dashboard/plan-distribution')
-            .then(res => res.ok ? res.json() : { plans: [] })
-            .catch(() => ({ plans: [] }))
-        ]);
+        // Fetch all dashboard data in one request; the backend runs the
+        // queries in parallel and reports failed sections as null
+        const data = await fetch('http://localhost:5000/api/dashboard/all')
+          .then(res => res.ok ? res.json() : {})
+          .catch(() => ({}));
+
+        const revenueRes = data.revenue_summary || { months: [] };
+        const countryRes = data.revenue_by_country || { countries: [] };
+        const transactionsRes = data.recent_transactions || [];
+        const plansRes = data.plan_distribution || { plans: [] };
 
         setDashboardData({
           revenueSummary: {